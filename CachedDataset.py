@@ -1,23 +1,45 @@
 
 from __future__ import print_function
 import gc
+import os
 import sys
 import time
+import typing
 import numpy
 import functools
 import threading
 from Dataset import Dataset
 from Log import log
+from SeqTagIndex import SeqTagIndex
+import Util
 from Util import NumbersDict
 
 
 class CachedDataset(Dataset):
 
-  def __init__(self, cache_byte_size=0, **kwargs):
+  def __init__(self, cache_byte_size=0, cache_dtype=None, shared_mem_cache=False, **kwargs):
     """
     :param int cache_byte_size:
+    :param str|None cache_dtype: storage of the input data in the cache (only used if the cache is enabled).
+      None: as-is. "float16": half precision. "int8": affine quantization per seq and per dimension.
+      The data is converted back to the original dtype in :func:`get_input_data`.
+      This allows to fit more of the data into cache_byte_size.
+    :param bool|str shared_mem_cache: if set, the first process on this host loads all the data into the cache
+      and provides it in shared memory (:class:`TaskSystem.SharedMem`),
+      and all other processes on this host (e.g. the other Horovod ranks) with the same data map it read-only.
+      The cache must be big enough for all the data.
+      If this is a str, it is used as the key for the data, otherwise the key is derived from the data.
+      See :func:`_init_shared_mem_cache`.
     """
     super(CachedDataset, self).__init__(**kwargs)
+    assert cache_dtype in (None, "float16", "int8"), "%s: invalid cache_dtype %r" % (self, cache_dtype)
+    self.cache_dtype = cache_dtype
+    # For cache_dtype int8: seq_index idx -> per dim scale and offset (min value) of the quantization.
+    self._cache_int8_scale = None  # type: typing.Optional[numpy.ndarray]
+    self._cache_int8_offset = None  # type: typing.Optional[numpy.ndarray]
+    self.shared_mem_cache = shared_mem_cache
+    self._shared_mem = None  # type: typing.Optional[TaskSystem.SharedMem]
+    self._shared_mem_lock_file = None  # type: typing.Optional[typing.IO]  # kept open while we provide the data
     self.cache_byte_size_total_limit = cache_byte_size
     if cache_byte_size == -1:
       self.cache_byte_size_limit_at_start = 1024 ** 4
@@ -41,10 +63,18 @@ class CachedDataset(Dataset):
     self._index_map = range(len(self._seq_index))  # sorted seq idx -> seq_index idx
     self._seq_lengths = numpy.zeros((0, 0))  # real seq idx -> tuple of len of data and all targets
     self._tags = []; """ :type: list[str|bytes] """  # uses real seq idx. access via _get_tag_by_real_idx
-    self._tag_idx = {}; ":type: dict[str,int] "  # map of tag -> real-seq-idx. call _update_tag_idx
+    self._tag_idx = None  # type: typing.Optional[SeqTagIndex]  # map of tag -> real-seq-idx. call _update_tag_idx
     self.targets = {}
     self.target_keys = []
 
+  def _base_init(self):
+    super(CachedDataset, self)._base_init()
+    if self.nbytes and self.cache_dtype:
+      # Like in Dataset._base_init, but with the itemsize of the cache.
+      self.nbytes = (
+        numpy.dtype(self.cache_dtype).itemsize * self.num_inputs * self.window +
+        numpy.array([], dtype=numpy.float32).itemsize * 2)
+
   def initialize(self):
     super(CachedDataset, self).initialize()
 
@@ -70,7 +100,7 @@ class CachedDataset(Dataset):
     super(CachedDataset, self).init_seq_order(epoch=epoch, seq_list=seq_list)
     if seq_list is not None:
       self._update_tag_idx()
-      seq_index = [self._tag_idx[tag] for tag in seq_list]
+      seq_index = [self._tag_idx.get_index(tag) for tag in seq_list]
     else:
       seq_index = self.get_seq_order_for_epoch(epoch, self._num_seqs, lambda s: self._seq_lengths[s][0])
 
@@ -84,7 +114,10 @@ class CachedDataset(Dataset):
       # Give some hint to the user in case he is wondering why the cache is reloading.
       print("Reinitialize dataset seq order for epoch %i." % epoch, file=log.v4)
 
-    if self.num_seqs_cached_at_start != len(seq_index) or not self.start_cache_initialized:
+    if self.shared_mem_cache and not self.start_cache_initialized:
+      self._init_shared_mem_cache(seq_index)
+      self.start_cache_initialized = True
+    elif self.num_seqs_cached_at_start != len(seq_index) or not self.start_cache_initialized:
       self._seq_index = seq_index
       self._seq_index_inv = dict(zip(seq_index, range(len(seq_index))))  # hdf seq idx -> seq_index idx
       self._init_seq_starts()
@@ -101,10 +134,9 @@ class CachedDataset(Dataset):
     return self._tags[real_idx]
 
   def _update_tag_idx(self):
-    if self._tag_idx:
+    if self._tag_idx is not None:
       return
-    for i in range(self._num_seqs):
-      self._tag_idx[self._get_tag_by_real_idx(i)] = i
+    self._tag_idx = SeqTagIndex.from_tags([self._get_tag_by_real_idx(i) for i in range(self._num_seqs)])
 
   def batch_set_generator_cache_whole_epoch(self):
     return True
@@ -116,9 +148,14 @@ class CachedDataset(Dataset):
     assert self.num_inputs > 0
     assert self.window > 0
     self.preload_set = set([])
+    if self.cache_dtype == "int8":
+      assert not self.shuffle_frames_of_nseqs, "%s: cache_dtype int8 does not support frame shuffling" % self
+      quant_shape = [len(self._seq_index)] + self.get_data_shape("data")
+      self._cache_int8_scale = numpy.ones(quant_shape, dtype="float32")
+      self._cache_int8_offset = numpy.zeros(quant_shape, dtype="float32")
     self.alloc_intervals = \
-      [(0, 0, numpy.zeros([1] + self.get_data_shape("data"), dtype=self.get_data_dtype("data"))),
-       (self.num_seqs, self.num_seqs, numpy.zeros([1] + self.get_data_shape("data"), dtype=self.get_data_dtype("data")))]
+      [(0, 0, numpy.zeros([1] + self.get_data_shape("data"), dtype=self._get_cache_dtype())),
+       (self.num_seqs, self.num_seqs, numpy.zeros([1] + self.get_data_shape("data"), dtype=self._get_cache_dtype()))]
     # self.alloc_intervals[i] is (idx start, idx end, data), where
     # idx start/end is the sorted seq idx start/end, end exclusive,
     # and data is a numpy.array.
@@ -157,6 +194,210 @@ class CachedDataset(Dataset):
       else:
         threading.Thread(target=self._preload_seqs, args=(0, num_cached)).start()
 
+  def _get_shared_mem_cache_key_info(self):
+    """
+    :return: some info which identifies the data, used for the shared_mem_cache key, if not given explicitly
+    :rtype: list
+    """
+    return [
+      self.__class__.__name__, self._num_seqs, self.get_data_shape("data"), self.get_data_dtype("data"),
+      self.window, self.cache_dtype, sorted(self.target_keys),
+      [self._get_tag_by_real_idx(i) for i in sorted({0, self._num_seqs - 1}) if i >= 0]]
+
+  def _get_shared_mem_cache_filename_prefix(self):
+    """
+    :return: prefix for the lock file and the meta file of the shared_mem_cache, host-local
+    :rtype: str
+    """
+    import hashlib
+    import tempfile
+    if isinstance(self.shared_mem_cache, str):
+      key = "".join([c if c.isalnum() or c in "-_." else "_" for c in self.shared_mem_cache])
+    else:
+      md5 = hashlib.md5(repr(self._get_shared_mem_cache_key_info()).encode("utf8"))
+      md5.update(numpy.ascontiguousarray(self._seq_lengths).tobytes())
+      key = md5.hexdigest()
+    base_dir = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    return "%s/returnn_cache_%i_%s" % (base_dir, os.getuid(), key)
+
+  def _init_shared_mem_cache(self, seq_index):
+    """
+    Initializes the cache with all the data in shared memory.
+    The handshake is via a lock file: The process which gets the lock loads all the data into the cache,
+    copies it into a shared memory segment, and writes a meta file with the segment id and the layout.
+    It keeps the lock until it exits, and then removes the segment and the meta file.
+    All other processes wait for the meta file and map the segment read-only.
+    If the lock gets free before there is a meta file (the provider died), we become the provider.
+
+    :param list[int] seq_index: seq order of the current epoch. must cover all seqs
+    """
+    import fcntl
+    assert self.cache_byte_size_limit_at_start > 0, "%s: shared_mem_cache needs the cache enabled" % self
+    assert len(seq_index) == self._num_seqs, "%s: shared_mem_cache needs all seqs in the seq order" % self
+    fn_prefix = self._get_shared_mem_cache_filename_prefix()
+    meta_fn = fn_prefix + ".meta"
+    waiting = False
+    while True:
+      lock_file = open(fn_prefix + ".lock", "a")
+      try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+      except (IOError, OSError):  # some other process has the lock, i.e. provides the data
+        lock_file.close()
+      else:
+        self._shared_mem_lock_file = lock_file
+        break
+      meta = self._read_shared_mem_cache_meta(meta_fn)
+      if meta:
+        self._attach_shared_mem_cache(meta, seq_index=seq_index)
+        return
+      if not waiting:
+        print("%s: waiting for the shared mem cache from another process (%s)" % (self, meta_fn), file=log.v4)
+        waiting = True
+      time.sleep(1)
+    # We are the provider.
+    if os.path.exists(meta_fn):
+      os.remove(meta_fn)  # from some earlier process which died
+    self._seq_index = seq_index
+    self._seq_index_inv = dict(zip(seq_index, range(len(seq_index))))  # hdf seq idx -> seq_index idx
+    self._init_seq_starts()
+    self._init_alloc_intervals()
+    self._init_start_cache()
+    assert self.num_seqs_cached_at_start == self.num_seqs, (
+      "%s: shared_mem_cache needs a cache_byte_size for all the data (%i seqs), but only %i seqs fit" % (
+        self, self.num_seqs, self.num_seqs_cached_at_start))
+    self.is_cached(0, self.num_seqs, blocking=True)  # wait for the preload thread
+    self._provide_shared_mem_cache(meta_fn)
+
+  def _get_shared_mem_cache_arrays(self):
+    """
+    :return: the cached data. key -> array, where "data" is the (single) alloc interval
+    :rtype: dict[str,numpy.ndarray]
+    """
+    alloc_idx = self.alloc_interval_index(0)
+    assert alloc_idx >= 0 and self.alloc_intervals[alloc_idx][:2] == (0, self.num_seqs)
+    arrays = {"data": self.alloc_intervals[alloc_idx][2]}
+    if self.cache_dtype == "int8":
+      arrays["int8_scale"] = self._cache_int8_scale
+      arrays["int8_offset"] = self._cache_int8_offset
+    for key, value in self.targets.items():
+      if value is not None:
+        arrays["targets/%s" % key] = value
+    return arrays
+
+  def _set_shared_mem_cache_arrays(self, arrays):
+    """
+    :param dict[str,numpy.ndarray] arrays: like from :func:`_get_shared_mem_cache_arrays`
+    """
+    dummy = numpy.zeros([1] + self.get_data_shape("data"), dtype=self._get_cache_dtype())
+    self.alloc_intervals = [(0, 0, dummy), (0, self.num_seqs, arrays["data"]), (self.num_seqs, self.num_seqs, dummy)]
+    if self.cache_dtype == "int8":
+      self._cache_int8_scale = arrays["int8_scale"]
+      self._cache_int8_offset = arrays["int8_offset"]
+    for key, value in arrays.items():
+      if key.startswith("targets/"):
+        self.targets[key[len("targets/"):]] = value
+
+  @staticmethod
+  def _get_shared_mem_numpy_array(mem, offset, shape, dtype):
+    """
+    :param TaskSystem.SharedMem mem:
+    :param int offset: in bytes
+    :param tuple[int] shape:
+    :param str dtype:
+    :return: view into the shared memory
+    :rtype: numpy.ndarray
+    """
+    import ctypes
+    buf = (ctypes.c_char * mem.size).from_address(mem.ptr)
+    array = numpy.ndarray(shape=shape, dtype=dtype, buffer=buf, offset=offset)
+    if mem.readonly:
+      array.flags.writeable = False
+    return array
+
+  def _provide_shared_mem_cache(self, meta_fn):
+    """
+    Copies the cache into a new shared memory segment, and uses it from now on.
+
+    :param str meta_fn: where we write the layout for the other processes
+    """
+    import pickle
+    import atexit
+    from TaskSystem import SharedMem
+    arrays = self._get_shared_mem_cache_arrays()
+    layout = []  # list of (key, offset, shape, dtype)
+    size = 0
+    for key, value in sorted(arrays.items()):
+      layout.append((key, size, value.shape, str(value.dtype)))
+      size += (value.nbytes + 63) // 64 * 64  # keep alignment
+    self._shared_mem = SharedMem(size=max(size, 1))
+    shared_arrays = {}
+    for key, offset, shape, dtype in layout:
+      shared_arrays[key] = self._get_shared_mem_numpy_array(self._shared_mem, offset, shape, dtype)
+      shared_arrays[key][...] = arrays[key]
+    self._set_shared_mem_cache_arrays(shared_arrays)
+    meta = {
+      "pid": os.getpid(), "shmid": self._shared_mem.shmid, "size": self._shared_mem.size,
+      "layout": layout, "seq_index": list(self._seq_index)}
+    with open(meta_fn + ".tmp%i" % os.getpid(), "wb") as f:
+      pickle.dump(meta, f)
+    os.rename(meta_fn + ".tmp%i" % os.getpid(), meta_fn)
+    atexit.register(self._remove_shared_mem_cache, meta_fn)
+    print("%s: provides the shared mem cache, %s (%s)" % (self, Util.human_bytes_size(size), meta_fn), file=log.v4)
+
+  def _remove_shared_mem_cache(self, meta_fn):
+    """
+    Called at exit by the provider.
+
+    :param str meta_fn:
+    """
+    if os.path.exists(meta_fn):
+      os.remove(meta_fn)
+    if self._shared_mem:
+      self._shared_mem.remove()  # the other processes keep their mapping
+    if self._shared_mem_lock_file:
+      self._shared_mem_lock_file.close()
+      self._shared_mem_lock_file = None
+
+  @staticmethod
+  def _read_shared_mem_cache_meta(meta_fn):
+    """
+    :param str meta_fn:
+    :return: meta from :func:`_provide_shared_mem_cache`, or None if not (yet) available
+    :rtype: dict[str]|None
+    """
+    import pickle
+    if not os.path.exists(meta_fn):
+      return None
+    with open(meta_fn, "rb") as f:
+      meta = pickle.load(f)
+    try:
+      os.kill(meta["pid"], 0)
+    except OSError:  # the provider died
+      return None
+    return meta
+
+  def _attach_shared_mem_cache(self, meta, seq_index):
+    """
+    Maps the shared memory segment read-only and uses it for the cache.
+
+    :param dict[str] meta: from :func:`_read_shared_mem_cache_meta`
+    :param list[int] seq_index: seq order of the current epoch
+    """
+    from TaskSystem import SharedMem
+    self._shared_mem = SharedMem(size=meta["size"], shmid=meta["shmid"], readonly=True)
+    # The layout in the cache uses the seq order of the provider.
+    self._seq_index = meta["seq_index"]
+    self._seq_index_inv = dict(zip(self._seq_index, range(len(self._seq_index))))
+    self._init_seq_starts()
+    self._set_shared_mem_cache_arrays({
+      key: self._get_shared_mem_numpy_array(self._shared_mem, offset, shape, dtype)
+      for (key, offset, shape, dtype) in meta["layout"]})
+    self.preload_set = set(range(self.num_seqs))
+    self.preload_end = self.num_seqs_cached_at_start = self.num_seqs
+    self.cached_bytes_at_start = self.alloc_intervals[1][2].nbytes
+    self._index_map = [self._seq_index_inv[i] for i in seq_index]  # sorted seq idx -> seq_index idx
+    print("%s: uses the shared mem cache of pid %i" % (self, meta["pid"]), file=log.v4)
+
   def load_seqs(self, start, end):
     """
     Load data sequences.
@@ -251,32 +492,79 @@ class CachedDataset(Dataset):
     x = self.preprocess(x)
     if self.window > 1:
       x = self.sliding_window(x)
-    self.alloc_intervals[idi][2][o:o + l] = x
+    self.alloc_intervals[idi][2][o:o + l] = self._cache_compress(idc, x)
 
-  def alloc_interval_index(self, ids):
+  def _get_cache_dtype(self):
+    """
+    :return: dtype of the input data in the cache (alloc intervals)
+    :rtype: str
+    """
+    return self.cache_dtype or self.get_data_dtype("data")
+
+  def _cache_compress(self, idc, x):
     """
+    :param int idc: seq_index idx
+    :param numpy.ndarray x: input data of the seq, (time,...)
+    :return: x for storage in the cache, see cache_dtype
+    :rtype: numpy.ndarray
+    """
+    if not self.cache_dtype:
+      return x
+    if self.cache_dtype == "int8":
+      if x.shape[0] == 0:
+        return x.astype("int8")
+      x = x.astype("float32")
+      x_min = numpy.min(x, axis=0)
+      scale = (numpy.max(x, axis=0) - x_min) / 255.
+      scale[scale == 0] = 1.
+      self._cache_int8_scale[idc] = scale
+      self._cache_int8_offset[idc] = x_min
+      return (numpy.round((x - x_min) / scale) - 128).astype("int8")
+    return x.astype(self.cache_dtype)
+
+  def _cache_decompress(self, idc, x):
+    """
+    :param int idc: seq_index idx
+    :param numpy.ndarray x: from the cache
+    :return: x in the original dtype. inverse of :func:`_cache_compress`, up to the precision of cache_dtype
+    :rtype: numpy.ndarray
+    """
+    if not self.cache_dtype:
+      return x
+    dtype = self.get_data_dtype("data")
+    if self.cache_dtype == "int8":
+      x = (x.astype("float32") + 128.) * self._cache_int8_scale[idc] + self._cache_int8_offset[idc]
+    return x.astype(dtype, copy=False)
+
+  def _alloc_interval_bisect(self, ids):
+    """
+    Binary search in self.alloc_intervals, which are sorted and non-overlapping.
+
     :param int ids: sorted seq idx
-    :return index in self.alloc_intervals
+    :return: index of the last alloc interval with alloc start <= ids, or -1
     :rtype: int
     """
     s = 0
     e = len(self.alloc_intervals)
-    # Binary search.
     while s < e:
       i = (s + e) // 2
+      if self.alloc_intervals[i][0] <= ids:
+        s = i + 1
+      else:
+        e = i
+    return s - 1
+
+  def alloc_interval_index(self, ids):
+    """
+    :param int ids: sorted seq idx
+    :return index in self.alloc_intervals
+    :rtype: int
+    """
+    i = self._alloc_interval_bisect(ids)
+    if i >= 0:
       alloc_start, alloc_end, _ = self.alloc_intervals[i]
       if alloc_start <= ids < alloc_end:
         return i
-      elif alloc_start <= ids and ids >= alloc_end:
-        if s == i:
-          return -1
-        s = i
-      elif alloc_start > ids:
-        if e == i:
-          return -1
-        e = i
-      else:
-        assert False
     return -1
 
   def _insert_alloc_interval(self, pos, value, merge=False):
@@ -303,26 +591,26 @@ class CachedDataset(Dataset):
            [xc,
             numpy.zeros(
               [self._seq_start[ni][0]] + self.get_data_shape("data"),
-              dtype=self.get_data_dtype("data")),
+              dtype=self._get_cache_dtype()),
             xn])))
       return 0
     elif value[0] == ci and merge:
       nj = self.alloc_intervals[pos][0]
       del self.alloc_intervals[pos]
       self.alloc_intervals.insert(pos, (nj,value[1],
-                                        numpy.concatenate([xc, numpy.zeros([self._seq_start[value[1]][0] - self._seq_start[ci][0]] + self.get_data_shape("data"), dtype=self.get_data_dtype("data"))])))
+                                        numpy.concatenate([xc, numpy.zeros([self._seq_start[value[1]][0] - self._seq_start[ci][0]] + self.get_data_shape("data"), dtype=self._get_cache_dtype())])))
       return 0
     elif value[1] == ni and merge:
       nk = self.alloc_intervals[pos + 1][1]
       del self.alloc_intervals[pos + 1]
       self.alloc_intervals.insert(pos + 1, (value[0], nk,
-                                            numpy.concatenate([numpy.zeros([self._seq_start[ni][0] - self._seq_start[value[0]][0]] + self.get_data_shape("data"), dtype=self.get_data_dtype("data")), xc])))
+                                            numpy.concatenate([numpy.zeros([self._seq_start[ni][0] - self._seq_start[value[0]][0]] + self.get_data_shape("data"), dtype=self._get_cache_dtype()), xc])))
       return 0
     else:
       self.alloc_intervals.insert(pos + 1,
         value + (numpy.zeros(
             [self._seq_start[value[1]][0] - self._seq_start[value[0]][0]] + self.get_data_shape("data"),
-            dtype=self.get_data_dtype("data")),))
+            dtype=self._get_cache_dtype()),))
       return 1
 
   def _remove_alloc_interval(self, pos, value):
@@ -364,13 +652,17 @@ class CachedDataset(Dataset):
     if start == end:
       return
     assert start < end
-    i = 0
+    # All alloc intervals (remove mode) or gaps after them (insert mode) before this one end before start.
+    # We start one earlier to be safe with empty alloc intervals.
+    i = max(self._alloc_interval_bisect(start) - 1, 0)
     selection = []; """ :type: list[int] """
     modify = self._insert_alloc_interval if invert else self._remove_alloc_interval
     while i < len(self.alloc_intervals) - invert:
       ni = self.alloc_intervals[i + invert][1 - invert]  # insert mode: start idx of next alloc
       ci = self.alloc_intervals[i][invert]               # insert mode: end idx of cur alloc
       assert ci <= ni
+      if ci >= end and ni > end:
+        break  # this and all following are behind end
       flag = ((ci <= start < ni), (ci < end <= ni), (ci < start and ni <= start) or (ci >= end and ni > end))
       if not flag[0] and not flag[1]:
         if not flag[2]:
@@ -386,9 +678,9 @@ class CachedDataset(Dataset):
         i += modify(i, (start, ni))
       i += 1
     if self.alloc_intervals[0][0] != 0:
-      self.alloc_intervals.insert(0, (0, 0, numpy.zeros([1] + self.get_data_shape("data"), dtype=self.get_data_dtype("data"))))
+      self.alloc_intervals.insert(0, (0, 0, numpy.zeros([1] + self.get_data_shape("data"), dtype=self._get_cache_dtype())))
     if self.alloc_intervals[-1][1] != self.num_seqs:
-      self.alloc_intervals.append((self.num_seqs, self.num_seqs, numpy.zeros([1] + self.get_data_shape("data"), dtype=self.get_data_dtype("data"))))
+      self.alloc_intervals.append((self.num_seqs, self.num_seqs, numpy.zeros([1] + self.get_data_shape("data"), dtype=self._get_cache_dtype())))
     return selection
 
   def insert_alloc_interval(self, start, end=None):
@@ -410,7 +702,7 @@ class CachedDataset(Dataset):
         return 0
       assert nframes > 0
     deleted = 0
-    i = 0
+    i = max(self._alloc_interval_bisect(self.num_seqs_cached_at_start), 0)  # all before are kept anyway
     while (not nframes or deleted < nframes) and i < len(self.alloc_intervals):
       ai = self.alloc_intervals[i]
       if ai[1] > self.num_seqs_cached_at_start and ai[0] < ai[1]:
@@ -464,6 +756,20 @@ class CachedDataset(Dataset):
       d[k] = l
     return NumbersDict(d)
 
+  def get_all_seq_lengths(self):
+    """
+    :return: (data keys, lengths) for all seqs of the current epoch
+    :rtype: (list[str],numpy.ndarray)|None
+    """
+    if (self.__class__.get_seq_length is not CachedDataset.get_seq_length
+            or self.__class__.get_seq_length_2d is not CachedDataset.get_seq_length_2d):
+      return None  # custom seq lengths
+    keys = ["data"] + list(self.target_keys)
+    if self.num_seqs == 0:
+      return keys, numpy.zeros((0, len(keys)), dtype="int64")
+    real_seq_idxs = numpy.array(self._seq_index, dtype="int64")[numpy.array(self._index_map, dtype="int64")]
+    return keys, self._seq_lengths[real_seq_idxs][:, :len(keys)]
+
   def get_seq_start(self, sorted_seq_idx):
     """
     :type sorted_seq_idx: int
@@ -485,7 +791,7 @@ class CachedDataset(Dataset):
     assert o >= 0
     l = self.get_seq_length_2d(sorted_seq_idx)[0]
     assert alloc_data.shape[0] >= o + l
-    return alloc_data[o:o + l]
+    return self._cache_decompress(seq_idx, alloc_data[o:o + l])
 
   def get_data_dim(self, key):
     if key == "data":
@@ -5,6 +5,8 @@ Provides :class:`CachedDataset2`.
 
 from Dataset import Dataset, DatasetSeq
 from threading import Condition
+from random import Random
+import sys
 import typing
 try:
   # noinspection PyCompatibility
@@ -26,9 +28,31 @@ class CachedDataset2(Dataset):
   - handle seq ordering by overriding `init_seq_order`
   - you can set `_estimated_num_seqs`
   - you can set `_num_seqs` or `_num_timesteps` if you know them in advance
+  - you can set `collect_workers_supported` if `_collect_single_seq` can run in a forked sub process,
+    i.e. it only depends on seq_idx and the state after `init_seq_order`, see :func:`_collect_single_seq_in_worker`
+
+  With `shuffle_buffer_size`, the seqs from `_collect_single_seq` are streamed through a shuffle buffer,
+  see :func:`_collect_single_seq_shuffled`.
+  Then the seq idx from outside (e.g. in `get_tag`) is not the seq idx of `_collect_single_seq` anymore.
+  If you override methods which look up something by the seq idx in your own seq order
+  (e.g. `get_tag` or `get_corpus_seq_idx`), map it via :func:`_get_underlying_seq_idx`.
+  If you override `_load_seqs` (e.g. to load sub datasets for the requested range),
+  set `shuffle_buffer_supported = False`.
   """
 
-  def __init__(self, **kwargs):
+  collect_workers_supported = False
+  shuffle_buffer_supported = True
+  # In the worker, arrays of at least this size are sent via shared memory (if available), see TaskSystem.
+  collect_workers_shared_mem_min_size = 64 * 1024
+
+  def __init__(self, num_workers=0, shuffle_buffer_size=0, **kwargs):
+    """
+    :param int num_workers: if >0, upcoming seqs will be collected ahead in that many sub processes
+    :param int shuffle_buffer_size: if >0, the seqs (in the order given by the dataset) are shuffled
+      via a buffer of that many seqs, which are kept in memory.
+      This gives an approximately random order, even if the dataset can only be read sequentially
+      and the num seqs is unknown. The order is deterministic for each epoch.
+    """
     super(CachedDataset2, self).__init__(**kwargs)
     self._num_timesteps = None
     self.epoch = None
@@ -36,6 +60,22 @@ class CachedDataset2(Dataset):
     self.added_data = []  # type: typing.List[DatasetSeq]
     self.expected_load_seq_start = 0
     self._num_timesteps_accumulated = 0
+    if num_workers:
+      assert self.collect_workers_supported, "%s: num_workers not supported" % self
+    self.num_workers = num_workers
+    self._collect_workers = None  # type: typing.Optional[typing.List[TaskSystem.AsyncTask]]
+    self._collect_workers_next_send = 0
+    self._collect_workers_next_recv = 0
+    self._collect_workers_end = None  # type: typing.Optional[int]  # seq idx where we got None
+    if shuffle_buffer_size:
+      assert self.shuffle_buffer_supported, "%s: shuffle_buffer_size not supported" % self
+    self.shuffle_buffer_size = shuffle_buffer_size
+    self._shuffle_buffer = []  # type: typing.List[typing.Tuple[int,DatasetSeq]]  # (underlying seq idx, seq)
+    self._shuffle_buffer_rnd = None  # type: typing.Optional[Random]
+    self._shuffle_buffer_seq_idx_map = []  # type: typing.List[int]  # seq idx -> underlying seq idx
+    self._shuffle_buffer_next_seq_idx = 0  # next seq idx we return from the buffer
+    self._shuffle_buffer_next_collect_idx = 0  # next seq idx we collect from the dataset
+    self._shuffle_buffer_collect_finished = False
 
   def init_seq_order(self, epoch=None, seq_list=None):
     """
@@ -50,12 +90,19 @@ class CachedDataset2(Dataset):
     super(CachedDataset2, self).init_seq_order(epoch=epoch, seq_list=seq_list)
     if not epoch:
       epoch = 1
+    self._stop_collect_workers()  # they are (re)started lazily in _load_seqs, after the seq order was set
     self.expected_load_seq_start = 0
     self.reached_final_seq = False
     self.added_data = []
     self._num_timesteps_accumulated = 0
     self._num_seqs = None
     self.epoch = epoch
+    self._shuffle_buffer = []
+    self._shuffle_buffer_rnd = Random(epoch)
+    self._shuffle_buffer_seq_idx_map = []
+    self._shuffle_buffer_next_seq_idx = 0
+    self._shuffle_buffer_next_collect_idx = 0
+    self._shuffle_buffer_collect_finished = False
     return True
 
   def _cleanup_old_seqs(self, seq_idx_end):
@@ -114,7 +161,12 @@ class CachedDataset2(Dataset):
       self.expected_load_seq_start = start
     if self.added_data:
       start = max(self.added_data[-1].seq_idx + 1, start)
-    seqs = [self._collect_single_seq(seq_idx=seq_idx) for seq_idx in range(start, end)]
+    if self.shuffle_buffer_size:
+      seqs = [self._collect_single_seq_shuffled(seq_idx=seq_idx) for seq_idx in range(start, end)]
+    elif self.num_workers:
+      seqs = [self._collect_single_seq_from_workers(seq_idx=seq_idx) for seq_idx in range(start, end)]
+    else:
+      seqs = [self._collect_single_seq(seq_idx=seq_idx) for seq_idx in range(start, end)]
     seqs = list(filter(None, seqs))  # We might not know the num seqs in advance.
     self._num_timesteps_accumulated += sum([seq.num_frames for seq in seqs])
     self.added_data += seqs
@@ -149,6 +201,199 @@ class CachedDataset2(Dataset):
     """
     raise NotImplementedError
 
+  def _collect_single_seq_shuffled(self, seq_idx):
+    """
+    Like _collect_single_seq, but via the shuffle buffer.
+    The buffer is filled with the next seqs of the dataset (via _collect_single_seq, or from the workers).
+    We return a random seq from the buffer and replace it by the next seq of the dataset.
+    This only needs the seqs in order, and the memory is bounded by shuffle_buffer_size.
+
+    :param int seq_idx: the seq idx after shuffling. the underlying seq idx is different
+    :rtype: DatasetSeq | None
+    """
+    assert seq_idx >= self._shuffle_buffer_next_seq_idx, "seqs must be loaded in order"
+    while True:
+      while not self._shuffle_buffer_collect_finished and len(self._shuffle_buffer) < self.shuffle_buffer_size:
+        collect_idx = self._shuffle_buffer_next_collect_idx
+        if self.num_workers:
+          seq = self._collect_single_seq_from_workers(seq_idx=collect_idx)
+        else:
+          seq = self._collect_single_seq(seq_idx=collect_idx)
+        if seq is None:
+          self._shuffle_buffer_collect_finished = True
+          break
+        self._shuffle_buffer.append((collect_idx, seq))
+        self._shuffle_buffer_next_collect_idx += 1
+      if not self._shuffle_buffer:
+        return None
+      i = self._shuffle_buffer_rnd.randrange(len(self._shuffle_buffer))
+      # Swap with the last one, such that we can remove it in O(1). The buffer order does not matter.
+      self._shuffle_buffer[i], self._shuffle_buffer[-1] = self._shuffle_buffer[-1], self._shuffle_buffer[i]
+      underlying_seq_idx, seq = self._shuffle_buffer.pop()
+      out_seq_idx = self._shuffle_buffer_next_seq_idx
+      self._shuffle_buffer_next_seq_idx += 1
+      assert len(self._shuffle_buffer_seq_idx_map) == out_seq_idx
+      self._shuffle_buffer_seq_idx_map.append(underlying_seq_idx)
+      if out_seq_idx < seq_idx:
+        continue  # was skipped
+      seq.seq_idx = seq_idx
+      return seq
+
+  def _get_underlying_seq_idx(self, seq_idx):
+    """
+    :param int seq_idx: seq idx as seen from outside, i.e. after the shuffle buffer
+    :return: seq idx as used for `_collect_single_seq`, i.e. in the seq order of the dataset itself.
+      This is the same if there is no shuffle buffer.
+    :rtype: int
+    """
+    if not self.shuffle_buffer_size:
+      return seq_idx
+    if seq_idx >= len(self._shuffle_buffer_seq_idx_map):
+      # We only know it after the seq went through the shuffle buffer.
+      self.load_seqs(self.expected_load_seq_start, seq_idx + 1)
+      assert seq_idx < len(self._shuffle_buffer_seq_idx_map), "%s: seq idx %i out of range" % (self, seq_idx)
+    return self._shuffle_buffer_seq_idx_map[seq_idx]
+
+  def _init_collect_worker(self):
+    """
+    Called in the forked worker sub process, before any seq is collected.
+    Override this e.g. to reopen file handles which must not be shared with the parent process.
+    """
+
+  def _collect_single_seq_in_worker(self, seq_idx):
+    """
+    Called in the worker sub process.
+    Seqs are distributed round-robin over the workers, so every worker gets only every num_workers-th seq.
+    Override this if _collect_single_seq uses some sequential state (e.g. a random generator),
+    and reset that state depending on seq_idx, such that the result is deterministic.
+
+    :param int seq_idx:
+    :rtype: DatasetSeq | None
+    """
+    return self._collect_single_seq(seq_idx)
+
+  def _collect_worker_main(self, task):
+    """
+    Main loop of a worker sub process. Via the pipe, we get seq indices, and we send back the collected seqs.
+
+    :param TaskSystem.AsyncTask task:
+    """
+    import TaskSystem
+    import traceback
+    # We inherited the parent ends of the pipes of all previously started workers. Close them.
+    for other_task in self._collect_workers:
+      other_task.conn.close()
+    if sys.platform != "win32" and TaskSystem.SharedMem.is_shmget_functioning():
+      TaskSystem.SharedMemNumpyConfig["enabled"] = True
+      TaskSystem.SharedMemNumpyConfig["auto_pickling_min_size"] = self.collect_workers_shared_mem_min_size
+      TaskSystem.SharedMemNumpyConfig["min_shared_mem_size"] = self.collect_workers_shared_mem_min_size
+    self._init_collect_worker()
+    while True:
+      try:
+        seq_idx = task.conn.recv()
+      except TaskSystem.ProcConnectionDied:
+        return
+      if seq_idx is None:
+        return
+      try:
+        seq = self._collect_single_seq_in_worker(seq_idx)
+        if seq is not None:
+          assert isinstance(seq, DatasetSeq) and seq.seq_idx == seq_idx
+          features = {}
+          for key, value in seq.features.items():
+            if value.dtype == "object":  # cannot be put into shared memory, and our Pickler does not support it
+              features[key] = ("object", value.tolist())
+            else:
+              features[key] = ("numpy", value)
+          seq = {"seq_tag": seq.seq_tag, "features": features, "ctc_targets": seq.ctc_targets}
+        res = ("ok", seq)
+      except Exception:
+        res = ("exception", "seq %i: %s" % (seq_idx, traceback.format_exc()))
+      try:
+        task.conn.send(res)
+      except TaskSystem.ProcConnectionDied:
+        return
+
+  def _start_collect_workers(self):
+    """
+    Forks the worker sub processes. They inherit the current state, e.g. the seq order for this epoch.
+    """
+    from TaskSystem import AsyncTask
+    assert self._collect_workers is None
+    self._collect_workers = []
+    if self.shuffle_buffer_size:  # the workers collect the underlying seqs, see _collect_single_seq_shuffled
+      self._collect_workers_next_send = self._collect_workers_next_recv = self._shuffle_buffer_next_collect_idx
+    else:
+      self._collect_workers_next_send = self._collect_workers_next_recv = self.expected_load_seq_start
+    self._collect_workers_end = None
+    for i in range(self.num_workers):
+      self._collect_workers.append(AsyncTask(
+        func=self._collect_worker_main, name="%s collect worker %i" % (self.name, i)))
+
+  def _stop_collect_workers(self):
+    """
+    Stops all worker sub processes. Seqs which are still in progress are dropped.
+    """
+    if not self._collect_workers:
+      return
+    from TaskSystem import ProcConnectionDied
+    for task in self._collect_workers:
+      try:
+        task.conn.send(None)
+      except ProcConnectionDied:
+        pass  # already dead
+      task.conn.close()
+    for task in self._collect_workers:
+      task.join()
+    self._collect_workers = None
+
+  def _collect_single_seq_from_workers(self, seq_idx):
+    """
+    Like _collect_single_seq, but the seqs are computed ahead by the worker sub processes.
+    We send seq_idx to worker seq_idx % num_workers, so we receive the results exactly in order.
+
+    :param int seq_idx:
+    :rtype: DatasetSeq | None
+    """
+    from TaskSystem import numpy_copy_and_set_unused
+    import numpy
+    if self._collect_workers is None:
+      self._start_collect_workers()
+    if self._collect_workers_end is not None and seq_idx >= self._collect_workers_end:
+      return None
+    assert seq_idx >= self._collect_workers_next_recv, "seqs must be loaded in order"
+    while True:
+      # Keep the workers busy.
+      max_seq_idx = seq_idx + 2 * self.num_workers
+      if self._num_seqs is not None:
+        max_seq_idx = min(max_seq_idx, self._num_seqs)
+      if self._collect_workers_end is not None:
+        max_seq_idx = min(max_seq_idx, self._collect_workers_end)
+      while self._collect_workers_next_send < max(max_seq_idx, seq_idx + 1):
+        send_idx = self._collect_workers_next_send
+        self._collect_workers[send_idx % self.num_workers].conn.send(send_idx)
+        self._collect_workers_next_send += 1
+      recv_idx = self._collect_workers_next_recv
+      status, res = self._collect_workers[recv_idx % self.num_workers].conn.recv()
+      self._collect_workers_next_recv += 1
+      if status != "ok":
+        raise Exception("%s: collect worker failed for %s" % (self, res))
+      if res is None and self._collect_workers_end is None:
+        self._collect_workers_end = recv_idx  # we receive in order, so this is the first one
+      if recv_idx < seq_idx:
+        continue  # was skipped
+      if res is None:
+        return None
+      features = {}
+      for key, (kind, value) in res["features"].items():
+        if kind == "object":
+          features[key] = numpy.array(value, dtype="object")
+        else:
+          features[key] = numpy_copy_and_set_unused(value)  # frees the shared memory for reuse in the worker
+      return DatasetSeq(
+        seq_idx=seq_idx, seq_tag=res["seq_tag"], features=features,
+        ctc_targets=numpy_copy_and_set_unused(res["ctc_targets"]))
+
   def get_num_timesteps(self):
     """
     :rtype: int
@@ -215,6 +460,13 @@ class CachedDataset2(Dataset):
     self.load_seqs(self.expected_load_seq_start, sorted_seq_idx + 1)
     return self._get_seq(sorted_seq_idx).seq_tag
 
+  def get_corpus_seq_idx(self, seq_idx):
+    """
+    :param int seq_idx:
+    :rtype: int
+    """
+    return super(CachedDataset2, self).get_corpus_seq_idx(self._get_underlying_seq_idx(seq_idx))
+
   def get_data_keys(self):
     """
     :rtype: list[str]
@@ -274,14 +526,14 @@ class SingleStreamPipeDataset(CachedDataset2):
   Consumer: The thread / code which calls load_seqs and get_data here.
   """
 
-  def __init__(self, dim, ndim, sparse=False, dtype="float32"):
+  def __init__(self, dim, ndim, sparse=False, dtype="float32", **kwargs):
     """
     :param int dim:
     :param int ndim:
     :param bool sparse:
     :param str dtype:
     """
-    super(SingleStreamPipeDataset, self).__init__()
+    super(SingleStreamPipeDataset, self).__init__(**kwargs)
     self.num_inputs = dim
     self.num_outputs = {"data": [dim, ndim]}
     self.sparse = sparse
@@ -19,11 +19,11 @@ from random import Random, random
 import sys
 import os
 import numpy
-import functools
 import typing
 
 from Log import log
-from EngineBatch import Batch, BatchSetGenerator
+from EngineBatch import Batch, BatchSeqCopyPart, BatchSetGenerator
+from SeqTagIndex import SeqTagIndex
 from Util import try_run, NumbersDict, unicode, OptionalNotImplementedError
 
 
@@ -54,6 +54,7 @@ class Dataset(object):
     set_or_remove("seq_ordering", config.value("batching", None))
     set_or_remove("shuffle_frames_of_nseqs", config.int('shuffle_frames_of_nseqs', 0) or None)
     set_or_remove("min_chunk_size", config.int('min_chunk_size', 0) or None)
+    set_or_remove("seq_order_compat", config.bool("seq_order_compat", None))
 
   @classmethod
   def from_config(cls, config, **kwargs):
@@ -69,7 +70,7 @@ class Dataset(object):
                window=1, context_window=None, chunking=None,
                seq_ordering='default', partition_epoch=None, repeat_epoch=None,
                shuffle_frames_of_nseqs=0, min_chunk_size=0,
-               estimated_num_seqs=None,):
+               estimated_num_seqs=None, seq_len_cache=None, seq_order_compat=True):
     """
     :param str name: e.g. "train" or "eval"
     :param int window: features will be of dimension window * feature_dim, as we add a context-window around.
@@ -84,6 +85,13 @@ class Dataset(object):
       partition_epoch.
     :param int shuffle_frames_of_nseqs: shuffles the frames. not always supported
     :param None|int estimated_num_seqs: for progress reporting in case the real num_seqs is unknown
+    :param str|SeqLenCache|None seq_len_cache: directory for a persistent cache of the seq lens,
+      used by the seq orderings which need the seq lens (e.g. "sorted" or "laplace"),
+      for datasets where it is expensive to get them. Not all datasets support this. See :class:`SeqLenCache`.
+    :param bool seq_order_compat: if True, :func:`get_seq_order_for_epoch` uses the original pure Python implementation,
+      which gives exactly the same orders as before. If False, it uses a faster vectorized Numpy implementation,
+      which gives different orders for the random orderings (e.g. "random", "laplace", "bucket").
+      This needs Numpy >= 1.17 (for :func:`numpy.random.default_rng`).
     """
     self.name = name or ("dataset_id%s" % id(self))
     self.lock = RLock()  # Used when manipulating our data potentially from multiple threads.
@@ -138,6 +146,18 @@ class Dataset(object):
     assert isinstance(context_window, NumbersDict)
     self.context_window = context_window
     self.shuffle_frames_of_nseqs = shuffle_frames_of_nseqs
+    if isinstance(seq_len_cache, (str, unicode)):
+      # Via init_dataset, we get a SeqLenCache which depends on all the dataset options.
+      seq_len_cache = SeqLenCache(cache_dir=seq_len_cache, key_info=[self.__class__.__name__, name])
+    self.seq_len_cache = seq_len_cache  # type: typing.Optional[SeqLenCache]
+    if not seq_order_compat:
+      # We could fall back to numpy.random.RandomState, but then the orders would depend on the Numpy version.
+      assert hasattr(numpy.random, "default_rng"), (
+        "%s: seq_order_compat=False needs Numpy >= 1.17 (numpy.random.default_rng), you have Numpy %s. "
+        "Use seq_order_compat=True or upgrade Numpy." % (self, numpy.__version__))
+    self.seq_order_compat = seq_order_compat
+    # For seq_ordering "bucket:...": for each seq in the order from get_seq_order_for_epoch, its bucket idx.
+    self._seq_order_bucket_idxs = None  # type: typing.Optional[typing.List[int]]
     self.epoch = None
 
   def __repr__(self):
@@ -210,6 +230,17 @@ class Dataset(object):
     d.update({k: output_len for k in self.get_target_list()})
     return NumbersDict(d)
 
+  def get_all_seq_lengths(self):
+    """
+    This is only available if the dataset knows all seq lengths of the current epoch in advance.
+    It allows :func:`_generate_batches` to plan the batches in a vectorized way.
+
+    :return: (data keys, lengths) where lengths[seq_idx, i] == get_seq_length(seq_idx)[data_keys[i]],
+      or None if the lengths are not known in advance
+    :rtype: (list[str],numpy.ndarray)|None
+    """
+    return None
+
   def get_num_timesteps(self):
     """
     :rtype: int
@@ -276,7 +307,7 @@ class Dataset(object):
     """
     raise NotImplementedError
 
-  def get_seq_order_for_epoch(self, epoch, num_seqs, get_seq_len=None):
+  def get_seq_order_for_epoch(self, epoch, num_seqs, get_seq_len=None, get_seq_tag=None):
     """
     Returns the order of the given epoch.
     This is mostly a static method, except that is depends on the configured type of ordering,
@@ -285,9 +316,28 @@ class Dataset(object):
     :param int epoch: for 'random', this determines the random seed
     :param int num_seqs:
     :param ((int) -> int)|None get_seq_len: function (originalSeqIdx: int) -> int
+    :param ((int) -> str)|None get_seq_tag: function (originalSeqIdx: int) -> str.
+      if given together with seq_len_cache, get_seq_len is only called for seqs which are not in the cache yet.
     :return: the order for the given epoch. such that seq_idx -> underlying idx
     :rtype: list[int]
     """
+    if get_seq_len and get_seq_tag and self.seq_len_cache:
+      try:
+        return self._get_seq_order_for_epoch(
+          epoch=epoch, num_seqs=num_seqs,
+          get_seq_len=lambda s: self.seq_len_cache.get(get_seq_tag(s), lambda: get_seq_len(s)))
+      finally:
+        self.seq_len_cache.save()
+    return self._get_seq_order_for_epoch(epoch=epoch, num_seqs=num_seqs, get_seq_len=get_seq_len)
+
+  def _get_seq_order_for_epoch(self, epoch, num_seqs, get_seq_len=None):
+    """
+    :param int epoch:
+    :param int num_seqs:
+    :param ((int) -> int)|None get_seq_len:
+    :return: the order for the given epoch, see :func:`get_seq_order_for_epoch`
+    :rtype: list[int]
+    """
     partition_epoch = self.partition_epoch or 1
     repeat_epoch = self.repeat_epoch or 1
     if not epoch:
@@ -296,6 +346,39 @@ class Dataset(object):
     if partition_epoch > 1:
       full_epoch = (epoch - 1) // partition_epoch + 1
     assert num_seqs > 0
+    self._seq_order_bucket_idxs = None  # set by the full epoch seq order, for the full epoch
+    if self.seq_order_compat:
+      seq_index = self._get_seq_order_for_full_epoch_compat(full_epoch, num_seqs, get_seq_len)
+    else:
+      seq_index = self._get_seq_order_for_full_epoch(full_epoch, num_seqs, get_seq_len)
+    bucket_idxs = self._seq_order_bucket_idxs
+    if partition_epoch > 1:
+      seq_index = self._apply_partition_epoch(seq_index, partition_epoch, epoch)
+      if bucket_idxs is not None:
+        bucket_idxs = self._apply_partition_epoch(bucket_idxs, partition_epoch, epoch)
+    if repeat_epoch > 1:
+      if self.seq_order_compat:
+        seq_index = seq_index * repeat_epoch
+      else:
+        seq_index = numpy.tile(seq_index, repeat_epoch)
+      if bucket_idxs is not None:
+        bucket_idxs = numpy.tile(bucket_idxs, repeat_epoch)
+    if not self.seq_order_compat:
+      seq_index = seq_index.tolist()  # the callers expect a list
+    if bucket_idxs is not None:
+      self._seq_order_bucket_idxs = numpy.asarray(bucket_idxs).tolist()
+    return seq_index
+
+  def _get_seq_order_for_full_epoch_compat(self, full_epoch, num_seqs, get_seq_len=None):
+    """
+    The original pure Python implementation. Used with seq_order_compat=True.
+
+    :param int full_epoch: epoch without partition_epoch
+    :param int num_seqs:
+    :param ((int) -> int)|None get_seq_len:
+    :return: the order for the given full epoch, without partition_epoch and repeat_epoch applied
+    :rtype: list[int]
+    """
     seq_index = list(range(num_seqs))  # type: typing.List[int]  # the real seq idx after sorting
     if self.seq_ordering == 'default':
       pass  # Keep order as-is.
@@ -349,33 +432,153 @@ class Dataset(object):
       rnd_seed = (full_epoch - 1) / nth + 1
       rnd = Random(rnd_seed)
       rnd.shuffle(seq_index)
+    elif self.seq_ordering.startswith("bucket:"):
+      # See _get_bucket_opts.
+      assert get_seq_len
+      bins, nth = self._get_bucket_opts(num_seqs)
+      rnd = Random((full_epoch - 1) // nth + 1)
+      rnd.shuffle(seq_index)
+      seq_index.sort(key=get_seq_len)
+      buckets = [
+        seq_index[i * num_seqs // bins:(i + 1) * num_seqs // bins]
+        for i in range(bins)]
+      for bucket in buckets:
+        rnd.shuffle(bucket)
+      bucket_idxs = list(range(bins))
+      rnd.shuffle(bucket_idxs)
+      seq_index = [idx for i in bucket_idxs for idx in buckets[i]]
+      self._seq_order_bucket_idxs = [i for i in bucket_idxs for _ in buckets[i]]
     else:
       assert False, "invalid batching specified: " + self.seq_ordering
-    if partition_epoch > 1:
-      seq_index = self._apply_partition_epoch(seq_index, partition_epoch, epoch)
-    if repeat_epoch > 1:
-      seq_index = seq_index * repeat_epoch
     return seq_index
 
+  def _get_seq_order_for_full_epoch(self, full_epoch, num_seqs, get_seq_len=None):
+    """
+    Vectorized variant of :func:`_get_seq_order_for_full_epoch_compat`, used with seq_order_compat=False.
+    The "default", "reverse" and "sorted" orderings are the same,
+    but the random orderings differ, as we use :func:`numpy.random.default_rng`.
+
+    :param int full_epoch: epoch without partition_epoch
+    :param int num_seqs:
+    :param ((int) -> int)|None get_seq_len:
+    :return: the order for the given full epoch, without partition_epoch and repeat_epoch applied
+    :rtype: numpy.ndarray
+    """
+    seq_lens = None  # type: typing.Optional[numpy.ndarray]
+    if get_seq_len:
+      if self.seq_ordering.startswith(("sorted", "laplace", "bucket:")):
+        seq_lens = numpy.fromiter((get_seq_len(s) for s in range(num_seqs)), dtype="int64", count=num_seqs)
+    if self.seq_ordering == 'default':
+      seq_index = numpy.arange(num_seqs, dtype="int64")
+    elif self.seq_ordering.startswith("default_every_n:"):
+      _, num = self.seq_ordering.split(":")
+      num = int(num)
+      seq_index = numpy.arange(num_seqs // num, dtype="int64").repeat(num)
+      for i in range(1, num):
+        seq_index[i::num] += i * (num_seqs // num)
+    elif self.seq_ordering == 'reverse':
+      seq_index = numpy.arange(num_seqs - 1, -1, -1, dtype="int64")
+    elif self.seq_ordering == 'sorted':
+      assert seq_lens is not None
+      seq_index = numpy.argsort(seq_lens, kind="stable")
+    elif self.seq_ordering == "sorted_reverse":
+      assert seq_lens is not None
+      seq_index = numpy.argsort(-seq_lens, kind="stable")
+    elif self.seq_ordering.startswith('laplace'):
+      assert seq_lens is not None
+      tmp = self.seq_ordering.split(':')[1:]
+      if len(tmp) == 0:
+        bins = 2
+      elif tmp[0].startswith("."):
+        bins = max(num_seqs // int(tmp[0][1:]), 2)
+      else:
+        bins = int(tmp[0])
+      nth = int(tmp[1]) if len(tmp) > 1 else 1
+      rnd = numpy.random.default_rng((full_epoch - 1) // nth + 1)
+      seq_index = rnd.permutation(num_seqs)
+      bin_idx = self._get_bin_idx(num_seqs, bins)
+      perm_seq_lens = seq_lens[seq_index]
+      # Within each bin, sort by length, alternating in increasing and decreasing order.
+      perm_seq_lens = numpy.where(bin_idx % 2 == 1, -perm_seq_lens, perm_seq_lens)
+      seq_index = seq_index[numpy.lexsort((perm_seq_lens, bin_idx))]
+    elif self.seq_ordering.startswith('random'):
+      tmp = self.seq_ordering.split(':')
+      nth = int(tmp[1]) if len(tmp) > 1 else 1
+      rnd = numpy.random.default_rng((full_epoch - 1) // nth + 1)
+      seq_index = rnd.permutation(num_seqs)
+    elif self.seq_ordering.startswith("bucket:"):
+      assert seq_lens is not None
+      bins, nth = self._get_bucket_opts(num_seqs)
+      rnd = numpy.random.default_rng((full_epoch - 1) // nth + 1)
+      seq_index = rnd.permutation(num_seqs)
+      seq_index = seq_index[numpy.argsort(seq_lens[seq_index], kind="stable")]
+      bin_idx = self._get_bin_idx(num_seqs, bins)
+      bin_order = numpy.argsort(rnd.permutation(bins))  # bin idx -> position of the bin
+      # Shuffle within each bin by the random keys, and shuffle the bins.
+      perm = numpy.lexsort((rnd.random(num_seqs), bin_order[bin_idx]))
+      seq_index = seq_index[perm]
+      self._seq_order_bucket_idxs = bin_idx[perm]
+    else:
+      assert False, "invalid batching specified: " + self.seq_ordering
+    return seq_index
+
+  def _get_bucket_opts(self, num_seqs):
+    """
+    seq_ordering "bucket:<num_buckets>" or "bucket:.<num_seqs_per_bucket>", optionally followed by ":<nth>".
+    The seqs are sorted by length and split into that many buckets of equal num seqs.
+    The seqs within each bucket are shuffled, and the order of the buckets is shuffled.
+    Each bucket is a contiguous block in the seq order, and :func:`_generate_batches` ends a batch
+    at the end of a bucket, i.e. every batch only contains seqs of one bucket.
+    If the dataset supports random access to the seqs (see :func:`batch_set_generator_cache_whole_epoch`),
+    :func:`generate_batches` also shuffles the batches, otherwise they stay in the (shuffled) order of the buckets.
+
+    :param int num_seqs:
+    :return: num buckets, nth (new random order only every nth full epoch)
+    :rtype: (int,int)
+    """
+    tmp = self.seq_ordering.split(':')[1:]
+    assert 1 <= len(tmp) <= 2, "%s: invalid seq_ordering %r" % (self, self.seq_ordering)
+    if tmp[0].startswith("."):
+      num_seqs_per_bucket = int(tmp[0][1:])
+      assert num_seqs_per_bucket >= 1, "%s: seq_ordering %r: need at least one seq per bucket" % (
+        self, self.seq_ordering)
+      bins = max(num_seqs // num_seqs_per_bucket, 1)
+    else:
+      bins = int(tmp[0])
+      assert bins >= 1, "%s: seq_ordering %r: need at least one bucket" % (self, self.seq_ordering)
+    nth = int(tmp[1]) if len(tmp) > 1 else 1
+    assert nth >= 1, "%s: seq_ordering %r: nth must be positive" % (self, self.seq_ordering)
+    return bins, nth
+
+  @staticmethod
+  def _get_bin_idx(num_seqs, bins):
+    """
+    :param int num_seqs:
+    :param int bins:
+    :return: for each position, the bin idx, where bin i covers [i * num_seqs // bins, (i + 1) * num_seqs // bins)
+    :rtype: numpy.ndarray
+    """
+    bin_start = numpy.arange(bins + 1, dtype="int64") * num_seqs // bins
+    return numpy.searchsorted(bin_start, numpy.arange(num_seqs, dtype="int64"), side="right") - 1
+
   @classmethod
   def _apply_partition_epoch(cls, seq_index, partition_epoch, epoch):
     """
-    :param list[int] seq_index: full list of ordered sequence indices
+    :param list[int]|numpy.ndarray seq_index: full list of ordered sequence indices
     :param int partition_epoch: number of partitions seq_index should be split into
     :param int|None epoch: current epoch
     :return: partition of seq_index for current epoch
-    :rtype: list[int]
+    :rtype: list[int]|numpy.ndarray
     """
     num_seqs = len(seq_index)
     current_partition = ((epoch or 1) - 1) % partition_epoch
     seqs_per_epoch = num_seqs // partition_epoch
-    partition_sizes = ([seqs_per_epoch + 1] * (num_seqs % partition_epoch) +
-                       [seqs_per_epoch] * (partition_epoch - num_seqs % partition_epoch))
-    assert sum(partition_sizes) == num_seqs and len(partition_sizes) == partition_epoch
-    partitions = functools.reduce(lambda a, x: a + [a[-1] + x], partition_sizes, [0])  # cumulative sum
-    assert len(partitions) == partition_epoch + 1
-    seq_index = seq_index[partitions[current_partition]:partitions[current_partition + 1]]
-    assert len(seq_index) == partition_sizes[current_partition]
+    # The first (num_seqs % partition_epoch) partitions get one seq more.
+    num_larger = num_seqs % partition_epoch
+    partition_size = seqs_per_epoch + (1 if current_partition < num_larger else 0)
+    partition_start = current_partition * seqs_per_epoch + min(current_partition, num_larger)
+    seq_index = seq_index[partition_start:partition_start + partition_size]
+    assert len(seq_index) == partition_size
 
     return seq_index
 
@@ -391,6 +594,7 @@ class Dataset(object):
     """
     self.epoch = epoch
     self.rnd_seq_drop = Random(epoch or 1)
+    self._seq_order_bucket_idxs = None  # set again by get_seq_order_for_epoch
     return False
 
   def get_current_seq_order(self):
@@ -868,6 +1072,305 @@ class Dataset(object):
     for seq, weight in zip(seqs, weights):
       self.weights[seq.seq_idx] = [weight, 0]
 
+  @staticmethod
+  def _get_numbers_dict_limits(d, keys, default=None):
+    """
+    :param NumbersDict d:
+    :param list[str] keys:
+    :param int|float|None default: if there is no value for some key
+    :return: d[key] for each key in keys, as it would be used by :func:`NumbersDict.any_compare`
+    :rtype: list[int|float|None]
+    """
+    res = []
+    for key in keys:
+      if key in d.dict:
+        res.append(d.dict[key])
+      elif d.value is not None:
+        res.append(d.value)
+      else:
+        res.append(default)
+    return res
+
+  def _get_planned_chunks(self, keys, lens, chunk_size, chunk_step, used_data_keys):
+    """
+    Vectorized variant of :func:`iterate_seqs`.
+
+    :param list[str] keys:
+    :param numpy.ndarray lens: (num_seqs, len(keys))
+    :param int|NumbersDict chunk_size:
+    :param int|NumbersDict chunk_step:
+    :param set(str)|None used_data_keys:
+    :return: (keys, seq_idxs, starts, ends) with starts/ends of shape (num_chunks, len(keys)),
+      or None if this is not supported (e.g. different chunk sizes per key)
+    :rtype: (list[str],numpy.ndarray,numpy.ndarray,numpy.ndarray)|None
+    """
+    chunk_size = NumbersDict(chunk_size)
+    chunk_step = NumbersDict(chunk_step)
+    num_seqs = lens.shape[0]
+    if chunk_size == 0:
+      return keys, numpy.arange(num_seqs), numpy.zeros_like(lens), lens
+    default_key = "data"
+    if used_data_keys is not None:
+      if not set(used_data_keys).issubset(keys):
+        return None
+      lens = lens[:, [keys.index(key) for key in sorted(used_data_keys)]]
+      keys = sorted(used_data_keys)
+      if default_key not in used_data_keys:
+        default_key = keys[0]
+    if default_key not in keys:
+      return None
+    sizes = self._get_numbers_dict_limits(chunk_size, keys)
+    steps = self._get_numbers_dict_limits(chunk_step, keys)
+    if None in sizes or None in steps or len(set(sizes)) != 1 or len(set(steps)) != 1 or steps[0] <= 0:
+      return None
+    size, step = sizes[0], steps[0]
+    default_lens = lens[:, keys.index(default_key)]
+    # Keys of different length than the default key with length <= 1 get the full seq for every chunk.
+    full_seq = lens != default_lens[:, None]
+    if numpy.any(full_seq & (lens > 1)):
+      return None  # iterate_seqs() will raise an exception
+    max_start = default_lens - max(self.min_chunk_size, 0)
+    num_chunks = numpy.where(default_lens > 0, 1 + numpy.maximum((max_start - 1) // step, 0), 0)
+    seq_idxs = numpy.repeat(numpy.arange(num_seqs), num_chunks)
+    chunk_idxs = numpy.arange(len(seq_idxs)) - numpy.repeat(numpy.cumsum(num_chunks) - num_chunks, num_chunks)
+    chunk_lens = lens[seq_idxs]
+    chunk_full_seq = full_seq[seq_idxs]
+    starts = numpy.zeros_like(chunk_lens) + (chunk_idxs * step)[:, None]
+    ends = numpy.minimum(starts + size, chunk_lens)
+    starts[chunk_full_seq] = 0
+    ends[chunk_full_seq] = chunk_lens[chunk_full_seq]
+    return keys, seq_idxs, starts, ends
+
+  def _plan_batches(self, recurrent_net, batch_size, max_seqs, max_seq_length, min_seq_length,
+                    seq_drop, max_total_num_seqs, chunk_size, chunk_step, used_data_keys):
+    """
+    Vectorized batch planner, using :func:`get_all_seq_lengths`.
+    This computes the same batches as the generic loop in :func:`_generate_batches`,
+    including the same calls to ``self.rnd_seq_drop``,
+    but the batch boundaries are searched on numpy arrays and not per seq via :class:`NumbersDict`.
+    Weights and context windows are not supported here.
+
+    :param bool recurrent_net:
+    :param NumbersDict batch_size:
+    :param int|float max_seqs:
+    :param NumbersDict max_seq_length:
+    :param NumbersDict min_seq_length:
+    :param float seq_drop:
+    :param int|float max_total_num_seqs:
+    :param int|NumbersDict chunk_size:
+    :param int|NumbersDict chunk_step:
+    :param set(str)|None used_data_keys:
+    :return: generator of batches, or None if the generic code path must be used
+    :rtype: typing.Iterator[Batch]|None
+    """
+    seq_lens = self.get_all_seq_lengths()
+    if seq_lens is None:
+      return None
+    keys, lens = seq_lens
+    keys = list(keys)
+    lens = numpy.asarray(lens, dtype="int64").reshape((-1, len(keys)))
+    if recurrent_net:
+      chunks = self._get_planned_chunks(
+        keys=keys, lens=lens, chunk_size=chunk_size, chunk_step=chunk_step, used_data_keys=used_data_keys)
+      if chunks is None:
+        return None
+      return self._plan_batches_recurrent(
+        chunks, batch_size=batch_size, max_seqs=max_seqs,
+        max_seq_length=max_seq_length, min_seq_length=min_seq_length,
+        seq_drop=seq_drop, max_total_num_seqs=max_total_num_seqs)
+    return self._plan_batches_non_recurrent(
+      keys=keys, lens=lens, batch_size=batch_size, max_seqs=max_seqs, max_total_num_seqs=max_total_num_seqs)
+
+  def _plan_batches_recurrent(self, chunks, batch_size, max_seqs, max_seq_length, min_seq_length,
+                              seq_drop, max_total_num_seqs):
+    """
+    :param (list[str],numpy.ndarray,numpy.ndarray,numpy.ndarray) chunks: from :func:`_get_planned_chunks`
+    :param NumbersDict batch_size:
+    :param int|float max_seqs:
+    :param NumbersDict max_seq_length:
+    :param NumbersDict min_seq_length:
+    :param float seq_drop:
+    :param int|float max_total_num_seqs:
+    :rtype: typing.Iterator[Batch]
+    """
+    keys, seq_idxs, starts, ends = chunks
+    lengths = ends - starts
+    num_chunks = len(seq_idxs)
+
+    def any_compare(limits, cmp):
+      """
+      :param list[int|float|None] limits: per key
+      :param ((numpy.ndarray,int|float)->numpy.ndarray) cmp:
+      :return: per chunk, like NumbersDict.any_compare
+      :rtype: numpy.ndarray
+      """
+      res = numpy.zeros((num_chunks,), dtype="bool")
+      for i, limit in enumerate(limits):
+        if limit is not None:
+          res |= cmp(lengths[:, i], limit)
+      return res
+
+    valid = ~any_compare(self._get_numbers_dict_limits(max_seq_length, keys), lambda a, b: a > b)
+    valid &= ~any_compare(self._get_numbers_dict_limits(min_seq_length, keys), lambda a, b: a < b)
+    candidates = numpy.flatnonzero(valid)
+    rnd_state = self.rnd_seq_drop.getstate()
+    draws = numpy.array([self.rnd_seq_drop.random() for _ in range(len(candidates))], dtype="float64")
+    accepted = numpy.zeros((num_chunks,), dtype="bool")
+    accepted[candidates] = draws >= seq_drop
+    if max_total_num_seqs < num_chunks and accepted.any():
+      # The generic code stops at the first chunk where more than max_total_num_seqs seqs were already accepted.
+      accepted_idxs = numpy.flatnonzero(accepted)
+      accepted_seq_idxs = seq_idxs[accepted_idxs]
+      first_accepted_idxs = accepted_idxs[numpy.concatenate([[True], accepted_seq_idxs[1:] != accepted_seq_idxs[:-1]])]
+      if len(first_accepted_idxs) > max_total_num_seqs:
+        stop = int(first_accepted_idxs[int(max_total_num_seqs)]) + 1
+        accepted[stop:] = False
+        # Redo the random numbers, as the generic code would not have used the remaining ones.
+        self.rnd_seq_drop.setstate(rnd_state)
+        for _ in range(int(numpy.searchsorted(candidates, stop, side="left"))):
+          self.rnd_seq_drop.random()
+    accepted_idxs = numpy.flatnonzero(accepted)
+    batch_size_limits = numpy.array(
+      self._get_numbers_dict_limits(batch_size, keys, default=float("inf")), dtype="float64")
+    too_long = (lengths[accepted_idxs] > batch_size_limits[None, :]).any(axis=1)
+    for idx in accepted_idxs[too_long]:
+      length = NumbersDict(dict(zip(keys, lengths[idx].tolist())))
+      print("warning: sequence length (%r) larger than limit (%r)" % (length, batch_size), file=log.v4)
+
+    # A batch must not cross the end of a bucket, see _get_bucket_opts.
+    bucket_ends = [len(accepted_idxs)]
+    if self._seq_order_bucket_idxs is not None and len(accepted_idxs) > 0:
+      chunk_bucket_idxs = numpy.asarray(self._seq_order_bucket_idxs)[seq_idxs[accepted_idxs]]
+      bucket_ends = (numpy.flatnonzero(chunk_bucket_idxs[1:] != chunk_bucket_idxs[:-1]) + 1).tolist() + bucket_ends
+
+    # Batch boundaries. A new batch starts when the padded size or the number of seqs would exceed the limit.
+    boundaries = [0]
+    while boundaries[-1] < len(accepted_idxs):
+      start = boundaries[-1]
+      limit = bucket_ends[int(numpy.searchsorted(bucket_ends, start, side="right"))]
+      window = 64
+      while True:
+        end = min(start + window, limit)
+        if max_seqs < end - start:
+          end = start + int(max_seqs) + 1
+        max_lens = numpy.maximum.accumulate(lengths[accepted_idxs[start:end]], axis=0)
+        num_slices = numpy.arange(1, end - start + 1)
+        exceeded = (max_lens * num_slices[:, None] > batch_size_limits[None, :]).any(axis=1)
+        exceeded |= num_slices > max_seqs
+        exceeded[0] = False  # the first seq is always added
+        if exceeded.any():
+          boundaries.append(start + int(numpy.argmax(exceeded)))
+          break
+        if end == limit:
+          boundaries.append(end)
+          break
+        window *= 2
+    return self._iter_planned_batches_recurrent(
+      keys=keys, seq_idxs=seq_idxs[accepted_idxs], starts=starts[accepted_idxs], lengths=lengths[accepted_idxs],
+      boundaries=boundaries)
+
+  @staticmethod
+  def _iter_planned_batches_recurrent(keys, seq_idxs, starts, lengths, boundaries):
+    """
+    :param list[str] keys:
+    :param numpy.ndarray seq_idxs: (num_chunks,)
+    :param numpy.ndarray starts: (num_chunks, len(keys))
+    :param numpy.ndarray lengths: (num_chunks, len(keys))
+    :param list[int] boundaries: chunk idx of the start of each batch, and the end
+    :rtype: typing.Iterator[Batch]
+    """
+    for batch_start, batch_end in zip(boundaries[:-1], boundaries[1:]):
+      if batch_end == boundaries[-1] and not lengths[batch_start:batch_end].any():
+        break  # the generic code skips the last batch if it has no frames, e.g. only zero-length seqs
+      # Like Batch.add_sequence_as_slice() for each chunk, but without the NumbersDict arithmetic.
+      batch = Batch()
+      batch.max_num_frames_per_slice = NumbersDict(
+        broadcast_value=0, numbers_dict=dict(zip(keys, lengths[batch_start:batch_end].max(axis=0).tolist())))
+      batch.num_slices = batch_end - batch_start
+      batch.seqs = [
+        BatchSeqCopyPart(
+          seq_idx=seq_idx, seq_start_frame=dict(zip(keys, start)), seq_end_frame=dict(zip(keys, end)),
+          batch_slice=batch_slice, batch_frame_offset=0)
+        for batch_slice, (seq_idx, start, end) in enumerate(zip(
+          seq_idxs[batch_start:batch_end].tolist(),
+          starts[batch_start:batch_end].tolist(),
+          (starts[batch_start:batch_end] + lengths[batch_start:batch_end]).tolist()))]
+      yield batch
+
+  def _plan_batches_non_recurrent(self, keys, lens, batch_size, max_seqs, max_total_num_seqs):
+    """
+    :param list[str] keys:
+    :param numpy.ndarray lens: (num_seqs, len(keys))
+    :param NumbersDict batch_size:
+    :param int|float max_seqs:
+    :param int|float max_total_num_seqs:
+    :return: generator of batches, or None if not supported,
+      i.e. when the data keys are of different lengths or have different batch sizes
+    :rtype: typing.Iterator[Batch]|None
+    """
+    if not keys or numpy.any(lens != lens[:, :1]):
+      return None
+    if self._seq_order_bucket_idxs is not None:
+      return None  # the batches must not cross the buckets. not implemented here, the generic code does it
+    batch_size_limits = self._get_numbers_dict_limits(batch_size, keys)
+    if None in batch_size_limits or len(set(batch_size_limits)) != 1:
+      return None
+    max_frames = batch_size_limits[0]
+    if batch_size.value is not None and batch_size.value < max_frames:
+      return None
+    if max_total_num_seqs < len(lens):
+      lens = lens[:int(max_total_num_seqs) + 1]
+    lens = lens[:, 0]
+    # All frames of all seqs are concatenated, and each batch covers an interval of that.
+    seq_starts = numpy.concatenate([[0], numpy.cumsum(lens)])
+    non_empty_seq_idxs = numpy.flatnonzero(lens > 0)
+    total_num_frames = int(seq_starts[-1])
+    boundaries = [0]
+    while boundaries[-1] < total_num_frames:
+      start = boundaries[-1]
+      end = min(start + max_frames, total_num_frames)
+      if max_seqs < len(lens):
+        # The generic code finishes the batch after the first seq which exceeds max_seqs.
+        first_seq_idx = int(numpy.searchsorted(seq_starts, start, side="right")) - 1
+        i = int(numpy.searchsorted(non_empty_seq_idxs, first_seq_idx + max_seqs, side="left"))
+        if i < len(non_empty_seq_idxs):
+          end = min(end, int(seq_starts[non_empty_seq_idxs[i] + 1]))
+      boundaries.append(end)
+    return self._iter_planned_batches_non_recurrent(keys=keys, seq_starts=seq_starts.tolist(), boundaries=boundaries)
+
+  @staticmethod
+  def _iter_planned_batches_non_recurrent(keys, seq_starts, boundaries):
+    """
+    :param list[str] keys:
+    :param list[int] seq_starts: frame offset of each seq in the concatenation of all seqs, and the end
+    :param list[int] boundaries: frame offset of the start of each batch, and the end
+    :rtype: typing.Iterator[Batch]
+    """
+    seq_idx = 0
+    for batch_start, batch_end in zip(boundaries[:-1], boundaries[1:]):
+      # Like Batch.add_frames() for each part, but without the NumbersDict arithmetic.
+      batch = Batch()
+      batch.num_slices = 1
+      num_frames = 0
+      while seq_starts[seq_idx + 1] <= batch_start:
+        seq_idx += 1
+      while seq_idx + 1 < len(seq_starts) and seq_starts[seq_idx] < batch_end:
+        start = max(batch_start, seq_starts[seq_idx])
+        end = min(batch_end, seq_starts[seq_idx + 1])
+        if end > start:
+          batch.max_num_frames_per_slice = NumbersDict(
+            broadcast_value=num_frames, numbers_dict={key: num_frames + end - start for key in keys})
+          batch.seqs.append(BatchSeqCopyPart(
+            seq_idx=seq_idx,
+            seq_start_frame={key: start - seq_starts[seq_idx] for key in keys},
+            seq_end_frame={key: end - seq_starts[seq_idx] for key in keys},
+            batch_slice=0, batch_frame_offset=num_frames))
+          num_frames += end - start
+        if end < seq_starts[seq_idx + 1]:
+          break  # the rest of this seq goes into the next batch
+        seq_idx += 1
+      yield batch
+
   def _generate_batches(self, recurrent_net,
                         batch_size, max_seqs=-1, max_seq_length=sys.maxsize,
                         min_seq_length=0, pruning=0.0,
@@ -906,8 +1409,20 @@ class Dataset(object):
         chunk_size = 0
     batch = Batch()
     ctx_lr = self._get_context_window_left_right()
+    if not self.weights and not ctx_lr:
+      planned_batches = self._plan_batches(
+        recurrent_net=recurrent_net, batch_size=batch_size, max_seqs=max_seqs,
+        max_seq_length=max_seq_length, min_seq_length=min_seq_length,
+        seq_drop=seq_drop, max_total_num_seqs=max_total_num_seqs,
+        chunk_size=chunk_size, chunk_step=chunk_step, used_data_keys=used_data_keys)
+      if planned_batches is not None:
+        for batch in planned_batches:
+          yield batch
+        return
     total_num_seqs = 0
     last_seq_idx = -1
+    bucket_idxs = self._seq_order_bucket_idxs  # see _get_bucket_opts
+    batch_bucket_idx = None
     avg_weight = sum([v[0] for v in self.weights.values()]) / (len(self.weights.keys()) or 1)
     for idx in self.weights:
       self.weights[idx][1] = random() * avg_weight * pruning
@@ -931,12 +1446,22 @@ class Dataset(object):
           print("warning: sequence length (%r) larger than limit (%r)" % (length, batch_size), file=log.v4)
         if self.rnd_seq_drop.random() < seq_drop:
           continue
+        if bucket_idxs is not None:
+          if batch.num_slices > 0 and bucket_idxs[seq_idx] != batch_bucket_idx:
+            yield batch
+            batch = Batch()
+          batch_bucket_idx = bucket_idxs[seq_idx]
         dt, ds = batch.try_sequence_as_slice(length)
         if ds > 1 and ((dt * ds).any_compare(batch_size, (lambda a, b: a > b)) or ds > max_seqs):
           yield batch
           batch = Batch()
         batch.add_sequence_as_slice(seq_idx=seq_idx, seq_start_frame=t_start, length=length)
       else:  # Not recurrent.
+        if bucket_idxs is not None:
+          if batch.num_slices > 0 and bucket_idxs[seq_idx] != batch_bucket_idx:
+            yield batch
+            batch = Batch()
+          batch_bucket_idx = bucket_idxs[seq_idx]
         while t_start.max_value() < t_end.max_value():
           length = t_end - t_start
           num_frames = NumbersDict.min(
@@ -976,9 +1501,18 @@ class Dataset(object):
     :param kwargs: will be passed to :func:`_generate_batches`
     :rtype: BatchSetGenerator
     """
+    generator = self._generate_batches(**kwargs)
+    if self._seq_order_bucket_idxs is not None and self.batch_set_generator_cache_whole_epoch():
+      # Seq ordering "bucket:...", see _get_bucket_opts. The batches do not cross the buckets,
+      # and we shuffle them here, as the order of the seqs does not need to be monotonic.
+      # For a later reuse of the cached batches, BatchSetGenerator shuffles them again.
+      batches = list(generator)
+      Random(self.epoch or 1).shuffle(batches)
+      generator = iter(batches)
+      shuffle_batches = True
     return BatchSetGenerator(
       dataset=self,
-      generator=self._generate_batches(**kwargs),
+      generator=generator,
       shuffle_batches=shuffle_batches,
       cache_whole_epoch=self.batch_set_generator_cache_whole_epoch())
 
@@ -1054,6 +1588,137 @@ class DatasetSeq:
     return "<DataCache seq_idx=%i>" % self.seq_idx
 
 
+class SeqLenCache(object):
+  """
+  Persistent cache of seq tag -> seq len, for the seq orderings which need the seq lens (e.g. "sorted" or "laplace"),
+  for datasets where it is expensive to get the seq len (e.g. it needs to load the whole seq, decode the audio, etc).
+  It is filled lazily, i.e. only the seq lens which were needed are added,
+  and it is reused across epochs and across runs.
+  There is one file per dataset config (via key_info) in the cache dir.
+  The data files in the key_info (e.g. the HDF files in the dataset options) are also identified by size and mtime,
+  such that the cache is not used anymore when the data changes.
+  The seq tags are stored as :class:`SeqTagIndex`, to keep it compact for many seqs.
+  """
+
+  # These dataset options don't have an influence on the seq lens.
+  IgnoredDatasetOpts = {
+    "name", "seq_ordering", "partition_epoch", "repeat_epoch", "estimated_num_seqs", "seq_len_cache",
+    "seq_order_compat"}
+
+  def __init__(self, cache_dir, key_info):
+    """
+    :param str cache_dir:
+    :param object key_info: e.g. the dataset options. everything which identifies the seq lens
+    """
+    import hashlib
+    import json
+    self.cache_dir = cache_dir
+    key_str = json.dumps([key_info, self._get_data_files_info(key_info)], sort_keys=True, default=repr)
+    self.filename = "%s/seq_lens_%s.npz" % (cache_dir, hashlib.md5(key_str.encode("utf8")).hexdigest())
+    self._loaded = False
+    self._tags = None  # type: typing.Optional[SeqTagIndex]  # from the file
+    self._lens = None  # type: typing.Optional[numpy.ndarray]  # from the file, same order as _tags
+    self._new_lens = {}  # type: typing.Dict[str,int]  # not yet in the file
+
+  def __repr__(self):
+    return "<%s %r>" % (self.__class__.__name__, self.filename)
+
+  @classmethod
+  def _get_data_files_info(cls, key_info):
+    """
+    :param object key_info: e.g. the dataset options
+    :return: for all existing files in key_info (searched recursively), sorted: (abs filename, size, mtime)
+    :rtype: list[(str,int,float)]
+    """
+    filenames = set()
+    queue = [key_info]
+    while queue:
+      obj = queue.pop()
+      if isinstance(obj, dict):
+        queue.extend(obj.values())
+      elif isinstance(obj, (list, tuple, set)):
+        queue.extend(obj)
+      elif isinstance(obj, (str, unicode)) and "\n" not in obj:
+        try:
+          if os.path.isfile(obj):
+            filenames.add(os.path.abspath(obj))
+        except (TypeError, ValueError, OSError):  # e.g. some other str, which is not a valid filename
+          pass
+    info = []
+    for filename in sorted(filenames):
+      st = os.stat(filename)
+      info.append((filename, st.st_size, st.st_mtime))
+    return info
+
+  @classmethod
+  def from_dataset_opts(cls, cache_dir, dataset_class_name, dataset_opts):
+    """
+    :param str cache_dir:
+    :param str dataset_class_name:
+    :param dict[str] dataset_opts: kwargs for the dataset
+    :rtype: SeqLenCache
+    """
+    key_info = {k: v for (k, v) in dataset_opts.items() if k not in cls.IgnoredDatasetOpts}
+    key_info["class"] = dataset_class_name
+    return cls(cache_dir=cache_dir, key_info=key_info)
+
+  def _load(self):
+    if self._loaded:
+      return
+    self._loaded = True
+    if not os.path.exists(self.filename):
+      return
+    try:
+      with numpy.load(self.filename) as f:
+        self._tags = SeqTagIndex(buffer=f["tag_buffer"], offsets=f["tag_offsets"])
+        self._lens = f["lens"]
+      assert len(self._tags) == len(self._lens)
+    except Exception as exc:
+      print("%r: cannot load, ignoring the existing cache: %s" % (self, exc), file=log.v3)
+      self._tags, self._lens = None, None
+
+  def get(self, seq_tag, get_seq_len):
+    """
+    :param str seq_tag:
+    :param (()->int) get_seq_len: called if the seq len is not in the cache yet
+    :rtype: int
+    """
+    self._load()
+    if self._tags is not None:
+      idx = self._tags.get(seq_tag)
+      if idx is not None:
+        return int(self._lens[idx])
+    if seq_tag not in self._new_lens:
+      self._new_lens[seq_tag] = int(get_seq_len())
+    return self._new_lens[seq_tag]
+
+  def save(self):
+    """
+    Writes the cache file, if there are new seq lens.
+    """
+    if not self._new_lens:
+      return
+    new_tags = list(self._new_lens.keys())
+    new_lens = numpy.array([self._new_lens[tag] for tag in new_tags], dtype="int64")
+    if self._tags is not None:
+      tags = SeqTagIndex.concat([self._tags, SeqTagIndex.from_tags(new_tags)])
+      lens = numpy.concatenate([self._lens, new_lens])
+    else:
+      tags, lens = SeqTagIndex.from_tags(new_tags), new_lens
+    try:
+      if not os.path.exists(self.cache_dir):
+        os.makedirs(self.cache_dir)
+      # Write to a temp file and rename, such that other processes never see a partially written file.
+      tmp_filename = "%s.tmp.%i" % (self.filename, os.getpid())
+      with open(tmp_filename, "wb") as f:
+        numpy.savez(f, tag_buffer=tags.buffer, tag_offsets=tags.offsets, lens=lens)
+      os.rename(tmp_filename, self.filename)
+    except (IOError, OSError) as exc:
+      print("%r: cannot save: %s" % (self, exc), file=log.v3)
+    self._tags, self._lens = tags, lens
+    self._new_lens.clear()
+
+
 def get_dataset_class(name):
   """
   :param str name:
@@ -1064,7 +1729,7 @@ def get_dataset_class(name):
   # because this function is only used for such cases.
   mod_names = [
     "HDFDataset", "SprintDataset", "GeneratingDataset", "NumpyDumpDataset",
-    "MetaDataset", "LmDataset", "StereoDataset", "RawWavDataset"]
+    "MetaDataset", "LmDataset", "StereoDataset", "RawWavDataset", "ShardedDataset"]
   for mod_name in mod_names:
     mod = import_module(mod_name)
     if name in vars(mod):
@@ -1107,6 +1772,9 @@ def init_dataset(kwargs, extra_kwargs=None, default_kwargs=None):
       kwargs.setdefault(key, value)
   if extra_kwargs:
     kwargs.update(extra_kwargs)
+  if isinstance(kwargs.get("seq_len_cache"), (str, unicode)):
+    kwargs["seq_len_cache"] = SeqLenCache.from_dataset_opts(
+      cache_dir=kwargs["seq_len_cache"], dataset_class_name=clazz_name, dataset_opts=kwargs)
   obj = clazz(**kwargs)
   assert isinstance(obj, Dataset)
   obj.initialize()
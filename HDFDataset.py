@@ -4,14 +4,18 @@ Provides :class:`HDFDataset`.
 """
 
 from __future__ import print_function
+import bisect
 import collections
-import gc
+import os
+import threading
+import typing
 import h5py
 import numpy
 from CachedDataset import CachedDataset
 from CachedDataset2 import CachedDataset2
 from Dataset import Dataset, DatasetSeq
 from Log import log
+from SeqTagIndex import SeqTagIndex
 import Util
 
 
@@ -23,25 +27,109 @@ attr_times = 'times'
 attr_ctcIndexTranscription = 'ctcIndexTranscription'
 
 
+class HDFFilePool(object):
+  """
+  Bounded pool of open (read-only) HDF files.
+  If the limit is reached, the least recently used file gets closed.
+  Use :attr:`lock` around :func:`get` and the usage of the returned file,
+  such that a file cannot get closed while another thread still uses it.
+  """
+
+  def __init__(self, max_open_files=100):
+    """
+    :param int max_open_files:
+    """
+    assert max_open_files > 0
+    self.max_open_files = max_open_files
+    self.lock = threading.RLock()
+    self._files = collections.OrderedDict()  # type: typing.Dict[str,h5py.File]  # filename -> file, LRU order
+
+  def get(self, filename):
+    """
+    :param str filename:
+    :return: open file
+    :rtype: h5py.File
+    """
+    with self.lock:
+      fin = self._files.pop(filename, None)
+      if fin is None:
+        while len(self._files) >= self.max_open_files:
+          _, old_fin = self._files.popitem(last=False)
+          old_fin.close()
+        fin = h5py.File(filename, "r")
+      self._files[filename] = fin  # (re)insert as most recently used
+      return fin
+
+  def close(self):
+    """
+    Closes all files.
+    """
+    with self.lock:
+      for fin in self._files.values():
+        fin.close()
+      self._files.clear()
+
+
+class HDFReadStats(object):
+  """
+  Number of reads and number of bytes read from the HDF files, e.g. within one epoch.
+  """
+
+  def __init__(self, epoch=None):
+    """
+    :param int|None epoch:
+    """
+    self.epoch = epoch
+    self.num_reads = 0
+    self.num_bytes = 0
+
+  def __repr__(self):
+    return "HDF read stats: %i reads, %s" % (self.num_reads, Util.human_bytes_size(self.num_bytes))
+
+  def add(self, num_bytes):
+    """
+    :param int num_bytes: of a single read
+    """
+    self.num_reads += 1
+    self.num_bytes += num_bytes
+
+
 class HDFDataset(CachedDataset):
 
-  def __init__(self, files=None, use_cache_manager=False, **kwargs):
+  def __init__(self, files=None, use_cache_manager=False, max_open_files=100, use_mmap=False,
+               index_cache_dir=None, **kwargs):
     """
     :param None|list[str] files:
     :param bool use_cache_manager: uses :func:`Util.cf` for files
+    :param int max_open_files: max number of HDF files we keep open at the same time for :func:`_load_seqs`.
+      See :class:`HDFFilePool`.
+    :param bool use_mmap: only used with disabled cache (cache_byte_size=0).
+      Data which is stored uncompressed and contiguous in the HDF file will be memory-mapped,
+      and :func:`get_data` returns read-only views into the file, without any copy.
+      Other data is read via h5py as usual.
+    :param str|None index_cache_dir: if set, for every file, we store the meta information
+      (seq lengths, seq tags, dims, etc.) as numpy arrays in an index file in this dir,
+      which is validated by the file size and mtime.
+      On the next startup, :func:`add_file` only loads this index, and does not open the HDF file at all.
+      The seq tags are only loaded on demand.
     """
     super(HDFDataset, self).__init__(**kwargs)
     self._use_cache_manager = use_cache_manager
+    self._use_mmap = use_mmap
+    # file idx -> data key -> memmap. None if the file is not opened yet, see _get_h5_file.
+    self._mmap_data = []  # type: typing.List[typing.Optional[typing.Dict[str,numpy.ndarray]]]
+    self._index_cache_dir = index_cache_dir
+    self._file_pool = HDFFilePool(max_open_files=max_open_files)
+    self._read_stats = HDFReadStats()
     self.files = []; """ :type: list[str] """  # file names
     self.h5_files = []  # type: list[h5py.File]
     self.file_start = [0]
     self.file_seq_start = []; """ :type: list[numpy.ndarray] """
-    self.file_index = []; """ :type: list[int] """
+    self._file_tags = []  # type: typing.List[typing.Optional[SeqTagIndex]]  # file idx -> seq tags
     self.data_dtype = {}; ":type: dict[str,str]"
     self.data_sparse = {}; ":type: dict[str,bool]"
     if files:
-      for fn in files:
-        self.add_file(fn)
+      self._seq_lengths = numpy.concatenate([self._add_file(fn) for fn in files], axis=0)
 
   @staticmethod
   def _decode(s):
@@ -58,86 +146,76 @@ class HDFDataset(CachedDataset):
     """
     Setups data:
       self.seq_lengths
-      self.file_index
       self.file_start
       self.file_seq_start
     Use load_seqs() to load the actual data.
     :type filename: str
     """
+    seq_lengths = self._add_file(filename)
+    if len(self._seq_lengths) == 0:
+      self._seq_lengths = seq_lengths
+    else:
+      self._seq_lengths = numpy.concatenate((self._seq_lengths, seq_lengths), axis=0)
+
+  def _add_file(self, filename):
+    """
+    Like :func:`add_file`, but does not extend self._seq_lengths,
+    such that we can concatenate them once for all files.
+
+    :param str filename:
+    :return: seq lengths of this file, shape (num seqs, 1 + num target keys)
+    :rtype: numpy.ndarray
+    """
     if self._use_cache_manager:
       filename = Util.cf(filename)
-    fin = h5py.File(filename, "r")
-    if 'targets' in fin:
-      self.labels = {
-        k: [self._decode(item) for item in fin["targets/labels"][k][...].tolist()]
-        for k in fin['targets/labels']}
-    if not self.labels:
-      labels = [item.split('\0')[0] for item in fin["labels"][...].tolist()]; """ :type: list[str] """
-      self.labels = {'classes': labels}
-      assert len(self.labels['classes']) == len(labels), "expected " + str(len(self.labels['classes'])) + " got " + str(len(labels))
+    fin = None
+    file_index = self._load_file_index(filename)
+    if file_index is None:
+      fin = h5py.File(filename, "r")
+      file_index = self._get_file_index_from_hdf(fin)
+      self._save_file_index(filename, file_index)
+    meta = file_index["meta"]
+    if meta["has_targets"] or not self.labels:
+      self.labels = meta["labels"]
     self.files.append(filename)
+    self._file_tags.append(file_index.get("tags"))  # None if not loaded yet, see _get_file_tags
     if self.cache_byte_size_total_limit == 0:
-      self.h5_files.append(fin)
+      self.h5_files.append(fin)  # None if not opened yet, see _get_h5_file
+      self._mmap_data.append(self._get_file_mmap_data(filename, fin) if (self._use_mmap and fin) else None)
     print("parsing file", filename, file=log.v5)
-    if 'times' in fin:
+    if meta["has_times"]:
       if self.timestamps is None:
         self.timestamps = fin[attr_times][...]
       else:
         self.timestamps = numpy.concatenate([self.timestamps, fin[attr_times][...]], axis=0)
-    seq_lengths = fin[attr_seqLengths][...]
-    if 'targets' in fin:
-      self.target_keys = sorted(fin['targets/labels'].keys())
-    else:
-      self.target_keys = ['classes']
+    seq_lengths = file_index["seq_lengths"]
+    self.target_keys = meta["target_keys"]
 
-    if len(seq_lengths.shape) == 1:
-      seq_lengths = numpy.array(zip(*[seq_lengths.tolist() for i in range(len(self.target_keys)+1)]))
-
-    if len(self._seq_lengths) == 0:
-      self._seq_lengths = numpy.array(seq_lengths)
-    else:
-      self._seq_lengths = numpy.concatenate((self._seq_lengths, seq_lengths), axis=0)
     if not self._seq_start:
       self._seq_start = [numpy.zeros((seq_lengths.shape[1],), 'int64')]
-    seq_start = numpy.zeros((seq_lengths.shape[0] + 1, seq_lengths.shape[1]), dtype="int64")
-    numpy.cumsum(seq_lengths, axis=0, dtype="int64", out=seq_start[1:])
-    self._tags += fin["seqTags"][...].tolist()
+    seq_start = file_index["seq_start"]
     self.file_seq_start.append(seq_start)
     nseqs = len(seq_start) - 1
     self._num_seqs += nseqs
-    self.file_index.extend([len(self.files) - 1] * nseqs)
     self.file_start.append(self.file_start[-1] + nseqs)
     self._num_timesteps += numpy.sum(seq_lengths[:, 0])
     if self._num_codesteps is None:
       self._num_codesteps = [0 for i in range(1, len(seq_lengths[0]))]
     for i in range(1, len(seq_lengths[0])):
       self._num_codesteps[i - 1] += numpy.sum(seq_lengths[:, i])
-    if 'maxCTCIndexTranscriptionLength' in fin.attrs:
-      self.max_ctc_length = max(self.max_ctc_length, fin.attrs['maxCTCIndexTranscriptionLength'])
-    if len(fin['inputs'].shape) == 1:  # sparse
-      num_inputs = [fin.attrs[attr_inputPattSize], 1]
-    else:
-      num_inputs = [fin['inputs'].shape[1], len(fin['inputs'].shape)] #fin.attrs[attr_inputPattSize]
+    if meta["max_ctc_length"] is not None:
+      self.max_ctc_length = max(self.max_ctc_length, meta["max_ctc_length"])
+    num_inputs = meta["num_outputs"]["data"]
     if self.num_inputs == 0:
       self.num_inputs = num_inputs[0]
     assert self.num_inputs == num_inputs[0], "wrong input dimension in file %s (expected %s got %s)" % (
                                              filename, self.num_inputs, num_inputs[0])
-    if 'targets/size' in fin:
-      num_outputs = {}
-      for k in fin['targets/size'].attrs:
-        if numpy.isscalar(fin['targets/size'].attrs[k]):
-          num_outputs[k] = (int(fin['targets/size'].attrs[k]), len(fin['targets/data'][k].shape))
-        else:  # hdf_dump will give directly as tuple
-          assert fin['targets/size'].attrs[k].shape == (2,)
-          num_outputs[k] = tuple([int(v) for v in fin['targets/size'].attrs[k]])
-    else:
-      num_outputs = {'classes': [int(fin.attrs[attr_numLabels]), 1]}
-    num_outputs["data"] = num_inputs
+    num_outputs = dict(meta["num_outputs"])
     if not self.num_outputs:
       self.num_outputs = num_outputs
     assert self.num_outputs == num_outputs, "wrong dimensions in file %s (expected %s got %s)" % (
                                             filename, self.num_outputs, num_outputs)
-    if 'ctcIndexTranscription' in fin:
+    if meta["has_ctc"]:
       if self.ctc_targets is None:
         self.ctc_targets = fin['ctcIndexTranscription'][...]
       else:
@@ -148,18 +226,267 @@ class HDFDataset(CachedDataset):
         self.ctc_targets = numpy.pad(self.ctc_targets, ((0,0),(0,pad_width)), 'constant', constant_values=-1)
         self.ctc_targets = numpy.concatenate((self.ctc_targets, tmp))
       self.num_running_chars = numpy.sum(self.ctc_targets != -1)
+    for name in meta["target_data_keys"]:
+      self.targets[name] = None
+    self.data_dtype.update(meta["data_dtype"])
+    assert len(self.target_keys) == len(seq_lengths[0]) - 1
+    if fin is not None and self.cache_byte_size_total_limit != 0:
+      fin.close()  # we always reopen them
+    return seq_lengths
+
+  def _get_file_index_from_hdf(self, fin):
+    """
+    Reads all the meta information from the HDF file which we need in :func:`add_file`,
+    except the times and the CTC transcriptions, which are read in :func:`add_file` directly.
+
+    :param h5py.File fin:
+    :return: dict with "meta" (plain Python objects), "seq_lengths", "seq_start" (numpy arrays), "tags"
+    :rtype: dict[str]
+    """
+    meta = {
+      "has_targets": 'targets' in fin, "has_times": 'times' in fin, "has_ctc": 'ctcIndexTranscription' in fin,
+      "max_ctc_length": None, "data_dtype": {}, "target_data_keys": []}
+    if 'targets' in fin:
+      meta["labels"] = {
+        k: [self._decode(item) for item in fin["targets/labels"][k][...].tolist()]
+        for k in fin['targets/labels']}
+      meta["target_keys"] = sorted(fin['targets/labels'].keys())
+    else:
+      meta["labels"] = {'classes': [self._decode(item) for item in fin["labels"][...].tolist()]}
+      meta["target_keys"] = ['classes']
+    seq_lengths = fin[attr_seqLengths][...]
+    if len(seq_lengths.shape) == 1:
+      seq_lengths = numpy.repeat(seq_lengths[:, None], len(meta["target_keys"]) + 1, axis=1)
+    seq_start = numpy.zeros((seq_lengths.shape[0] + 1, seq_lengths.shape[1]), dtype="int64")
+    numpy.cumsum(seq_lengths, axis=0, dtype="int64", out=seq_start[1:])
+    tags = SeqTagIndex.from_tags(fin["seqTags"][...])
+    if 'maxCTCIndexTranscriptionLength' in fin.attrs:
+      meta["max_ctc_length"] = int(fin.attrs['maxCTCIndexTranscriptionLength'])
+    if len(fin['inputs'].shape) == 1:  # sparse
+      num_inputs = [fin.attrs[attr_inputPattSize], 1]
+    else:
+      num_inputs = [fin['inputs'].shape[1], len(fin['inputs'].shape)] #fin.attrs[attr_inputPattSize]
+    if 'targets/size' in fin:
+      num_outputs = {}
+      for k in fin['targets/size'].attrs:
+        if numpy.isscalar(fin['targets/size'].attrs[k]):
+          num_outputs[k] = (int(fin['targets/size'].attrs[k]), len(fin['targets/data'][k].shape))
+        else:  # hdf_dump will give directly as tuple
+          assert fin['targets/size'].attrs[k].shape == (2,)
+          num_outputs[k] = tuple([int(v) for v in fin['targets/size'].attrs[k]])
+    else:
+      num_outputs = {'classes': [int(fin.attrs[attr_numLabels]), 1]}
+    num_outputs["data"] = num_inputs
     if 'targets' in fin:
       for name in fin['targets/data']:
-        self.data_dtype[str(name)] = str(fin['targets/data'][name].dtype)
-        self.targets[str(name)] = None
-        if str(name) not in self.num_outputs:
+        meta["target_data_keys"].append(str(name))
+        meta["data_dtype"][str(name)] = self._get_dtype_from_hdf(fin['targets/data'][name].dtype)
+        if str(name) not in num_outputs:
           ndim = len(fin['targets/data'][name].shape)
           dim = 1 if ndim == 1 else fin['targets/data'][name].shape[-1]
-          self.num_outputs[str(name)] = (dim, ndim)
-    self.data_dtype["data"] = str(fin['inputs'].dtype)
-    assert len(self.target_keys) == len(self._seq_lengths[0]) - 1
-    if self.cache_byte_size_total_limit > 0:
-      fin.close()  # we always reopen them
+          num_outputs[str(name)] = (dim, ndim)
+    meta["data_dtype"]["data"] = self._get_dtype_from_hdf(fin['inputs'].dtype)
+    meta["num_outputs"] = num_outputs
+    return {"meta": meta, "seq_lengths": seq_lengths, "seq_start": seq_start, "tags": tags}
+
+  _file_index_version = 3  # 3: SeqTagIndex file version 2
+
+  def _get_file_index_filename(self, filename, ext=".npz"):
+    """
+    :param str filename: HDF file
+    :param str ext: ".npz" for the index, ".tags" for the seq tags (:func:`SeqTagIndex.save`)
+    :return: filename of the index in index_cache_dir
+    :rtype: str
+    """
+    import hashlib
+    filename = os.path.abspath(filename)
+    return "%s/%s%s" % (self._index_cache_dir, hashlib.md5(filename.encode("utf8")).hexdigest(), ext)
+
+  def _get_file_index_info(self, filename):
+    """
+    :param str filename: HDF file
+    :return: info to validate the index. if the file changes, this changes
+    :rtype: dict[str]
+    """
+    st = os.stat(filename)
+    return {
+      "version": self._file_index_version,
+      "filename": os.path.abspath(filename), "size": st.st_size, "mtime": st.st_mtime}
+
+  def _load_file_index(self, filename):
+    """
+    Loads the index from index_cache_dir, if it exists and is valid for the file.
+    The seq tags are not loaded here but only on demand, see :func:`_get_file_tags`.
+
+    :param str filename: HDF file
+    :return: like :func:`_get_file_index_from_hdf`, without "tags", or None
+    :rtype: dict[str]|None
+    """
+    if not self._index_cache_dir:
+      return None
+    index_filename = self._get_file_index_filename(filename)
+    if not os.path.exists(index_filename) or not os.path.exists(self._get_file_index_filename(filename, ".tags")):
+      return None
+    import pickle
+    try:
+      with numpy.load(index_filename) as index:
+        if pickle.loads(index["info"].tobytes()) != self._get_file_index_info(filename):
+          print("HDFDataset: index %s is outdated for %s, recreate" % (index_filename, filename), file=log.v4)
+          return None
+        return {
+          "meta": pickle.loads(index["meta"].tobytes()),
+          "seq_lengths": index["seq_lengths"], "seq_start": index["seq_start"]}
+    except Exception as exc:
+      print("HDFDataset: cannot load index %s for %s: %s" % (index_filename, filename, exc), file=log.v3)
+      return None
+
+  def _save_file_index(self, filename, file_index):
+    """
+    Stores the index in index_cache_dir, if enabled.
+
+    :param str filename: HDF file
+    :param dict[str] file_index: from :func:`_get_file_index_from_hdf`
+    """
+    if not self._index_cache_dir:
+      return
+    meta = file_index["meta"]
+    if meta["has_times"] or meta["has_ctc"]:
+      return  # we would need to open the file anyway
+    import pickle
+    import tempfile
+    index_filename = self._get_file_index_filename(filename)
+    try:
+      if not os.path.exists(self._index_cache_dir):
+        os.makedirs(self._index_cache_dir)
+      # Write to a temp file and rename, such that other processes never see a partially written index.
+      fd, tmp_filename = tempfile.mkstemp(dir=self._index_cache_dir, suffix=".npz.tmp")
+      with os.fdopen(fd, "wb") as f:
+        numpy.savez(
+          f,
+          info=numpy.frombuffer(pickle.dumps(self._get_file_index_info(filename)), dtype="uint8"),
+          meta=numpy.frombuffer(pickle.dumps(meta), dtype="uint8"),
+          seq_lengths=file_index["seq_lengths"], seq_start=file_index["seq_start"])
+      # The tags first, because the existence of the index implies that the tags are there.
+      file_index["tags"].save(self._get_file_index_filename(filename, ".tags"))
+      os.rename(tmp_filename, index_filename)
+    except (IOError, OSError) as exc:
+      print("HDFDataset: cannot write index %s for %s: %s" % (index_filename, filename, exc), file=log.v3)
+
+  def _get_file_tags(self, file_idx):
+    """
+    :param int file_idx:
+    :return: seq tags of the file
+    :rtype: SeqTagIndex
+    """
+    tags = self._file_tags[file_idx]
+    if tags is None:  # we loaded the index in add_file
+      tags = SeqTagIndex.load(self._get_file_index_filename(self.files[file_idx], ".tags"))  # mmap
+      self._file_tags[file_idx] = tags
+    return tags
+
+  def _get_file_idx(self, real_seq_idx):
+    """
+    :param int real_seq_idx:
+    :return: file idx
+    :rtype: int
+    """
+    file_idx = bisect.bisect_right(self.file_start, real_seq_idx) - 1
+    assert 0 <= file_idx < len(self.files)
+    return file_idx
+
+  def _get_h5_file(self, file_idx):
+    """
+    Only used with disabled cache.
+    If the index was used in :func:`add_file`, the file is only opened here, on first use.
+
+    :param int file_idx:
+    :return: open file
+    :rtype: h5py.File
+    """
+    fin = self.h5_files[file_idx]
+    if fin is None:
+      with self._file_pool.lock:
+        fin = self.h5_files[file_idx]
+        if fin is None:
+          fin = h5py.File(self.files[file_idx], "r")
+          if self._use_mmap:
+            self._mmap_data[file_idx] = self._get_file_mmap_data(self.files[file_idx], fin)
+          self.h5_files[file_idx] = fin
+    return fin
+
+  def close(self):
+    """
+    Closes the HDF files which were opened by :func:`_load_seqs` (see :class:`HDFFilePool`).
+    They are reopened on demand, i.e. it is safe to use the dataset afterwards.
+    """
+    self._file_pool.close()
+
+  def __del__(self):
+    """
+    Closes HDF file handlers.
+    """
+    # noinspection PyBroadException
+    try:
+      self.close()
+    except Exception:  # e.g. __init__ failed, or at interpreter shutdown
+      pass
+
+  @staticmethod
+  def _get_dtype_from_hdf(dtype):
+    """
+    :param numpy.dtype dtype: of some data in the HDF file
+    :return: dtype which we provide. float16 (see float_dtype of the writers) is provided as float32
+    :rtype: str
+    """
+    if dtype == numpy.float16:
+      return "float32"
+    return str(dtype)
+
+  def _get_shared_mem_cache_key_info(self):
+    """
+    :rtype: list
+    """
+    info = super(HDFDataset, self)._get_shared_mem_cache_key_info()
+    return info + [[os.path.abspath(fn) for fn in self.files]]
+
+  @classmethod
+  def _get_file_mmap_data(cls, filename, fin):
+    """
+    :param str filename:
+    :param h5py.File fin:
+    :return: data key -> memmap, for all data which can be memory-mapped
+    :rtype: dict[str,numpy.ndarray]
+    """
+    datasets = {"data": fin['inputs']}
+    if 'targets' in fin:
+      for k in fin['targets/data']:
+        datasets[str(k)] = fin['targets/data/' + k]
+    mmap_data = {}
+    for key, dataset in datasets.items():
+      mmap = cls._mmap_h5_dataset(filename, dataset)
+      if mmap is not None:
+        mmap_data[key] = mmap
+      else:
+        print("HDFDataset: cannot memory-map %r in %s (chunked or compressed), will read via h5py" % (
+          dataset.name, filename), file=log.v4)
+    return mmap_data
+
+  @staticmethod
+  def _mmap_h5_dataset(filename, dataset):
+    """
+    :param str filename:
+    :param h5py.Dataset dataset:
+    :return: read-only memmap of the raw data, or None if the data is not stored uncompressed and contiguous
+    :rtype: numpy.memmap|None
+    """
+    if dataset.chunks is not None or dataset.compression is not None:
+      return None
+    if dataset.dtype.hasobject or dataset.size == 0:
+      return None
+    offset = dataset.id.get_offset()
+    if offset is None:  # storage not allocated
+      return None
+    return numpy.memmap(filename, dtype=dataset.dtype, mode="r", offset=offset, shape=dataset.shape)
 
   def _load_seqs(self, start, end):
     """
@@ -180,53 +507,125 @@ class HDFDataset(CachedDataset):
     selection = self.insert_alloc_interval(start, end)
     assert len(selection) <= end - start, "DEBUG: more sequences requested (" + str(len(selection)) + ") as required (" + str(end-start) + ")"
     self.preload_set |= set(range(start,end)) - set(selection)
-    file_info = [ [] for l in range(len(self.files)) ]; """ :type: list[list[int]] """
+    file_info = [ [] for l in range(len(self.files)) ]; """ :type: list[list[(int,int)]] """
     # file_info[i] is (sorted seq idx from selection, real seq idx)
     for idc in selection:
       if self.sample(idc):
         ids = self._seq_index[idc]
-        file_info[self.file_index[ids]].append((idc,ids))
+        file_info[self._get_file_idx(ids)].append((idc,ids))
       else:
         self.preload_set.add(idc)
     for i in range(len(self.files)):
       if len(file_info[i]) == 0:
         continue
-      if start == 0 or self.cache_byte_size_total_limit > 0:  # suppress with disabled cache
+      if start == 0 or self.cache_byte_size_total_limit != 0:  # suppress with disabled cache
         print("loading file %d/%d (seq range %i-%i)" % (i+1, len(self.files), start, end), self.files[i], file=log.v4)
-      fin = h5py.File(self.files[i], 'r')
-      inputs = fin['inputs']
-      targets = None
-      if 'targets' in fin:
-        targets = {k: fin['targets/data/' + k] for k in fin['targets/data']}
-      for idc, ids in file_info[i]:
-        s = ids - self.file_start[i]
-        p = self.file_seq_start[i][s]
-        l = self._seq_lengths[ids]
-        if 'targets' in fin:
-          for k in fin['targets/data']:
-            if self.targets[k] is None:
-              self.targets[k] = numpy.zeros(
-                (self._num_codesteps[self.target_keys.index(k)],) + targets[k].shape[1:], dtype=self.data_dtype[k]) - 1
-            ldx = self.target_keys.index(k) + 1
-            self.targets[k][self.get_seq_start(idc)[ldx]:self.get_seq_start(idc)[ldx] + l[ldx]] = targets[k][p[ldx] : p[ldx] + l[ldx]]
-        self._set_alloc_intervals_data(idc, data=inputs[p[0] : p[0] + l[0]])
-        self.preload_set.add(idc)
-      fin.close()
-    gc.collect()
+      with self._file_pool.lock:
+        fin = self._file_pool.get(self.files[i])
+        for s_start, s_end, seqs in self._get_file_read_ranges(i, file_info[i]):
+          self._load_file_seq_range(fin, i, s_start, s_end, seqs)
+
+  def _get_file_read_ranges(self, file_idx, seqs):
+    """
+    Merges adjacent seqs of one file into contiguous ranges, such that we can read each range at once.
+
+    :param int file_idx:
+    :param list[(int,int)] seqs: list of (sorted seq idx, real seq idx) from this file
+    :return: list of (start,end,seqs) with file seq idx range [start,end), and the seqs in that range
+    :rtype: list[(int,int,list[(int,int)])]
+    """
+    ranges = []
+    for idc, ids in sorted(seqs, key=lambda x: x[1]):
+      s = ids - self.file_start[file_idx]
+      if ranges and ranges[-1][1] == s:
+        ranges[-1][1] = s + 1
+        ranges[-1][2].append((idc, ids))
+      else:
+        ranges.append([s, s + 1, [(idc, ids)]])
+    return [tuple(r) for r in ranges]
+
+  def _load_file_seq_range(self, fin, file_idx, s_start, s_end, seqs):
+    """
+    Reads the file seq range [s_start,s_end) with a single read per data key,
+    and copies the seqs into the cache (self.alloc_intervals and self.targets).
+
+    :param h5py.File fin:
+    :param int file_idx:
+    :param int s_start: file seq idx, inclusive
+    :param int s_end: file seq idx, exclusive
+    :param list[(int,int)] seqs: list of (sorted seq idx, real seq idx), exactly covering this range
+    """
+    file_seq_start = self.file_seq_start[file_idx]
+    if 'targets' in fin:
+      for k in fin['targets/data']:
+        targets = fin['targets/data/' + k]
+        if self.targets[k] is None:
+          self.targets[k] = numpy.zeros(
+            (self._num_codesteps[self.target_keys.index(k)],) + targets.shape[1:], dtype=self.data_dtype[k]) - 1
+        ldx = self.target_keys.index(k) + 1
+        offset = file_seq_start[s_start][ldx]
+        block = self._read_block(targets, offset, file_seq_start[s_end][ldx])
+        for idc, ids in seqs:
+          p = file_seq_start[ids - self.file_start[file_idx]][ldx] - offset
+          l = self._seq_lengths[ids][ldx]
+          target_start = self.get_seq_start(idc)[ldx]
+          self.targets[k][target_start:target_start + l] = block[p:p + l]
+    offset = file_seq_start[s_start][0]
+    block = self._read_block(fin['inputs'], offset, file_seq_start[s_end][0])
+    for idc, ids in seqs:
+      p = file_seq_start[ids - self.file_start[file_idx]][0] - offset
+      self._set_alloc_intervals_data(idc, data=block[p:p + self._seq_lengths[ids][0]])
+      self.preload_set.add(idc)
+
+  def _read_block(self, dataset, start, end):
+    """
+    :param h5py.Dataset dataset:
+    :param int start:
+    :param int end:
+    :return: dataset[start:end]
+    :rtype: numpy.ndarray
+    """
+    block = dataset[start:end]
+    self._read_stats.add(num_bytes=block.nbytes)
+    return block
+
+  def get_read_stats(self):
+    """
+    :return: read stats of :func:`_load_seqs` for the current epoch
+    :rtype: HDFReadStats
+    """
+    return self._read_stats
+
+  def init_seq_order(self, epoch=None, seq_list=None):
+    """
+    :param int|None epoch:
+    :param list[str]|None seq_list:
+    :rtype: bool
+    """
+    if self._read_stats.num_reads > 0:
+      print("%s, epoch %s: %s" % (self, self._read_stats.epoch, self._read_stats), file=log.v4)
+    self._read_stats = HDFReadStats(epoch=epoch)
+    return super(HDFDataset, self).init_seq_order(epoch=epoch, seq_list=seq_list)
 
   def get_data(self, seq_idx, key):
-    if self.cache_byte_size_total_limit > 0:  # Use the cache?
+    if self.cache_byte_size_total_limit != 0:  # Use the cache?
       return super(HDFDataset, self).get_data(seq_idx, key)
 
     # Otherwise, directly read it from file now.
     real_seq_idx = self._seq_index[seq_idx]
-    file_idx = self.file_index[real_seq_idx]
-    fin = self.h5_files[file_idx]
+    file_idx = self._get_file_idx(real_seq_idx)
+    fin = self._get_h5_file(file_idx)
 
     real_file_seq_idx = real_seq_idx - self.file_start[file_idx]
     pos = self.file_seq_start[file_idx][real_file_seq_idx]
     seq_len = self._seq_lengths[real_seq_idx]
 
+    if self._use_mmap and key in self._mmap_data[file_idx]:
+      ldx = 0 if key == "data" else (self.target_keys.index(key) + 1)
+      mmap = self._mmap_data[file_idx][key]
+      data = numpy.asarray(mmap[pos[ldx]:pos[ldx] + seq_len[ldx]])  # view, no copy
+      return data.astype(self.data_dtype[key], copy=False)  # copy only for float16
+
     if key == "data":
       inputs = fin['inputs']
       data = inputs[pos[0]:pos[0] + seq_len[0]]
@@ -235,32 +634,40 @@ class HDFDataset(CachedDataset):
       targets = fin['targets/data/' + key]
       ldx = self.target_keys.index(key) + 1
       data = targets[pos[ldx]:pos[ldx] + seq_len[ldx]]
-    return data
+    return data.astype(self.data_dtype[key], copy=False)
 
   def get_input_data(self, sorted_seq_idx):
-    if self.cache_byte_size_total_limit > 0:  # Use the cache?
+    if self.cache_byte_size_total_limit != 0:  # Use the cache?
       return super(HDFDataset, self).get_input_data(sorted_seq_idx)
     return self.get_data(sorted_seq_idx, "data")
 
   def get_targets(self, target, sorted_seq_idx):
-    if self.cache_byte_size_total_limit > 0:  # Use the cache?
+    if self.cache_byte_size_total_limit != 0:  # Use the cache?
       return super(HDFDataset, self).get_targets(target, sorted_seq_idx)
     return self.get_data(sorted_seq_idx, target)
 
   def _get_tag_by_real_idx(self, real_idx):
-    s = self._tags[real_idx]
-    s = self._decode(s)
-    return s
+    file_idx = self._get_file_idx(real_idx)
+    return self._get_file_tags(file_idx)[real_idx - self.file_start[file_idx]]
+
+  def _update_tag_idx(self):
+    if self._tag_idx is not None:
+      return
+    self._tag_idx = self.get_all_tags()
 
   def get_tag(self, sorted_seq_idx):
     ids = self._seq_index[self._index_map[sorted_seq_idx]]
     return self._get_tag_by_real_idx(ids)
 
   def get_all_tags(self):
-    return list(map(self._decode, self._tags))
+    """
+    :return: list-like
+    :rtype: SeqTagIndex
+    """
+    return SeqTagIndex.concat([self._get_file_tags(file_idx) for file_idx in range(len(self.files))])
 
   def get_total_num_seqs(self):
-    return len(self._tags)
+    return self._num_seqs
 
   def is_data_sparse(self, key):
     if self.get_data_dtype(key).startswith("int"):
@@ -755,12 +1162,14 @@ class SiameseHDFDataset(CachedDataset2):
 
 
 class SimpleHDFWriter:
-  def __init__(self, filename, dim, labels=None, ndim=None):
+  def __init__(self, filename, dim, labels=None, ndim=None, float_dtype=None):
     """
     :param str filename:
     :param int|None dim:
     :param int ndim: counted without batch
     :param list[str]|None labels:
+    :param str|None float_dtype: e.g. "float16", to store all float data with this dtype.
+      :class:`HDFDataset` provides float16 data as float32 again.
     """
     if ndim is None:
       if dim is None:
@@ -771,6 +1180,7 @@ class SimpleHDFWriter:
     self.dim = dim
     self.ndim = ndim
     self.labels = labels
+    self.float_dtype = float_dtype
     if labels:
       assert len(labels) == dim
     self._file = h5py.File(filename, "w")
@@ -798,6 +1208,7 @@ class SimpleHDFWriter:
     :param numpy.ndarray raw_data: shape=(time,data) or shape=(time,)
     """
     assert raw_data.ndim >= 1
+    raw_data = self._convert_float(raw_data)
     name = "inputs"
     if name not in self._datasets:
       self._datasets[name] = self._file.create_dataset(
@@ -826,6 +1237,8 @@ class SimpleHDFWriter:
     assert raw_data.ndim > 0 and raw_data.shape[0] > 0
     if dtype:
       raw_data = raw_data.astype(dtype)
+    else:
+      raw_data = self._convert_float(raw_data)
     if dim is None:
       if raw_data.ndim > 1:
         dim = raw_data.shape[-1]
@@ -861,6 +1274,16 @@ class SimpleHDFWriter:
     hdf_data = self._datasets[name]
     hdf_data[offset:] = raw_data
 
+  def _convert_float(self, raw_data):
+    """
+    :param numpy.ndarray raw_data:
+    :return: raw_data, with float_dtype if it is float data
+    :rtype: numpy.ndarray
+    """
+    if self.float_dtype and raw_data.dtype.kind == "f":
+      return raw_data.astype(self.float_dtype)
+    return raw_data
+
   def insert_batch(self, inputs, seq_len, seq_tag, extra=None):
     """
     :param numpy.ndarray inputs: shape=(n_batch,time,data) (or (n_batch,time), or (n_batch,time1,time2), ...)
@@ -924,17 +1347,30 @@ class SimpleHDFWriter:
 
 
 class HDFDatasetWriter:
-  def __init__(self, filename):
+  def __init__(self, filename, float_dtype=None):
     """
     :param str filename: for the HDF to write
+    :param str|None float_dtype: e.g. "float16", to store all float data with this dtype.
+      :class:`HDFDataset` provides float16 data as float32 again.
     """
     print("Creating HDF dataset file %s" % filename, file=log.v3)
     self.filename = filename
+    self.float_dtype = float_dtype
     self.file = h5py.File(filename, "w")
 
   def close(self):
     self.file.close()
 
+  def _get_hdf_dtype(self, dtype):
+    """
+    :param str dtype: of the dataset
+    :return: dtype in the HDF file
+    :rtype: str
+    """
+    if self.float_dtype and numpy.dtype(dtype).kind == "f":
+      return self.float_dtype
+    return dtype
+
   def dump_from_dataset(self, dataset, epoch=1, start_seq=0, end_seq=float("inf"), use_progress_bar=True):
     """
     :param Dataset dataset: could be any dataset implemented as child of Dataset
@@ -1046,10 +1482,11 @@ class HDFDatasetWriter:
     for data_key in data_keys:
       if data_key == default_data_input_key:
         hdf_dataset.create_dataset(
-          'inputs', shape=shapes[data_key], dtype=dataset.get_data_dtype(data_key))
+          'inputs', shape=shapes[data_key], dtype=self._get_hdf_dtype(dataset.get_data_dtype(data_key)))
       else:
         hdf_dataset['targets/data'].create_dataset(
-          hdf_data_key_map[data_key], shape=shapes[data_key], dtype=dataset.get_data_dtype(data_key))
+          hdf_data_key_map[data_key], shape=shapes[data_key],
+          dtype=self._get_hdf_dtype(dataset.get_data_dtype(data_key)))
         hdf_dataset['targets/size'].attrs[hdf_data_key_map[data_key]] = dataset.num_outputs[data_key]
       if data_key in dataset.labels:
         labels = dataset.labels[data_key]
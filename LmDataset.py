@@ -28,6 +28,10 @@ class LmDataset(CachedDataset2):
   Reads simple txt files.
   """
 
+  TokenCacheStatusOk = 0
+  TokenCacheStatusSkipped = 1
+  TokenCacheStatusIgnored = 2  # "</s>"
+
   def __init__(self,
                corpus_file,
                orth_symbols_file=None,
@@ -45,6 +49,9 @@ class LmDataset(CachedDataset2):
                error_on_invalid_seq=True,
                add_delayed_seq_data=False,
                delayed_seq_data_start_symbol="[START]",
+               streaming=False,
+               line_index_dir=None,
+               token_cache_dir=None,
                **kwargs):
     """
     After initialization, the corpus is represented by self.orths (as a list of sequences).
@@ -69,6 +76,13 @@ class LmDataset(CachedDataset2):
     :param bool add_delayed_seq_data: will add another data-key "delayed" which will have the sequence
       delayed_seq_data_start_symbol + original_sequence[:-1]
     :param str delayed_seq_data_start_symbol: used for add_delayed_seq_data
+    :param bool streaming: instead of loading the whole corpus into memory (self.orths),
+      use a persisted line-offset index (see :class:`LineIndexedCorpus`) and read the lines when needed.
+      only for line-based txt files (optionally gzip).
+    :param str|None line_index_dir: for streaming, where to store the line index. see :class:`LineIndexedCorpus`
+    :param str|None token_cache_dir: if given, the corpus is tokenized only once,
+      and stored in this dir as a memory-mapped :class:`TokenIdCache`, keyed by the vocab file hash and the options.
+      later runs do not need to read the corpus at all. not supported with phone_info.
     """
     super(LmDataset, self).__init__(**kwargs)
 
@@ -171,21 +185,88 @@ class LmDataset(CachedDataset2):
       self.num_outputs["delayed"] = self.num_outputs["data"]
       self.labels["delayed"] = self.labels["data"]
 
-    if isinstance(corpus_file, list):  # If a list of files is provided, concatenate all.
-      self.orths = []
-      for file_name in corpus_file:
-        self.orths += read_corpus(file_name)
+    self.orths = None  # type: typing.Optional[typing.List[str]]
+    self.corpora = None  # type: typing.Optional[typing.List[LineIndexedCorpus]]
+    self._corpora_start_idx = None  # type: typing.Optional[numpy.ndarray]
+    self._token_cache = None  # type: typing.Optional[TokenIdCache]
+    self._unknown_symbol_idx = None  # type: typing.Optional[int]
+    if self.orth_symbols:
+      self._unknown_symbol_idx = self.orth_symbols_map.get(self.unknown_symbol)
+    if token_cache_dir:
+      assert not self.seq_gen, "LmDataset: token_cache_dir not supported with phone_info"
+      corpus_files = corpus_file if isinstance(corpus_file, list) else [corpus_file]
+      self._token_cache = TokenIdCache(
+        cache_dir=token_cache_dir, name="lm-%s" % os.path.basename(corpus_files[0]),
+        info={
+          "corpus_files": [TokenIdCache.get_file_info(fn) for fn in corpus_files],
+          "vocab_hash": TokenIdCache.get_file_hash(orth_symbols_file or orth_symbols_map_file),
+          "replace_map_hash": TokenIdCache.get_file_hash(orth_replace_map_file) if orth_replace_map_file else None,
+          "parse_orth_opts": self.parse_orth_opts, "unknown_symbol": self.unknown_symbol,
+          "auto_replace_unknown_symbol": auto_replace_unknown_symbol, "error_on_invalid_seq": error_on_invalid_seq})
+    if self._token_cache is not None and self._token_cache.load():
+      self._num_orths = len(self._token_cache)
+    elif streaming:
+      self.corpora = []
+      for file_name in (corpus_file if isinstance(corpus_file, list) else [corpus_file]):
+        assert not _is_bliss(file_name), "LmDataset: streaming not supported for Bliss XML corpus %r" % file_name
+        self.corpora.append(LineIndexedCorpus(file_name, index_dir=line_index_dir))
+      self._corpora_start_idx = numpy.cumsum([0] + [len(corpus) for corpus in self.corpora])
+      self._num_orths = int(self._corpora_start_idx[-1])
     else:
-      self.orths = read_corpus(corpus_file)
+      if isinstance(corpus_file, list):  # If a list of files is provided, concatenate all.
+        self.orths = []
+        for file_name in corpus_file:
+          self.orths += read_corpus(file_name)
+      else:
+        self.orths = read_corpus(corpus_file)
+      self._num_orths = len(self.orths)
+    if self._token_cache is not None and self._token_cache.tokens is None:
+      self._build_token_cache()
+      self.orths = self.corpora = None  # not needed anymore
     # It's only estimated because we might filter some out or so.
-    self._estimated_num_seqs = len(self.orths) // self.partition_epoch
-    print("  done, loaded %i sequences" % len(self.orths), file=log.v4)
+    self._estimated_num_seqs = self._num_orths // self.partition_epoch
+    if self._token_cache is not None:
+      print("  done, %i sequences in token cache" % self._num_orths, file=log.v4)
+    else:
+      print("  done, %s %i sequences" % ("indexed" if streaming else "loaded", self._num_orths), file=log.v4)
 
     self.next_orth_idx = 0
     self.next_seq_idx = 0
     self.num_skipped = 0
     self.num_unknown = 0
 
+  def _get_corpus_and_line_idx(self, orth_idx):
+    """
+    :param int orth_idx:
+    :return: corpus, line idx in that corpus
+    :rtype: (LineIndexedCorpus, int)
+    """
+    corpus_idx = int(numpy.searchsorted(self._corpora_start_idx, orth_idx, side="right")) - 1
+    return self.corpora[corpus_idx], orth_idx - int(self._corpora_start_idx[corpus_idx])
+
+  def _get_orth(self, orth_idx):
+    """
+    :param int orth_idx:
+    :rtype: str
+    """
+    if self.orths is not None:
+      return self.orths[orth_idx]
+    corpus, line_idx = self._get_corpus_and_line_idx(orth_idx)
+    return corpus.get_line(line_idx)
+
+  def _get_orth_len(self, orth_idx):
+    """
+    :param int orth_idx:
+    :return: len(self._get_orth(orth_idx))
+    :rtype: int
+    """
+    if self._token_cache is not None:
+      return int(self._token_cache.extra["orth_lens"][orth_idx])
+    if self.orths is not None:
+      return len(self.orths[orth_idx])
+    corpus, line_idx = self._get_corpus_and_line_idx(orth_idx)
+    return corpus.get_line_len(line_idx)
+
   def get_data_keys(self):
     """
     :rtype: list[str]
@@ -232,7 +313,7 @@ class LmDataset(CachedDataset2):
       self.seq_order = [int(s[len(self._tag_prefix):]) for s in seq_list]
     else:
       self.seq_order = self.get_seq_order_for_epoch(
-        epoch=epoch, num_seqs=len(self.orths), get_seq_len=lambda i: len(self.orths[i]))
+        epoch=epoch, num_seqs=self._num_orths, get_seq_len=self._get_orth_len)
     self.next_orth_idx = 0
     self.next_seq_idx = 0
     self.num_skipped = 0
@@ -259,6 +340,96 @@ class LmDataset(CachedDataset2):
     if not self.log_auto_replace_unknown_symbols:
       print("LmDataset: will stop logging about auto-replace with unknown symbol now", file=log.v4)
 
+  def _orth_to_data(self, orth):
+    """
+    :param str orth:
+    :return: label indices, or None if the seq is invalid and should be skipped
+    :rtype: numpy.ndarray|None
+    """
+    if self.seq_gen:
+      try:
+        phones = self.seq_gen.generate_seq(orth)
+      except KeyError as e:
+        if self.log_skipped_seqs:
+          print("LmDataset: skipping sequence %r because of missing lexicon entry: %s" % (orth, e), file=log.v4)
+          self._reduce_log_skipped_seqs()
+        if self.error_on_invalid_seq:
+          raise Exception("LmDataset: invalid seq %r, missing lexicon entry %r" % (orth, e))
+        return None
+      return self.seq_gen.seq_to_class_idxs(phones, dtype=self.dtype)
+
+    elif self.orth_symbols:
+      orth_syms = parse_orthography(orth, **self.parse_orth_opts)
+      while True:
+        orth_syms = sum([self.orth_replace_map.get(s, [s]) for s in orth_syms], [])
+        i = 0
+        while i < len(orth_syms) - 1:
+          if orth_syms[i:i+2] == [" ", " "]:
+            orth_syms[i:i+2] = [" "]  # collapse two spaces
+          else:
+            i += 1
+        if self.auto_replace_unknown_symbol:
+          try:
+            list(map(self.orth_symbols_map.__getitem__, orth_syms))  # convert to list to trigger map (it's lazy)
+          except KeyError as e:
+            if sys.version_info >= (3, 0):
+              orth_sym = e.args[0]
+            else:
+              # noinspection PyUnresolvedReferences
+              orth_sym = e.message
+            if self.log_auto_replace_unknown_symbols:
+              print("LmDataset: unknown orth symbol %r, adding to orth_replace_map as %r" % (
+                orth_sym, self.unknown_symbol), file=log.v3)
+              self._reduce_log_auto_replace_unknown_symbols()
+            self.orth_replace_map[orth_sym] = [self.unknown_symbol] if self.unknown_symbol is not None else []
+            continue  # try this seq again with updated orth_replace_map
+        break
+      self.num_unknown += orth_syms.count(self.unknown_symbol)
+      if self.word_based:
+        orth_debug_str = repr(orth_syms)
+      else:
+        orth_debug_str = repr("".join(orth_syms))
+      try:
+        return numpy.array(list(map(self.orth_symbols_map.__getitem__, orth_syms)), dtype=self.dtype)
+      except KeyError as e:
+        if self.log_skipped_seqs:
+          print("LmDataset: skipping sequence %s because of missing orth symbol: %s" % (orth_debug_str, e),
+                file=log.v4)
+          self._reduce_log_skipped_seqs()
+        if self.error_on_invalid_seq:
+          raise Exception("LmDataset: invalid seq %s, missing orth symbol %s" % (orth_debug_str, e))
+        return None
+
+    else:
+      assert False
+
+  def _build_token_cache(self):
+    """
+    Tokenizes the whole corpus once and writes self._token_cache.
+    """
+    self.num_unknown = 0  # will be counted by _orth_to_data, but not relevant here
+    status = numpy.zeros((self._num_orths,), dtype="int8")  # see TokenCacheStatus*
+    orth_lens = numpy.zeros((self._num_orths,), dtype="int32")  # for the seq order, as without the cache
+
+    def iter_seqs():
+      """
+      :rtype: typing.Iterator[numpy.ndarray]
+      """
+      for orth_idx in range(self._num_orths):
+        orth = self._get_orth(orth_idx)
+        orth_lens[orth_idx] = len(orth)
+        data = None
+        if orth == "</s>":
+          status[orth_idx] = self.TokenCacheStatusIgnored
+        else:
+          data = self._orth_to_data(orth)
+          if data is None:
+            status[orth_idx] = self.TokenCacheStatusSkipped
+        yield data if data is not None else numpy.zeros((0,), dtype="int32")
+
+    # Note that status and orth_lens are filled by iter_seqs, before the extra arrays are written.
+    self._token_cache.build(iter_seqs(), extra={"status": status, "orth_lens": orth_lens})
+
   def _collect_single_seq(self, seq_idx):
     """
     :type seq_idx: int
@@ -273,70 +444,32 @@ class LmDataset(CachedDataset2):
         return None
       assert self.next_seq_idx == seq_idx, "We expect that we iterate through all seqs."
       true_idx = self.seq_order[self.next_orth_idx]
-      orth = self.orths[true_idx]  # get sequence for the next index given by seq_order
       seq_tag = (self._tag_prefix + str(true_idx))
       self.next_orth_idx += 1
-      if orth == "</s>":
-        continue  # special sentence end symbol. empty seq, ignore.
-
-      if self.seq_gen:
-        try:
-          phones = self.seq_gen.generate_seq(orth)
-        except KeyError as e:
-          if self.log_skipped_seqs:
-            print("LmDataset: skipping sequence %r because of missing lexicon entry: %s" % (orth, e), file=log.v4)
-            self._reduce_log_skipped_seqs()
-          if self.error_on_invalid_seq:
-            raise Exception("LmDataset: invalid seq %r, missing lexicon entry %r" % (orth, e))
-          self.num_skipped += 1
-          continue  # try another seq
-        data = self.seq_gen.seq_to_class_idxs(phones, dtype=self.dtype)
-
-      elif self.orth_symbols:
-        orth_syms = parse_orthography(orth, **self.parse_orth_opts)
-        while True:
-          orth_syms = sum([self.orth_replace_map.get(s, [s]) for s in orth_syms], [])
-          i = 0
-          while i < len(orth_syms) - 1:
-            if orth_syms[i:i+2] == [" ", " "]:
-              orth_syms[i:i+2] = [" "]  # collapse two spaces
-            else:
-              i += 1
-          if self.auto_replace_unknown_symbol:
-            try:
-              list(map(self.orth_symbols_map.__getitem__, orth_syms))  # convert to list to trigger map (it's lazy)
-            except KeyError as e:
-              if sys.version_info >= (3, 0):
-                orth_sym = e.args[0]
-              else:
-                # noinspection PyUnresolvedReferences
-                orth_sym = e.message
-              if self.log_auto_replace_unknown_symbols:
-                print("LmDataset: unknown orth symbol %r, adding to orth_replace_map as %r" % (
-                  orth_sym, self.unknown_symbol), file=log.v3)
-                self._reduce_log_auto_replace_unknown_symbols()
-              self.orth_replace_map[orth_sym] = [self.unknown_symbol] if self.unknown_symbol is not None else []
-              continue  # try this seq again with updated orth_replace_map
-          break
-        self.num_unknown += orth_syms.count(self.unknown_symbol)
-        if self.word_based:
-          orth_debug_str = repr(orth_syms)
-        else:
-          orth_debug_str = repr("".join(orth_syms))
-        try:
-          data = numpy.array(list(map(self.orth_symbols_map.__getitem__, orth_syms)), dtype=self.dtype)
-        except KeyError as e:
-          if self.log_skipped_seqs:
-            print("LmDataset: skipping sequence %s because of missing orth symbol: %s" % (orth_debug_str, e),
-                  file=log.v4)
-            self._reduce_log_skipped_seqs()
+
+      if self._token_cache is not None:
+        status = self._token_cache.extra["status"][true_idx]
+        if status == self.TokenCacheStatusIgnored:
+          continue
+        if status == self.TokenCacheStatusSkipped:
           if self.error_on_invalid_seq:
-            raise Exception("LmDataset: invalid seq %s, missing orth symbol %s" % (orth_debug_str, e))
+            raise Exception("LmDataset: invalid seq %s (marked as invalid in token cache)" % seq_tag)
           self.num_skipped += 1
-          continue  # try another seq
+          continue
+        data = self._token_cache.get_seq(true_idx)
+        if self._unknown_symbol_idx is not None:
+          self.num_unknown += int(numpy.count_nonzero(data == self._unknown_symbol_idx))
+        if data.dtype != numpy.dtype(self.dtype):
+          data = data.astype(self.dtype)
 
       else:
-        assert False
+        orth = self._get_orth(true_idx)  # get sequence for the next index given by seq_order
+        if orth == "</s>":
+          continue  # special sentence end symbol. empty seq, ignore.
+        data = self._orth_to_data(orth)
+        if data is None:
+          self.num_skipped += 1
+          continue  # try another seq
 
       targets = {}
       for i in range(self.add_random_phone_seqs):
@@ -451,6 +584,334 @@ def read_corpus(filename):
   return out_list
 
 
+class LineIndexedCorpus(object):
+  """
+  Line-based txt corpus (optionally gzip) with random access to single lines.
+  On first usage, we go once through the file and store the byte offset of every (non-empty) line
+  in an index file next to it (or in a temp dir), which is reused as long as the corpus file does not change.
+  The index is memory-mapped, so only the lines which are actually used are read.
+
+  Gzip files are not seekable, thus for those we additionally write the uncompressed lines
+  in blocks which are compressed independently (zlib), i.e. a seekable block index.
+  """
+
+  _version = 1
+
+  def __init__(self, filename, index_dir=None, block_size=64 * 1024):
+    """
+    :param str filename: line-based txt, optionally .gz
+    :param str|None index_dir: where to store the index files ({prefix}.json, {prefix}.npy, maybe {prefix}.blocks).
+      by default next to filename, or in the temp dir if that dir is not writeable.
+    :param int block_size: for gzip, uncompressed size of the blocks
+    """
+    self.filename = filename
+    self.is_gzip = filename.endswith(".gz")
+    self.index_prefix = self._get_index_prefix(filename, index_dir=index_dir)
+    self.block_size = block_size
+    self._file = None
+    self._file_pid = None
+    self._block_cache_idx = None  # type: typing.Optional[int]
+    self._block_cache_data = None  # type: typing.Optional[bytes]
+    self.lines = None  # type: typing.Optional[numpy.ndarray]  # struct (offset, size, len) per line, memory-mapped
+    self.block_offsets = None  # type: typing.Optional[numpy.ndarray]  # compressed offset, uncompressed offset
+    if not self._load_index():
+      self._build_index()
+      assert self._load_index()
+
+  def __len__(self):
+    return len(self.lines)
+
+  @staticmethod
+  def _get_index_prefix(filename, index_dir=None):
+    """
+    :param str filename:
+    :param str|None index_dir:
+    :rtype: str
+    """
+    if not index_dir:
+      if os.access(os.path.dirname(os.path.abspath(filename)), os.W_OK):
+        return filename + ".line-index"
+      from Util import get_temp_dir
+      index_dir = "%s/returnn-lm-line-index" % get_temp_dir()
+    if not os.path.exists(index_dir):
+      os.makedirs(index_dir)
+    import hashlib
+    return "%s/%s.%s.line-index" % (
+      index_dir, os.path.basename(filename), hashlib.md5(os.path.abspath(filename).encode("utf8")).hexdigest())
+
+  def _get_source_info(self):
+    """
+    :return: info about the corpus file. if this changes, we rebuild the index
+    :rtype: dict[str]
+    """
+    st = os.stat(self.filename)
+    return {"version": self._version, "size": st.st_size, "mtime": st.st_mtime, "block_size": self.block_size}
+
+  def _load_index(self):
+    """
+    :return: whether the index exists and is valid
+    :rtype: bool
+    """
+    import json
+    if not os.path.exists(self.index_prefix + ".json"):
+      return False
+    with open(self.index_prefix + ".json") as f:
+      info = json.load(f)
+    if info["source"] != self._get_source_info():
+      print("LineIndexedCorpus: %s changed, rebuild index" % self.filename, file=log.v4)
+      return False
+    self.lines = numpy.load(self.index_prefix + ".npy", mmap_mode="r")
+    assert len(self.lines) == info["num_lines"]
+    if self.is_gzip:
+      self.block_offsets = numpy.array(info["block_offsets"], dtype="int64").reshape((-1, 2))
+    return True
+
+  def _build_index(self):
+    """
+    Goes once through the corpus and writes the index files.
+    """
+    import json
+    import zlib
+    from array import array
+    print("LineIndexedCorpus: build line index for %s in %s" % (self.filename, self.index_prefix), file=log.v4)
+    start_time = time.time()
+    source_info = self._get_source_info()
+    offsets, sizes, lens = array("Q"), array("I"), array("I")
+    block_offsets = []  # compressed offset, uncompressed offset
+    tmp_postfix = ".tmp.%i" % os.getpid()
+    f = open(self.filename, "rb")
+    blocks_file = None
+    if self.is_gzip:
+      f = gzip.GzipFile(fileobj=f)
+      blocks_file = open(self.index_prefix + ".blocks" + tmp_postfix, "wb")
+    block = []
+    block_size = 0
+    offset = 0
+    block_start_offset = 0
+    for raw_line in f:
+      line = raw_line
+      try:
+        line = line.decode("utf8")
+      except UnicodeDecodeError:
+        line = line.decode("latin_1")
+      line = line.strip()
+      if line:
+        offsets.append(offset)
+        sizes.append(len(raw_line))
+        lens.append(len(line))
+      offset += len(raw_line)
+      if blocks_file:
+        block.append(raw_line)
+        block_size += len(raw_line)
+        if block_size >= self.block_size:
+          block_offsets.append((blocks_file.tell(), block_start_offset))
+          blocks_file.write(zlib.compress(b"".join(block)))
+          block, block_size, block_start_offset = [], 0, offset
+    f.close()
+    if blocks_file:
+      if block:
+        block_offsets.append((blocks_file.tell(), block_start_offset))
+        blocks_file.write(zlib.compress(b"".join(block)))
+      block_offsets.append((blocks_file.tell(), offset))  # end marker
+      blocks_file.close()
+      os.rename(self.index_prefix + ".blocks" + tmp_postfix, self.index_prefix + ".blocks")
+    lines = numpy.zeros((len(offsets),), dtype=[("offset", "<u8"), ("size", "<u4"), ("len", "<u4")])
+    lines["offset"] = numpy.frombuffer(offsets, dtype="uint64")
+    lines["size"] = numpy.frombuffer(sizes, dtype="uint32")
+    lines["len"] = numpy.frombuffer(lens, dtype="uint32")
+    with open(self.index_prefix + ".npy" + tmp_postfix, "wb") as f:
+      numpy.save(f, lines)
+    os.rename(self.index_prefix + ".npy" + tmp_postfix, self.index_prefix + ".npy")
+    info = {"source": source_info, "num_lines": len(lines)}
+    if self.is_gzip:
+      info["block_offsets"] = [list(map(int, o)) for o in block_offsets]
+    with open(self.index_prefix + ".json" + tmp_postfix, "w") as f:
+      json.dump(info, f)
+    os.rename(self.index_prefix + ".json" + tmp_postfix, self.index_prefix + ".json")
+    print("  done, %i lines, %.1f secs" % (len(lines), time.time() - start_time), file=log.v4)
+
+  def _get_file(self):
+    """
+    :return: opened file, for the current process (we might have been forked)
+    :rtype: typing.BinaryIO
+    """
+    if self._file is None or self._file_pid != os.getpid():
+      if self.is_gzip:
+        self._file = open(self.index_prefix + ".blocks", "rb")
+      else:
+        self._file = open(self.filename, "rb")
+      self._file_pid = os.getpid()
+      self._block_cache_idx = None
+    return self._file
+
+  def _read_raw(self, offset, size):
+    """
+    :param int offset: in the uncompressed corpus
+    :param int size:
+    :rtype: bytes
+    """
+    f = self._get_file()
+    if not self.is_gzip:
+      f.seek(offset)
+      return f.read(size)
+    import zlib
+    block_idx = int(numpy.searchsorted(self.block_offsets[:, 1], offset, side="right")) - 1
+    if block_idx != self._block_cache_idx:
+      f.seek(self.block_offsets[block_idx, 0])
+      self._block_cache_data = zlib.decompress(
+        f.read(self.block_offsets[block_idx + 1, 0] - self.block_offsets[block_idx, 0]))
+      self._block_cache_idx = block_idx
+    offset -= self.block_offsets[block_idx, 1]
+    return self._block_cache_data[offset:offset + size]
+
+  def get_line(self, line_idx):
+    """
+    :param int line_idx: index of the non-empty line
+    :return: line, stripped, like in :func:`read_corpus`
+    :rtype: str
+    """
+    entry = self.lines[line_idx]
+    line = self._read_raw(int(entry["offset"]), int(entry["size"]))
+    try:
+      line = line.decode("utf8")
+    except UnicodeDecodeError:
+      line = line.decode("latin_1")
+    return line.strip()
+
+  def get_line_len(self, line_idx):
+    """
+    :param int line_idx:
+    :return: len(self.get_line(line_idx)), without reading it
+    :rtype: int
+    """
+    return int(self.lines[line_idx]["len"])
+
+
+class TokenIdCache(object):
+  """
+  Pre-tokenized data on disk: all label indices of all sequences in one flat int32 file,
+  and the offsets of every sequence (num_seqs + 1),
+  both memory-mapped, i.e. :func:`get_seq` is a zero-copy slice.
+  The cache dir name contains a hash of all the given info (vocab file hash, corpus file, options),
+  so if any of that changes, a new cache is created.
+  """
+
+  def __init__(self, cache_dir, name, info):
+    """
+    :param str cache_dir:
+    :param str name: e.g. "lm-corpus.txt" or "translation-source.train"
+    :param dict[str] info: everything which determines the token ids. must be JSON serializable
+    """
+    import json
+    import hashlib
+    self.info = info
+    info_hash = hashlib.sha1(json.dumps(info, sort_keys=True).encode("utf8")).hexdigest()
+    self.path = "%s/%s.%s" % (cache_dir, name, info_hash[:16])
+    self.tokens = None  # type: typing.Optional[numpy.ndarray]
+    self.offsets = None  # type: typing.Optional[numpy.ndarray]
+    self.extra = {}  # type: typing.Dict[str,numpy.ndarray]
+
+  def __len__(self):
+    return len(self.offsets) - 1
+
+  def __getitem__(self, seq_idx):
+    return self.get_seq(seq_idx)
+
+  @staticmethod
+  def get_file_hash(filename):
+    """
+    :param str filename:
+    :return: hash of the content, e.g. of a vocab file
+    :rtype: str
+    """
+    import hashlib
+    h = hashlib.sha1()
+    with open(filename, "rb") as f:
+      while True:
+        buf = f.read(1024 * 1024)
+        if not buf:
+          break
+        h.update(buf)
+    return h.hexdigest()
+
+  @staticmethod
+  def get_file_info(filename):
+    """
+    :param str filename: e.g. corpus file
+    :return: cheap identification of the file (we don't want to read a huge corpus only to get a hash)
+    :rtype: dict[str]
+    """
+    st = os.stat(filename)
+    return {"filename": os.path.abspath(filename), "size": st.st_size, "mtime": st.st_mtime}
+
+  def load(self):
+    """
+    :return: whether the cache exists (then it is loaded now)
+    :rtype: bool
+    """
+    if not os.path.exists(self.path + "/info.json"):  # written last
+      return False
+    import json
+    with open(self.path + "/info.json") as f:
+      info = json.load(f)
+    self.offsets = numpy.load(self.path + "/offsets.npy", mmap_mode="r")
+    num_tokens = int(self.offsets[-1])
+    if num_tokens:
+      self.tokens = numpy.memmap(self.path + "/tokens.int32", dtype="<i4", mode="r", shape=(num_tokens,))
+    else:  # cannot memmap empty file
+      self.tokens = numpy.zeros((0,), dtype="int32")
+    self.extra = {key: numpy.load("%s/%s.npy" % (self.path, key), mmap_mode="r") for key in info["extra"]}
+    print("TokenIdCache: loaded %s, %i seqs, %i tokens" % (self.path, len(self), num_tokens), file=log.v4)
+    return True
+
+  def build(self, seqs, extra=None):
+    """
+    Writes the cache, and loads it afterwards.
+
+    :param typing.Iterable[numpy.ndarray] seqs: 1D label indices
+    :param dict[str,numpy.ndarray]|None extra: further per-seq info, e.g. seq lens, stored as npy
+    """
+    import json
+    import shutil
+    print("TokenIdCache: build %s" % self.path, file=log.v4)
+    tmp_path = "%s.tmp.%i" % (self.path, os.getpid())
+    os.makedirs(tmp_path)
+    from array import array
+    offsets = array("q", [0])
+    with open(tmp_path + "/tokens.int32", "wb") as f:
+      for seq in seqs:
+        seq = numpy.asarray(seq, dtype="<i4")
+        assert seq.ndim == 1
+        f.write(seq.tobytes())
+        offsets.append(offsets[-1] + len(seq))
+    numpy.save(tmp_path + "/offsets.npy", numpy.frombuffer(offsets, dtype="int64"))
+    for key, value in (extra or {}).items():
+      assert len(value) == len(offsets) - 1
+      numpy.save("%s/%s.npy" % (tmp_path, key), numpy.asarray(value))
+    with open(tmp_path + "/info.json", "w") as f:
+      json.dump({"info": self.info, "extra": sorted((extra or {}).keys())}, f)
+    try:
+      os.rename(tmp_path, self.path)
+    except OSError:  # e.g. some other process was faster
+      shutil.rmtree(tmp_path, ignore_errors=True)
+    assert self.load()
+
+  def get_seq(self, seq_idx):
+    """
+    :param int seq_idx:
+    :return: 1D int32 array, read-only view into the memory-mapped file
+    :rtype: numpy.ndarray
+    """
+    return self.tokens[self.offsets[seq_idx]:self.offsets[seq_idx + 1]]
+
+  def get_seq_len(self, seq_idx):
+    """
+    :param int seq_idx:
+    :rtype: int
+    """
+    return int(self.offsets[seq_idx + 1] - self.offsets[seq_idx])
+
+
 class AllophoneState:
   """
   Represents one allophone (phone with context) state (number, boundary).
@@ -1026,12 +1487,14 @@ class TranslationDataset(CachedDataset2):
   MapToDataKeys = {"source": "data", "target": "classes"}  # just by our convention
   _main_data_key = None
   _main_classes_key = None
+  _token_cache_supported = True
 
   def __init__(self, path, file_postfix, source_postfix="", target_postfix="",
                source_only=False,
                unknown_label=None,
                seq_list_file=None,
                use_cache_manager=False,
+               token_cache_dir=None,
                **kwargs):
     """
     :param str path: the directory containing the files
@@ -1045,6 +1508,9 @@ class TranslationDataset(CachedDataset2):
     :param str seq_list_file: filename. line-separated list of line numbers defining fixed sequence order.
       multiple occurrences supported, thus allows for repeating examples while loading only once.
     :param bool use_cache_manager: uses :func:`Util.cf` for files
+    :param str|None token_cache_dir: if given, the data is converted to label indices only once,
+      and stored in this dir as a memory-mapped :class:`TokenIdCache`, keyed by the vocab file hash and the options.
+      later runs do not need to read the data files at all.
     """
 
     super(TranslationDataset, self).__init__(**kwargs)
@@ -1065,10 +1531,6 @@ class TranslationDataset(CachedDataset2):
     if source_only:
       self.MapToDataKeys = self.__class__.MapToDataKeys.copy()
       del self.MapToDataKeys["target"]
-    self._data_files = {data_key: self._get_data_file(prefix) for (prefix, data_key) in self.MapToDataKeys.items()}
-    self._data = {
-      data_key: [] for data_key in self._data_files.keys()}  # type: typing.Dict[str,typing.List[numpy.ndarray]]
-    self._data_len = None  # type: typing.Optional[int]
     self._vocabs = {data_key: self._get_vocab(prefix) for (prefix, data_key) in self.MapToDataKeys.items()}
     self.num_outputs = {k: [max(self._vocabs[k].values()) + 1, 1] for k in self._vocabs.keys()}  # all sparse
     assert all([v1 <= 2 ** 31 for (k, (v1, v2)) in self.num_outputs.items()])  # we use int32
@@ -1078,9 +1540,31 @@ class TranslationDataset(CachedDataset2):
     self._unknown_label = unknown_label
     self._seq_order = None  # type: typing.Optional[typing.List[int]]  # seq_idx -> line_nr
     self._tag_prefix = "line-"  # sequence tag is "line-n", where n is the line number
-    self._thread = Thread(name="%r reader" % self, target=self._thread_main)
-    self._thread.daemon = True
-    self._thread.start()
+    self._token_caches = {}  # type: typing.Dict[str,TokenIdCache]
+    if token_cache_dir:
+      assert self._token_cache_supported, "%s: token_cache_dir not supported" % self.__class__.__name__
+      for prefix, data_key in self.MapToDataKeys.items():
+        self._token_caches[data_key] = TokenIdCache(
+          cache_dir=token_cache_dir, name="translation-%s.%s" % (prefix, file_postfix),
+          info={
+            "data_file": TokenIdCache.get_file_info(self._get_data_filename(prefix)),
+            "vocab_hash": TokenIdCache.get_file_hash(self._get_vocab_filename(prefix)),
+            "postfix": self._add_postfix.get(data_key, ""), "unknown_label": unknown_label})
+    self._data = {
+      data_key: [] for data_key in self.MapToDataKeys.values()
+    }  # type: typing.Dict[str,typing.Union[typing.List[numpy.ndarray],TokenIdCache]]
+    self._data_len = None  # type: typing.Optional[int]
+    if self._token_caches and all([cache.load() for cache in self._token_caches.values()]):
+      self._data.update(self._token_caches)
+      self._data_len = len(self._token_caches[self._main_data_key])
+      self._data_files = {}
+      self._thread = None
+    else:
+      self._data_files = {
+        data_key: self._get_data_file(prefix) for (prefix, data_key) in self.MapToDataKeys.items()}
+      self._thread = Thread(name="%r reader" % self, target=self._thread_main)
+      self._thread.daemon = True
+      self._thread.start()
 
   def _extend_data(self, k, data_strs):
     vocab = self._vocabs[k]
@@ -1126,6 +1610,12 @@ class TranslationDataset(CachedDataset2):
         f.close()
         self._data_files[k] = None
 
+      # Replace the lists of arrays by the memory-mapped cache.
+      for k, cache in self._token_caches.items():
+        cache.build(self._data[k])
+        with self._lock:
+          self._data[k] = cache
+
     except Exception:
       sys.excepthook(*sys.exc_info())
       interrupt_main()
@@ -1141,30 +1631,50 @@ class TranslationDataset(CachedDataset2):
       filename = Util.cf(filename)
     return filename
 
-  def _get_data_file(self, prefix):
+  def _get_data_filename(self, prefix):
     """
     :param str prefix: e.g. "source" or "target"
-    :return: full filename
-    :rtype: io.FileIO
+    :return: full filename (not transformed)
+    :rtype: str
     """
     import os
     filename = "%s/%s.%s" % (self.path, prefix, self.file_postfix)
     if os.path.exists(filename):
-      return open(self._transform_filename(filename), "rb")
+      return filename
     if os.path.exists(filename + ".gz"):
-      import gzip
-      return gzip.GzipFile(self._transform_filename(filename + ".gz"), "rb")
+      return filename + ".gz"
     raise Exception("Data file not found: %r (.gz)?" % filename)
 
-  def _get_vocab(self, prefix):
+  def _get_data_file(self, prefix):
     """
     :param str prefix: e.g. "source" or "target"
-    :rtype: dict[str,int]
+    :return: opened file
+    :rtype: io.FileIO
+    """
+    filename = self._get_data_filename(prefix)
+    if filename.endswith(".gz"):
+      import gzip
+      return gzip.GzipFile(self._transform_filename(filename), "rb")
+    return open(self._transform_filename(filename), "rb")
+
+  def _get_vocab_filename(self, prefix):
+    """
+    :param str prefix: e.g. "source" or "target"
+    :return: full filename (not transformed)
+    :rtype: str
     """
     import os
     filename = "%s/%s.vocab.pkl" % (self.path, prefix)
     if not os.path.exists(filename):
       raise Exception("Vocab file not found: %r" % filename)
+    return filename
+
+  def _get_vocab(self, prefix):
+    """
+    :param str prefix: e.g. "source" or "target"
+    :rtype: dict[str,int]
+    """
+    filename = self._get_vocab_filename(prefix)
     import pickle
     vocab = pickle.load(open(self._transform_filename(filename), "rb"))
     assert isinstance(vocab, dict)
@@ -1262,7 +1772,7 @@ class TranslationDataset(CachedDataset2):
     """
     if self._seq_order is None:
       return None
-    return self._seq_order[seq_idx]
+    return self._seq_order[self._get_underlying_seq_idx(seq_idx)]
 
   def is_data_sparse(self, key):
     """
@@ -1338,6 +1848,7 @@ class ConfusionNetworkDataset(TranslationDataset):
   """
 
   MapToDataKeys = {"source": "sparse_inputs", "target": "classes"}
+  _token_cache_supported = False  # data is not just label indices
 
   def __init__(self, max_density=20, **kwargs):
     """
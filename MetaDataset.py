@@ -27,6 +27,7 @@ from Dataset import Dataset, DatasetSeq, init_dataset, convert_data_dims
 from CachedDataset2 import CachedDataset2
 from Util import NumbersDict, load_json
 from Log import log
+from SeqTagIndex import SeqTagIndex
 from random import Random
 import numpy
 import sys
@@ -165,6 +166,8 @@ class MetaDataset(CachedDataset2):
   *Note that the current implementation expects one input feature to be called "data".*
   """
 
+  shuffle_buffer_supported = False  # we load the sub datasets in _load_seqs for the requested seq idx
+
   def __init__(self,
                datasets,
                data_map,
@@ -185,6 +188,7 @@ class MetaDataset(CachedDataset2):
     :param str|None seq_order_control_dataset: if set, this dataset will define the order for each epoch.
     :param str|None seq_lens_file: filename. json. dict[str,dict[str,int]], seq-tag -> data-key -> len.
       Use if getting sequence length from loading data is too costly.
+      Alternatively, use the option seq_len_cache (see :class:`Dataset.SeqLenCache`), which is filled automatically.
     :param dict[str,(int,int)] data_dims: self-data-key -> data-dimension, len(shape) (1 ==> sparse repr).
        Deprecated/Only to double check. Read from data if not specified.
     :param dict[str,str] data_dtypes: self-data-key -> dtype. Read from data if not specified.
@@ -211,7 +215,7 @@ class MetaDataset(CachedDataset2):
     for key in self.dataset_keys:
       assert len(self.seq_list_original[key]) == self.num_total_seqs
 
-    self.tag_idx = {tag: idx for (idx, tag) in enumerate(self.seq_list_original[self.default_dataset_key])}
+    self.tag_idx = self.seq_list_original[self.default_dataset_key]  # tag -> idx via get_index
 
     self._seq_lens = None  # type: typing.Optional[typing.Dict[str,NumbersDict]]
     self._num_timesteps = None  # type: typing.Optional[NumbersDict]
@@ -244,7 +248,7 @@ class MetaDataset(CachedDataset2):
 
     self.data_dtypes = {data_key: _select_dtype(data_key, self.data_dims, data_dtypes) for data_key in self.data_keys}
     self.orig_seq_order_is_initialized = False
-    self.seq_list_ordered = None  # type: typing.Optional[typing.Dict[str,typing.List[str]]]
+    self.seq_list_ordered = None  # type: typing.Optional[typing.Dict[str,SeqTagIndex]]
 
   def _is_same_seq_name_for_each_dataset(self):
     """
@@ -262,7 +266,7 @@ class MetaDataset(CachedDataset2):
     """
     :param str seq_list_file:
     :return: dict: dataset key -> seq list
-    :rtype: dict[str,list[str]]
+    :rtype: dict[str,SeqTagIndex]
     """
     if seq_list_file:
       if seq_list_file.endswith(".pkl"):
@@ -300,8 +304,11 @@ class MetaDataset(CachedDataset2):
               break  # only print one
           raise Exception("Dataset %r is missing seqs." % key)
 
-    assert isinstance(seq_list, (list, dict))
-    if isinstance(seq_list, list):
+    assert isinstance(seq_list, (list, dict, SeqTagIndex))
+    if isinstance(seq_list, dict):
+      seq_list = {key: SeqTagIndex.from_tags(ls) for (key, ls) in seq_list.items()}
+    else:
+      seq_list = SeqTagIndex.from_tags(seq_list)
       seq_list = {key: seq_list for key in self.dataset_keys}
 
     return seq_list
@@ -331,13 +338,14 @@ class MetaDataset(CachedDataset2):
 
     seq_order_dataset = None
     if seq_list:
-      seq_index = [self.tag_idx[tag] for tag in seq_list]
+      seq_index = [self.tag_idx.get_index(tag) for tag in seq_list]
     elif self.seq_order_control_dataset:
       seq_order_dataset = self.datasets[self.seq_order_control_dataset]
       assert isinstance(seq_order_dataset, Dataset)
       seq_order_dataset.init_seq_order(epoch=epoch)
       seq_index = seq_order_dataset.get_current_seq_order()
     else:
+      get_seq_tag = None
       if self._seq_lens:
         def get_seq_len(s):
           """
@@ -348,9 +356,11 @@ class MetaDataset(CachedDataset2):
       else:
         self.orig_seq_order_is_initialized = False
         get_seq_len = self._get_dataset_seq_length
-      seq_index = self.get_seq_order_for_epoch(epoch, self.num_total_seqs, get_seq_len)
+        # Getting the seq len from the sub-dataset is expensive. Use the seq_len_cache, if configured.
+        get_seq_tag = self.seq_list_original[self.default_dataset_key].__getitem__
+      seq_index = self.get_seq_order_for_epoch(epoch, self.num_total_seqs, get_seq_len, get_seq_tag=get_seq_tag)
     self._num_seqs = len(seq_index)
-    self.seq_list_ordered = {key: [ls[s] for s in seq_index] for (key, ls) in self.seq_list_original.items()}
+    self.seq_list_ordered = {key: ls.take(seq_index) for (key, ls) in self.seq_list_original.items()}
 
     for dataset_key, dataset in self.datasets.items():
       assert isinstance(dataset, Dataset)
@@ -443,6 +453,8 @@ class ClusteringDataset(CachedDataset2):
   We will read the cluster-map (seq-name -> cluster-idx) here directly.
   """
 
+  shuffle_buffer_supported = False  # we load the sub dataset in _load_seqs for the requested seq idx
+
   def __init__(self, dataset, cluster_map_file, n_clusters, single_cluster=False, **kwargs):
     """
     :param dict[str] dataset:
@@ -595,6 +607,8 @@ class ConcatDataset(CachedDataset2):
   It will go through the datasets always in order.
   """
 
+  shuffle_buffer_supported = False  # we load the sub datasets in _load_seqs for the requested seq idx
+
   def __init__(self, datasets, **kwargs):
     """
     :param list[dict[str]] datasets: list of kwargs for init_dataset
@@ -760,6 +774,8 @@ class CombinedDataset(CachedDataset2):
   Also see :class:`MetaDataset`.
   """
 
+  shuffle_buffer_supported = False  # we load the sub datasets in _load_seqs for the requested seq idx
+
   def __init__(self,
                datasets,
                data_map,
@@ -1263,6 +1279,8 @@ class ChunkShuffleDataset(CachedDataset2):
   This goes through a dataset, caches some recent chunks
   """
 
+  shuffle_buffer_supported = False  # we load the sub dataset in _load_seqs for the requested seq idx
+
   def __init__(self, dataset,
                chunk_shuffle_cache=1000,
                batch_gen_batch_size=5000, batch_gen_max_seqs=1,
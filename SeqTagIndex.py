@@ -0,0 +1,352 @@
+"""
+Provides :class:`SeqTagIndex`.
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import numpy
+
+PY3 = sys.version_info[0] >= 3
+
+
+class SeqTagIndex(object):
+  """
+  Compact storage of a list of seq tags, for datasets with many (e.g. millions of) seqs.
+  The tags are stored utf8-encoded in one contiguous bytes buffer, plus an offsets array,
+  instead of one Python str object per tag (plus a dict entry for the lookup).
+
+  The lookup tag -> idx (:func:`get_index`) is O(1), via a hash table (open addressing with linear probing),
+  which is built on first use, vectorized over all tags.
+  It can be stored in a single file (:func:`save`) and memory-mapped from it (:func:`load`).
+
+  It behaves like a read-only list of str, i.e. supports len, indexing, slicing, iteration and ``in``.
+  If a tag is not unique, the lookup returns its last idx, like a dict built from the tags would do.
+  """
+
+  _FileMagic = 0x5845444947415453  # b"STAGIDEX", little endian
+  _FileVersion = 2  # 2: last idx for duplicate tags
+  _FileHeaderLen = 8  # int64 entries
+  # 64-bit FNV-1a.
+  _HashOffsetBasis = 14695981039346656037
+  _HashPrime = 1099511628211
+  _HashMask = 2 ** 64 - 1
+  _ChunkSize = 2 ** 16  # num tags, for vectorized operations with temporary memory per byte
+
+  def __init__(self, buffer, offsets, hash_table=None):
+    """
+    :param numpy.ndarray buffer: uint8, utf8 encoded tags, concatenated
+    :param numpy.ndarray offsets: int64, shape (num_tags + 1,). tag i is buffer[offsets[i]:offsets[i + 1]]
+    :param numpy.ndarray|None hash_table: see :func:`_get_hash_table`. built on demand if not given
+    """
+    assert buffer.dtype == numpy.uint8 and buffer.ndim == 1
+    assert offsets.ndim == 1 and len(offsets) >= 1 and offsets[-1] == len(buffer)
+    self.buffer = buffer
+    self.offsets = offsets
+    self._hash_table = hash_table
+
+  def __repr__(self):
+    return "<%s with %i tags>" % (self.__class__.__name__, len(self))
+
+  @classmethod
+  def from_tags(cls, tags):
+    """
+    :param list[str|bytes]|numpy.ndarray|SeqTagIndex tags:
+      for a numpy array of fixed-size bytes (like seqTags in HDF files), a tag ends at the first null byte
+    :rtype: SeqTagIndex
+    """
+    if isinstance(tags, SeqTagIndex):
+      return tags
+    if isinstance(tags, numpy.ndarray) and tags.dtype.kind == "S":
+      return cls._from_bytes_array(tags)
+    encoded = [tag if isinstance(tag, bytes) else tag.encode("utf8") for tag in tags]
+    lens = numpy.array([len(tag) for tag in encoded], dtype="int64")
+    buffer = numpy.frombuffer(b"".join(encoded), dtype=numpy.uint8)
+    return cls(buffer=buffer, offsets=cls._offsets_from_lens(lens))
+
+  @classmethod
+  def _from_bytes_array(cls, tags):
+    """
+    :param numpy.ndarray tags: fixed-size bytes, shape (num_tags,)
+    :rtype: SeqTagIndex
+    """
+    num_tags = len(tags)
+    item_size = tags.dtype.itemsize
+    if item_size == 0 or num_tags == 0:
+      return cls(buffer=numpy.zeros((0,), dtype=numpy.uint8), offsets=numpy.zeros((num_tags + 1,), dtype="int64"))
+    raw = numpy.frombuffer(numpy.ascontiguousarray(tags).tobytes(), dtype=numpy.uint8).reshape((num_tags, item_size))
+    lens = numpy.zeros((num_tags,), dtype="int64")
+    buffers = []
+    for start in range(0, num_tags, cls._ChunkSize):
+      chunk = raw[start:start + cls._ChunkSize]
+      is_null = numpy.concatenate([chunk == 0, numpy.ones((len(chunk), 1), dtype=bool)], axis=1)
+      chunk_lens = numpy.argmax(is_null, axis=1)  # first null byte
+      lens[start:start + len(chunk)] = chunk_lens
+      buffers.append(chunk[numpy.arange(item_size)[None, :] < chunk_lens[:, None]])  # row-major, i.e. in order
+    return cls(buffer=numpy.concatenate(buffers), offsets=cls._offsets_from_lens(lens))
+
+  @classmethod
+  def concat(cls, indices):
+    """
+    :param list[SeqTagIndex] indices:
+    :return: all the tags of the given indices, in order
+    :rtype: SeqTagIndex
+    """
+    if len(indices) == 1:
+      return indices[0]
+    lens = [numpy.diff(index.offsets) for index in indices]
+    return cls(
+      buffer=numpy.concatenate([numpy.zeros((0,), dtype=numpy.uint8)] + [index.buffer for index in indices]),
+      offsets=cls._offsets_from_lens(numpy.concatenate([numpy.zeros((0,), dtype="int64")] + lens)))
+
+  @staticmethod
+  def _offsets_from_lens(lens):
+    """
+    :param numpy.ndarray lens: (num_tags,)
+    :return: offsets, (num_tags + 1,)
+    :rtype: numpy.ndarray
+    """
+    offsets = numpy.zeros((len(lens) + 1,), dtype="int64")
+    numpy.cumsum(lens, dtype="int64", out=offsets[1:])
+    return offsets
+
+  def take(self, indices):
+    """
+    :param list[int]|numpy.ndarray|range indices:
+    :return: new index with the tags [self[i] for i in indices]
+    :rtype: SeqTagIndex
+    """
+    indices = numpy.asarray(indices, dtype="int64").reshape((-1,))
+    starts = self.offsets[indices]
+    lens = self.offsets[indices + 1] - starts
+    offsets = self._offsets_from_lens(lens)
+    buffer = numpy.zeros((offsets[-1],), dtype=numpy.uint8)
+    for start in range(0, len(indices), self._ChunkSize):
+      end = min(start + self._ChunkSize, len(indices))
+      if offsets[end] == offsets[start]:
+        continue
+      # Source position for every byte of the chunk.
+      pos = numpy.arange(offsets[start], offsets[end], dtype="int64")
+      pos += numpy.repeat(starts[start:end] - offsets[start:end], lens[start:end])
+      buffer[offsets[start]:offsets[end]] = self.buffer[pos]
+    return SeqTagIndex(buffer=buffer, offsets=offsets)
+
+  def __len__(self):
+    return len(self.offsets) - 1
+
+  def get_bytes(self, idx):
+    """
+    :param int idx:
+    :return: utf8 encoded tag
+    :rtype: bytes
+    """
+    return self.buffer[self.offsets[idx]:self.offsets[idx + 1]].tobytes()
+
+  def __getitem__(self, idx):
+    """
+    :param int|slice idx:
+    :rtype: str|SeqTagIndex
+    """
+    if isinstance(idx, slice):
+      return self.take(range(*idx.indices(len(self))))
+    if idx < 0:
+      idx += len(self)
+    if not 0 <= idx < len(self):
+      raise IndexError("%r: index %i out of range" % (self, idx))
+    return self._to_str(self.get_bytes(idx))
+
+  def __iter__(self):
+    for start in range(0, len(self), self._ChunkSize):
+      end = min(start + self._ChunkSize, len(self))
+      offsets = self.offsets[start:end + 1]
+      chunk = self.buffer[offsets[0]:offsets[-1]].tobytes()
+      offsets = (offsets - offsets[0]).tolist()
+      for i in range(end - start):
+        yield self._to_str(chunk[offsets[i]:offsets[i + 1]])
+
+  @staticmethod
+  def _to_str(tag):
+    """
+    :param bytes tag: utf8 encoded
+    :return: on Python 2, str is bytes, thus we keep it utf8 encoded, as str tags were before
+    :rtype: str
+    """
+    if PY3:
+      return tag.decode("utf8")
+    return tag
+
+  def tolist(self):
+    """
+    :rtype: list[str]
+    """
+    return list(self)
+
+  def __eq__(self, other):
+    if isinstance(other, SeqTagIndex):
+      return (
+        len(self) == len(other) and
+        numpy.array_equal(numpy.diff(self.offsets), numpy.diff(other.offsets)) and
+        numpy.array_equal(self.buffer, other.buffer))
+    if isinstance(other, (list, tuple)):
+      return self.tolist() == list(other)
+    return False
+
+  def __ne__(self, other):
+    return not self == other
+
+  __hash__ = None  # mutable-like semantics, like list
+
+  @classmethod
+  def _hash_bytes(cls, tag):
+    """
+    :param bytes tag:
+    :return: 64-bit FNV-1a hash. same as :func:`_hash_all`
+    :rtype: int
+    """
+    h = cls._HashOffsetBasis
+    for b in bytearray(tag):
+      h = ((h ^ b) * cls._HashPrime) & cls._HashMask
+    return h
+
+  def _hash_all(self):
+    """
+    :return: 64-bit FNV-1a hash of all tags, vectorized over the tags. same as :func:`_hash_bytes`
+    :rtype: numpy.ndarray
+    """
+    starts = self.offsets[:-1]
+    lens = self.offsets[1:] - starts
+    hashes = numpy.full((len(self),), self._HashOffsetBasis, dtype=numpy.uint64)
+    prime = numpy.uint64(self._HashPrime)
+    active = numpy.arange(len(self), dtype="int64")
+    pos = 0
+    while len(active) > 0:
+      active = active[lens[active] > pos]
+      # Integer overflow wraps around for numpy arrays, which is what we want.
+      hashes[active] = (hashes[active] ^ self.buffer[starts[active] + pos].astype(numpy.uint64)) * prime
+      pos += 1
+    return hashes
+
+  def _get_hash_table(self):
+    """
+    :return: hash table, size is a power of two, at least twice the number of tags.
+      Entries are tag indices, or -1 for empty slots. Linear probing, starting at the slot hash & (size - 1).
+    :rtype: numpy.ndarray
+    """
+    if self._hash_table is not None:
+      return self._hash_table
+    num_tags = len(self)
+    size = 1
+    while size < 2 * num_tags:
+      size *= 2
+    table = numpy.full((size,), -1, dtype="int32" if num_tags < 2 ** 31 - 1 else "int64")
+    mask = size - 1
+    slots = (self._hash_all() & numpy.uint64(mask)).astype("int64")
+    pending = numpy.arange(num_tags - 1, -1, -1, dtype="int64")
+    slots = slots[pending]
+    # All pending tags try to insert into their current slot at once.
+    # For every free slot, the tag with the highest idx gets it (pending is in descending order),
+    # and all others probe the next slot.
+    # Thus, equal tags end up in descending order of their idx, and lookup returns the last idx.
+    while len(pending) > 0:
+      free = numpy.flatnonzero(table[slots] == -1)
+      won_slots, first = numpy.unique(slots[free], return_index=True)
+      table[won_slots] = pending[free[first]]
+      placed = numpy.zeros((len(pending),), dtype=bool)
+      placed[free[first]] = True
+      pending = pending[~placed]
+      slots = (slots[~placed] + 1) & mask
+    self._hash_table = table
+    return table
+
+  def get(self, tag, default=None):
+    """
+    :param str|bytes tag:
+    :param T default:
+    :return: idx of the tag (the last, if it is not unique), or default if not found
+    :rtype: int|T
+    """
+    if not isinstance(tag, bytes):
+      tag = tag.encode("utf8")
+    table = self._get_hash_table()
+    mask = len(table) - 1
+    slot = self._hash_bytes(tag) & mask
+    while True:
+      idx = int(table[slot])
+      if idx < 0:
+        return default
+      if self.get_bytes(idx) == tag:
+        return idx
+      slot = (slot + 1) & mask
+
+  def get_index(self, tag):
+    """
+    :param str|bytes tag:
+    :return: idx of the tag (the last, if it is not unique)
+    :rtype: int
+    :raises KeyError: if not found
+    """
+    idx = self.get(tag)
+    if idx is None:
+      raise KeyError("%r: seq tag %r not found" % (self, tag))
+    return idx
+
+  def __contains__(self, tag):
+    return self.get(tag) is not None
+
+  def has_duplicates(self):
+    """
+    :return: whether some tag occurs more than once
+    :rtype: bool
+    """
+    hashes = self._hash_all()
+    order = numpy.argsort(hashes, kind="stable")
+    same_hash = numpy.flatnonzero(hashes[order][1:] == hashes[order][:-1])
+    # Equal tags have equal hashes. Those are usually only a few, thus we check them exactly.
+    candidates = order[numpy.union1d(same_hash, same_hash + 1)]
+    tags = [self.get_bytes(idx) for idx in candidates]
+    return len(set(tags)) < len(tags)
+
+  def save(self, filename):
+    """
+    Stores everything, including the hash table, in a single file, which can be memory-mapped via :func:`load`.
+    The file is written to a temp file first and then renamed, such that readers never see a partial file.
+
+    :param str filename:
+    """
+    table = self._get_hash_table()
+    header = numpy.array(
+      [self._FileMagic, self._FileVersion, len(self), len(self.buffer), len(table), table.dtype.itemsize, 0, 0],
+      dtype="int64")
+    assert len(header) == self._FileHeaderLen
+    tmp_filename = "%s.tmp.%i" % (filename, os.getpid())
+    with open(tmp_filename, "wb") as f:
+      header.astype("<i8").tofile(f)
+      self.offsets.astype("<i8").tofile(f)
+      table.astype("<i%i" % table.dtype.itemsize).tofile(f)
+      self.buffer.tofile(f)
+    os.rename(tmp_filename, filename)
+
+  @classmethod
+  def load(cls, filename, mmap=True):
+    """
+    :param str filename: via :func:`save`
+    :param bool mmap: if True, the arrays are read-only memory-mapped from the file, otherwise read into memory
+    :rtype: SeqTagIndex
+    """
+    header = numpy.fromfile(filename, dtype="<i8", count=cls._FileHeaderLen)
+    assert len(header) == cls._FileHeaderLen and header[0] == cls._FileMagic, "%s: not a seq tag index" % filename
+    assert header[1] == cls._FileVersion, "%s: unsupported version %i" % (filename, header[1])
+    num_tags, buffer_len, table_len, table_itemsize = [int(x) for x in header[2:6]]
+    arrays = []
+    offset = header.nbytes
+    with open(filename, "rb") as f:
+      for dtype, count in [("<i8", num_tags + 1), ("<i%i" % table_itemsize, table_len), ("uint8", buffer_len)]:
+        if mmap and count > 0:
+          arrays.append(numpy.memmap(filename, dtype=dtype, mode="r", offset=offset, shape=(count,)))
+        else:
+          f.seek(offset)
+          arrays.append(numpy.fromfile(f, dtype=dtype, count=count))
+        offset += numpy.dtype(dtype).itemsize * count
+    offsets, table, buffer = arrays
+    return cls(buffer=buffer, offsets=offsets, hash_table=table)
@@ -0,0 +1,478 @@
+"""
+Provides :class:`ShardedDataset` and :class:`ShardedDatasetWriter`.
+
+The sharded dataset format is a directory with this content::
+
+  meta.json  # data keys, dtypes, shapes, dims, labels, number of seqs per shard
+  shard-00000.offsets.npy  # int64, shape (num_seqs + 1, num_keys), frame offsets per data key
+  shard-00000.tags.raw  # all seq tags, utf8, concatenated
+  shard-00000.tag_offsets.npy  # int64, shape (num_seqs + 1,), byte offsets into tags.raw
+  shard-00000.<key>.raw  # flat binary payload of data key <key>, all seqs concatenated (time-major)
+  shard-00001.offsets.npy
+  ...
+
+All shards have a fixed number of seqs (except the last one).
+Nothing of the shards is read when the dataset is opened,
+and all the shard files are memory-mapped on demand,
+thus opening is instant and random access is cheap, even with millions of seqs.
+Use :class:`ShardedDatasetWriter` or ``tools/hdf_dump.py --format sharded`` to create it.
+"""
+
+from __future__ import print_function
+
+import os
+import json
+import numpy
+import typing
+from CachedDataset2 import CachedDataset2
+from Dataset import Dataset, DatasetSeq
+from Log import log
+
+
+class ShardedDatasetShard(object):
+  """
+  A single shard, i.e. some fixed number of seqs.
+  All files are memory-mapped, and only opened on first usage.
+  """
+
+  def __init__(self, prefix, data_keys, data_specs):
+    """
+    :param str prefix: path prefix, e.g. ".../shard-00000"
+    :param list[str] data_keys: in the order of the offsets
+    :param dict[str,dict[str]] data_specs: data key -> spec, see :class:`ShardedDatasetWriter`
+    """
+    self.prefix = prefix
+    self.data_keys = data_keys
+    self.data_specs = data_specs
+    self._offsets = None  # type: typing.Optional[numpy.ndarray]
+    self._tag_offsets = None  # type: typing.Optional[numpy.ndarray]
+    self._tags = None  # type: typing.Optional[numpy.ndarray]
+    self._data = {}  # type: typing.Dict[str,numpy.ndarray]
+
+  @staticmethod
+  def _mmap_raw(filename, dtype, shape=()):
+    """
+    :param str filename:
+    :param str dtype:
+    :param tuple[int] shape: excluding the first (flat) axis
+    :return: read-only memmap, or empty array if the file is empty
+    :rtype: numpy.ndarray
+    """
+    if os.path.getsize(filename) == 0:  # numpy.memmap does not support empty files
+      return numpy.zeros((0,) + tuple(shape), dtype=dtype)
+    data = numpy.memmap(filename, dtype=dtype, mode="r")
+    return data.reshape((-1,) + tuple(shape))
+
+  @property
+  def offsets(self):
+    """
+    :return: shape (num_seqs + 1, num_keys), frame offsets
+    :rtype: numpy.ndarray
+    """
+    if self._offsets is None:
+      self._offsets = numpy.load(self.prefix + ".offsets.npy", mmap_mode="r")
+    return self._offsets
+
+  @property
+  def num_seqs(self):
+    """
+    :rtype: int
+    """
+    return self.offsets.shape[0] - 1
+
+  def get_seq_len(self, idx, key):
+    """
+    :param int idx: seq idx within this shard
+    :param str key:
+    :rtype: int
+    """
+    key_idx = self.data_keys.index(key)
+    return int(self.offsets[idx + 1, key_idx] - self.offsets[idx, key_idx])
+
+  def get_seq_lens(self, key):
+    """
+    :param str key:
+    :return: shape (num_seqs,), lens of all seqs of this shard
+    :rtype: numpy.ndarray
+    """
+    return numpy.diff(self.offsets[:, self.data_keys.index(key)])
+
+  def get_data(self, idx, key):
+    """
+    :param int idx: seq idx within this shard
+    :param str key:
+    :return: read-only view into the memory-mapped payload, no copy
+    :rtype: numpy.ndarray
+    """
+    if key not in self._data:
+      spec = self.data_specs[key]
+      self._data[key] = self._mmap_raw(
+        "%s.%s.raw" % (self.prefix, key), dtype=spec["dtype"], shape=spec["shape"])
+    key_idx = self.data_keys.index(key)
+    start, end = self.offsets[idx:idx + 2, key_idx]
+    return numpy.asarray(self._data[key][start:end])
+
+  def get_tag(self, idx):
+    """
+    :param int idx: seq idx within this shard
+    :rtype: str
+    """
+    if self._tags is None:
+      self._tag_offsets = numpy.load(self.prefix + ".tag_offsets.npy", mmap_mode="r")
+      self._tags = self._mmap_raw(self.prefix + ".tags.raw", dtype="uint8")
+    start, end = self._tag_offsets[idx:idx + 2]
+    return self._tags[start:end].tobytes().decode("utf8")
+
+
+class ShardedDataset(CachedDataset2):
+  """
+  Reads the sharded dataset format, see the module docstring, and :class:`ShardedDatasetWriter`.
+  """
+
+  def __init__(self, path, **kwargs):
+    """
+    :param str path: directory of the sharded dataset
+    """
+    super(ShardedDataset, self).__init__(**kwargs)
+    self.path = path
+    with open(os.path.join(path, ShardedDatasetWriter.meta_filename)) as f:
+      meta = json.load(f)
+    assert meta["format_version"] == ShardedDatasetWriter.format_version, "%s: unsupported format" % path
+    self._data_keys = meta["data_keys"]  # type: typing.List[str]
+    self._target_list = meta["target_list"]  # type: typing.List[str]
+    self._data_specs = meta["data"]  # type: typing.Dict[str,typing.Dict[str]]
+    self.num_outputs = {key: tuple(spec["dim_ndim"]) for (key, spec) in self._data_specs.items()}
+    if "data" in self.num_outputs:
+      self.num_inputs = self.num_outputs["data"][0]
+    self.labels = meta.get("labels", {})
+    self._shard_names = [shard["name"] for shard in meta["shards"]]  # type: typing.List[str]
+    self._shard_seq_start = numpy.zeros((len(self._shard_names) + 1,), dtype="int64")
+    numpy.cumsum([shard["num_seqs"] for shard in meta["shards"]], out=self._shard_seq_start[1:])
+    self._shards = [None] * len(self._shard_names)  # type: typing.List[typing.Optional[ShardedDatasetShard]]
+    self._seq_order = None  # type: typing.Optional[typing.List[int]]
+    self._tag_idx = None  # type: typing.Optional[typing.Dict[str,int]]
+    self._default_len_key = "data" if "data" in self._data_keys else self._data_keys[0]
+
+  def _get_shard(self, shard_idx):
+    """
+    :param int shard_idx:
+    :rtype: ShardedDatasetShard
+    """
+    shard = self._shards[shard_idx]
+    if shard is None:
+      shard = ShardedDatasetShard(
+        prefix=os.path.join(self.path, self._shard_names[shard_idx]),
+        data_keys=self._data_keys, data_specs=self._data_specs)
+      self._shards[shard_idx] = shard
+    return shard
+
+  def _get_shard_and_idx(self, corpus_seq_idx):
+    """
+    :param int corpus_seq_idx: seq idx as in the whole dataset, i.e. "default" ordering
+    :return: shard, and seq idx within this shard
+    :rtype: (ShardedDatasetShard, int)
+    """
+    shard_idx = int(numpy.searchsorted(self._shard_seq_start, corpus_seq_idx, side="right")) - 1
+    return self._get_shard(shard_idx), corpus_seq_idx - int(self._shard_seq_start[shard_idx])
+
+  def _get_seq_len_by_corpus_seq_idx(self, corpus_seq_idx):
+    """
+    :param int corpus_seq_idx:
+    :rtype: int
+    """
+    shard, idx = self._get_shard_and_idx(corpus_seq_idx)
+    return shard.get_seq_len(idx, self._default_len_key)
+
+  def _get_tag_by_corpus_seq_idx(self, corpus_seq_idx):
+    """
+    :param int corpus_seq_idx:
+    :rtype: str
+    """
+    shard, idx = self._get_shard_and_idx(corpus_seq_idx)
+    return shard.get_tag(idx)
+
+  def init_seq_order(self, epoch=None, seq_list=None):
+    """
+    :param int|None epoch:
+    :param list[str]|None seq_list:
+    :rtype: bool
+    """
+    super(ShardedDataset, self).init_seq_order(epoch=epoch, seq_list=seq_list)
+    if seq_list is not None:
+      if self._tag_idx is None:
+        self._tag_idx = {tag: i for (i, tag) in enumerate(self.get_all_tags())}
+      self._seq_order = [self._tag_idx[tag] for tag in seq_list]
+    else:
+      self._seq_order = self.get_seq_order_for_epoch(
+        epoch=epoch, num_seqs=self.get_total_num_seqs(), get_seq_len=self._get_seq_len_by_corpus_seq_idx)
+    self._num_seqs = len(self._seq_order)
+    return True
+
+  def get_current_seq_order(self):
+    """
+    :rtype: list[int]
+    """
+    assert self._seq_order is not None
+    return self._seq_order
+
+  def _collect_single_seq(self, seq_idx):
+    """
+    :param int seq_idx:
+    :rtype: DatasetSeq|None
+    """
+    if seq_idx >= len(self._seq_order):
+      return None
+    shard, idx = self._get_shard_and_idx(self._seq_order[seq_idx])
+    features = {key: shard.get_data(idx, key) for key in self._data_keys}
+    return DatasetSeq(seq_idx=seq_idx, features=features, seq_tag=shard.get_tag(idx))
+
+  def get_data_keys(self):
+    """
+    :rtype: list[str]
+    """
+    return self._data_keys
+
+  def get_target_list(self):
+    """
+    :rtype: list[str]
+    """
+    return self._target_list
+
+  def get_data_dtype(self, key):
+    """
+    :param str key:
+    :rtype: str
+    """
+    return self._data_specs[key]["dtype"]
+
+  def is_data_sparse(self, key):
+    """
+    :param str key:
+    :rtype: bool
+    """
+    return self._data_specs[key]["sparse"]
+
+  def get_data_shape(self, key):
+    """
+    :param str key:
+    :rtype: list[int]
+    """
+    return list(self._data_specs[key]["shape"])
+
+  def have_corpus_seq_idx(self):
+    """
+    :rtype: bool
+    """
+    return True
+
+  def get_corpus_seq_idx(self, seq_idx):
+    """
+    :param int seq_idx:
+    :rtype: int
+    """
+    return self._seq_order[self._get_underlying_seq_idx(seq_idx)]
+
+  def get_tag(self, sorted_seq_idx):
+    """
+    :param int sorted_seq_idx:
+    :rtype: str
+    """
+    return self._get_tag_by_corpus_seq_idx(self._seq_order[self._get_underlying_seq_idx(sorted_seq_idx)])
+
+  def get_all_tags(self):
+    """
+    :rtype: list[str]
+    """
+    return [self._get_tag_by_corpus_seq_idx(i) for i in range(self.get_total_num_seqs())]
+
+  def get_total_num_seqs(self):
+    """
+    :rtype: int
+    """
+    return int(self._shard_seq_start[-1])
+
+  def len_info(self):
+    """
+    :rtype: str
+    """
+    return ", ".join([
+      self.__class__.__name__, "sequences: %i" % self.get_total_num_seqs(), "shards: %i" % len(self._shards)])
+
+
+class ShardedDatasetWriter(object):
+  """
+  Writes the sharded dataset format, see the module docstring.
+  Seqs are written in a streaming way, i.e. only the current seq is kept in memory.
+  """
+
+  meta_filename = "meta.json"
+  format_version = 1
+
+  def __init__(self, path, seqs_per_shard=10000):
+    """
+    :param str path: directory. will be created
+    :param int seqs_per_shard:
+    """
+    print("Creating sharded dataset %s" % path, file=log.v3)
+    assert seqs_per_shard > 0
+    if not os.path.exists(path):
+      os.makedirs(path)
+    assert not os.path.exists(os.path.join(path, self.meta_filename)), "%s: dataset already exists" % path
+    self.path = path
+    self.seqs_per_shard = seqs_per_shard
+    self.data_keys = None  # type: typing.Optional[typing.List[str]]
+    self.target_list = None  # type: typing.Optional[typing.List[str]]
+    self.data_specs = {}  # type: typing.Dict[str,typing.Dict[str]]
+    self.labels = {}  # type: typing.Dict[str,typing.List[str]]
+    self.num_outputs = {}  # type: typing.Dict[str,typing.Union[typing.Tuple[int,int],typing.List[int]]]
+    self.shards = []  # type: typing.List[typing.Dict[str]]  # name, num_seqs
+    self._files = {}  # type: typing.Dict[str,typing.BinaryIO]  # key -> payload file of current shard
+    self._tags_file = None  # type: typing.Optional[typing.BinaryIO]
+    self._offsets = []  # type: typing.List[typing.List[int]]  # current shard
+    self._tag_offsets = []  # type: typing.List[int]  # current shard
+
+  def set_data_keys(self, data_keys, target_list=None, data_specs=None, labels=None, num_outputs=None):
+    """
+    :param list[str] data_keys:
+    :param list[str]|None target_list:
+    :param dict[str,dict[str]]|None data_specs: key -> dict with "dtype", "shape", "dim_ndim", "sparse".
+      If not given, we infer it from the first seq.
+    :param dict[str,(int,int)|list[int]]|None num_outputs: key -> (dim, ndim), like Dataset.num_outputs.
+      Used when the data spec is inferred from the first seq.
+      For sparse data, the dim (number of classes) cannot be inferred, so it must be given here or via data_specs.
+    :param dict[str,list[str]]|None labels:
+    """
+    assert self.data_keys is None, "data keys already set"
+    self.data_keys = list(data_keys)
+    if target_list is None:
+      target_list = [key for key in self.data_keys if key != "data"]
+    self.target_list = list(target_list)
+    self.data_specs = dict(data_specs or {})
+    self.labels = dict(labels or {})
+    self.num_outputs = dict(num_outputs or {})
+
+  @classmethod
+  def get_data_spec_from_dataset(cls, dataset, key):
+    """
+    :param Dataset dataset:
+    :param str key:
+    :rtype: dict[str]
+    """
+    if dataset.num_outputs and key in dataset.num_outputs:
+      dim_ndim = list(dataset.num_outputs[key])
+    else:
+      dim_ndim = [dataset.get_data_dim(key), len(dataset.get_data_shape(key)) + 1]
+    return {
+      "dtype": str(numpy.dtype(dataset.get_data_dtype(key))),
+      "shape": dataset.get_data_shape(key),
+      "dim_ndim": dim_ndim,
+      "sparse": bool(dataset.is_data_sparse(key))}
+
+  def _start_new_shard(self):
+    name = "shard-%05i" % len(self.shards)
+    prefix = os.path.join(self.path, name)
+    self.shards.append({"name": name, "num_seqs": 0})
+    self._files = {key: open("%s.%s.raw" % (prefix, key), "wb") for key in self.data_keys}
+    self._tags_file = open(prefix + ".tags.raw", "wb")
+    self._offsets = [[0] * len(self.data_keys)]
+    self._tag_offsets = [0]
+
+  def _finish_shard(self):
+    if not self._files:
+      return
+    prefix = os.path.join(self.path, self.shards[-1]["name"])
+    for f in self._files.values():
+      f.close()
+    self._files = {}
+    self._tags_file.close()
+    self._tags_file = None
+    numpy.save(prefix + ".offsets.npy", numpy.array(self._offsets, dtype="int64"))
+    numpy.save(prefix + ".tag_offsets.npy", numpy.array(self._tag_offsets, dtype="int64"))
+
+  def add_seq(self, features, seq_tag):
+    """
+    :param dict[str,numpy.ndarray] features: data key -> data, with time as first axis
+    :param str seq_tag:
+    """
+    if self.data_keys is None:
+      self.set_data_keys(sorted(features.keys()))
+    if not self.shards or self.shards[-1]["num_seqs"] >= self.seqs_per_shard:
+      self._finish_shard()
+      self._start_new_shard()
+    assert sorted(features.keys()) == sorted(self.data_keys), "data keys mismatch, seq %r" % seq_tag
+    offsets = []
+    for key_idx, key in enumerate(self.data_keys):
+      data = numpy.asarray(features[key])
+      assert data.ndim >= 1, "seq %r, key %r: need time axis" % (seq_tag, key)
+      if key not in self.data_specs:
+        if key in self.num_outputs:
+          dim_ndim = list(self.num_outputs[key])
+        else:
+          assert data.ndim >= 2, (
+            "seq %r, key %r: sparse data, the dim (number of classes) cannot be inferred, "
+            "pass num_outputs or data_specs to set_data_keys" % (seq_tag, key))
+          dim_ndim = [data.shape[-1], data.ndim]
+        self.data_specs[key] = {
+          "dtype": str(data.dtype), "shape": list(data.shape[1:]),
+          "dim_ndim": dim_ndim, "sparse": dim_ndim[1] == 1}
+      spec = self.data_specs[key]
+      if None in spec["shape"]:  # e.g. from Dataset.get_data_shape, take it from the first seq
+        spec["shape"] = list(data.shape[1:])
+      assert list(data.shape[1:]) == list(spec["shape"]), "seq %r, key %r: shape mismatch, %r vs spec %r" % (
+        seq_tag, key, data.shape, spec)
+      data = numpy.ascontiguousarray(data, dtype=spec["dtype"])
+      self._files[key].write(data.tobytes())
+      offsets.append(self._offsets[-1][key_idx] + data.shape[0])
+    self._offsets.append(offsets)
+    tag = seq_tag.encode("utf8")
+    self._tags_file.write(tag)
+    self._tag_offsets.append(self._tag_offsets[-1] + len(tag))
+    self.shards[-1]["num_seqs"] += 1
+
+  def close(self):
+    """
+    Finishes the last shard and writes the meta info.
+    """
+    self._finish_shard()
+    assert self.data_keys is not None, "no seqs written"
+    meta = {
+      "format_version": self.format_version,
+      "data_keys": self.data_keys,
+      "target_list": self.target_list,
+      "data": self.data_specs,
+      "labels": self.labels,
+      "shards": self.shards}
+    with open(os.path.join(self.path, self.meta_filename), "w") as f:
+      json.dump(meta, f, indent=1, sort_keys=True)
+
+  def dump_from_dataset(self, dataset, epoch=1, start_seq=0, end_seq=float("inf"), use_progress_bar=True):
+    """
+    :param Dataset dataset: could be any dataset implemented as child of Dataset
+    :param int epoch: for dataset
+    :param int start_seq:
+    :param int|float end_seq:
+    :param bool use_progress_bar:
+    """
+    from Util import progress_bar_with_time, try_run
+    print("Work on epoch: %i" % epoch, file=log.v3)
+    dataset.init_seq_order(epoch)
+    data_keys = sorted(dataset.get_data_keys())
+    print("Data keys:", data_keys, file=log.v3)
+    self.set_data_keys(
+      data_keys=data_keys,
+      target_list=[key for key in dataset.get_target_list() if key in data_keys],
+      data_specs={key: self.get_data_spec_from_dataset(dataset, key) for key in data_keys},
+      labels={key: list(dataset.labels[key]) for key in data_keys if dataset.labels.get(key)})
+    dataset_num_seqs = try_run(lambda: dataset.num_seqs, default=None)  # can be unknown
+    if dataset_num_seqs is not None:
+      dataset_num_seqs = min(dataset_num_seqs, end_seq) - start_seq
+    seq_idx = start_seq
+    while dataset.is_less_than_num_seqs(seq_idx) and seq_idx < end_seq:
+      dataset.load_seqs(seq_idx, seq_idx + 1)
+      self.add_seq(
+        features={key: dataset.get_data(seq_idx, key) for key in data_keys},
+        seq_tag=dataset.get_tag(seq_idx))
+      if use_progress_bar and dataset_num_seqs:
+        progress_bar_with_time(float(seq_idx - start_seq) / dataset_num_seqs)
+      seq_idx += 1
+    print("Wrote %i seqs in %i shards." % (seq_idx - start_seq, len(self.shards)), file=log.v3)
@@ -12,10 +12,11 @@ import sys
 import os
 import typing
 import array
-from struct import pack, unpack
+from struct import pack, unpack, unpack_from
 import numpy
 import zlib
 import mmap
+from SeqTagIndex import SeqTagIndex
 
 
 class FileInfo:
@@ -44,6 +45,7 @@ class FileInfo:
 class FileArchive:
   """
   File archive.
+  Reading entries (:func:`read`, :func:`read_features`, :func:`read_alignment`) is thread-safe.
   """
 
   # read routines
@@ -121,9 +123,11 @@ class FileArchive:
   # write routines
   def write_str(self, s):
     """
-    :param str s:
+    :param str|bytes s:
     :rtype: int
     """
+    if not isinstance(s, bytes):
+      s = s.encode("ascii")
     return self.f.write(pack("%ds" % len(s), s))
 
   def write_char(self, i):
@@ -176,6 +180,7 @@ class FileArchive:
   def __init__(self, filename, must_exists=True):
 
     self.ft = {}  # type: typing.Dict[str,FileInfo]
+    self._mmap = None  # type: typing.Optional[mmap.mmap]
     if os.path.exists(filename):
       self.allophones = []
       self.f = open(filename, 'rb')
@@ -187,6 +192,10 @@ class FileArchive:
         self.read_file_info_table()
       else:
         self.scan_archive()
+      # All entries are read via this map, from independent offsets, i.e. no shared file position.
+      # Thus reading is thread-safe. An empty file cannot be mapped, but then there are no entries anyway.
+      if os.fstat(self.f.fileno()).st_size > 0:
+        self._mmap = mmap.mmap(self.f.fileno(), 0, access=mmap.ACCESS_READ)
 
     else:
       assert not must_exists, "File does not exist: %r" % filename
@@ -194,12 +203,17 @@ class FileArchive:
       self.write_str(self.SprintCacheHeader)
       self.write_char(1)
 
-    self._short_seg_names = {os.path.basename(n): n for n in self.ft.keys()}
-    if len(self._short_seg_names) < len(self.ft):
+    # Short seg name (basename) -> idx in self._short_seg_names_full.
+    self._short_seg_names_full = list(self.ft.keys())
+    self._short_seg_names = SeqTagIndex.from_tags([os.path.basename(n) for n in self._short_seg_names_full])
+    if self._short_seg_names.has_duplicates():
       # We don't have a unique mapping, so we cannot use this.
-      self._short_seg_names.clear()
+      self._short_seg_names = SeqTagIndex.from_tags([])
+      self._short_seg_names_full = []
 
   def __del__(self):
+    if self._mmap is not None:
+      self._mmap.close()
     self.f.close()
 
   def file_list(self):
@@ -278,82 +292,151 @@ class FileArchive:
       # raise NotImplementedError("Need to scan archive if no "
       #                           "file info table found.")
 
-  def _raw_read(self, size, typ):
-    """
-    :param int|None size: needed for typ == "str"
-    :param str typ: "str", "feat" or "align"
-    :return: depending on typ, "str" -> string, "feat" -> (time, data), "align" -> align,
-      where string is a str,
-      time is list of time-stamp tuples (start-time,end-time) in millisecs,
-        data is a list of features, each a numpy vector,
-      align is a list of (time, allophone, state), time is an int from 0 to len of align,
-        allophone is some int, state is e.g. in [0,1,2].
-    :rtype: str|(list[numpy.ndarray],list[numpy.ndarray])|list[(int,int,int)]
+  def _read_entry(self, filename):
     """
+    :param str filename: the entry-name in the archive
+    :return: the whole (uncompressed) record of the entry, or None if it is empty
+    :rtype: bytes|None
 
-    if typ == "str":
-      return self.read_str(size)
+    This is thread-safe.
+    """
+    if filename not in self.ft:
+      short_idx = self._short_seg_names.get(filename)
+      if short_idx is not None:
+        filename = self._short_seg_names_full[short_idx]
 
-    elif typ == "feat":
-      type_len = self.read_U32()
-      typ = self.read_str(type_len)
-      # print(typ)
-      assert typ == "vector-f32"
-      count = self.read_U32()
-      data = [None] * count  # type: typing.List[typing.Optional[numpy.ndarray]]
-      time_ = [None] * count  # type: typing.List[typing.Optional[numpy.ndarray]]
-      for i in range(count):
-        size = self.read_U32()
-        data[i] = self.read_v("f", size)  # size x f32
-        time_[i] = self.read_v("d", 2)  # 2    x f64
-      return time_, data
+    fi = self.ft[filename]
+    assert self._mmap is not None, "%r: not opened for reading" % self
+    size, comp, _ = unpack_from("III", self._mmap, fi.pos)  # size, comp, chk
+    pos = fi.pos + 12
+    if size == 0:
+      return None
+    if comp > 0:
+      return zlib.decompress(self._mmap[pos:pos + comp], 15 + 32)
+    return self._mmap[pos:pos + size]
 
-    elif typ in ["align", "align_raw"]:
-      type_len = self.read_U32()
-      typ = self.read_str(type_len)
-      assert typ == "flow-alignment"
-      self.read_u32()  # flag ?
-      typ = self.read_str(8)
-      if typ in ["ALIGNRLE", "AALPHRLE"]:
-        # In case of AALPHRLE, after the alignment, we include the alphabet of the used labels.
-        # We ignore this at the moment.
-        size = self.read_U32()
-        if size < (1 << 31):
-          # RLE scheme
-          time = 0
-          alignment = []
-          while len(alignment) < size:
-            n = self.read_char()
-            # print(n)
-            if n > 0:
-              while n > 0:
-                mix, state = self.read_u32(), None
-                if typ != "align_raw":
-                  mix, state = self.get_state(mix)
-                # print(mix, state)
-                # print(time, self.allophones[mix])
-                alignment.append((time, mix, state))
-                time += 1
-                n -= 1
-            elif n < 0:
-              mix, state = self.read_u32(), None
-              if typ != "align_raw":
-                mix, state = self.get_state(mix)
-              while n < 0:
-                # print(mix, state)
-                # print(time, self.allophones[mix])
-                alignment.append((time, mix, state))
-                time += 1
-                n += 1
-            else:
-              time = self.read_u32()
-              # print("time", time)
-          return alignment
-        else:
-          raise NotImplementedError("No support for weighted "
-                                    "alignments yet.")
+  @staticmethod
+  def _decode_type_str(buf, pos):
+    """
+    :param bytes buf:
+    :param int pos:
+    :return: type string (U32 len + str), new pos
+    :rtype: (str, int)
+    """
+    type_len, = unpack_from("I", buf, pos)
+    return buf[pos + 4:pos + 4 + type_len].decode("ascii"), pos + 4 + type_len
+
+  @classmethod
+  def _decode_features(cls, buf):
+    """
+    The record is: type str, U32 count, and per frame: U32 dim, dim x f32, 2 x f64.
+    In the common case that all frames have the same dim, we can parse it at once via a strided view.
+
+    :param bytes buf: record of a feature entry
+    :return: times (T,2) float64 in secs (start,end), features (T,dim) float32
+    :rtype: (numpy.ndarray, numpy.ndarray)
+    """
+    typ, pos = cls._decode_type_str(buf, 0)
+    assert typ == "vector-f32"
+    count, = unpack_from("I", buf, pos)
+    pos += 4
+    if count == 0:
+      return numpy.zeros((0, 2), dtype="float64"), numpy.zeros((0, 0), dtype="float32")
+    dim, = unpack_from("I", buf, pos)
+    frame_dtype = numpy.dtype([("dim", "<u4"), ("data", "<f4", (dim,)), ("time", "<f8", (2,))])
+    if len(buf) - pos >= count * frame_dtype.itemsize:
+      frames = numpy.frombuffer(buf, dtype=frame_dtype, count=count, offset=pos)
+      if numpy.all(frames["dim"] == dim):
+        return numpy.array(frames["time"]), numpy.array(frames["data"])
+    # Fallback: frames of different dims. Pad with zeros.
+    times, data = [], []
+    for i in range(count):
+      size, = unpack_from("I", buf, pos)
+      data.append(numpy.frombuffer(buf, dtype="<f4", count=size, offset=pos + 4))
+      times.append(numpy.frombuffer(buf, dtype="<f8", count=2, offset=pos + 4 + size * 4))
+      pos += 4 + size * 4 + 16
+    features = numpy.zeros((count, max([len(x) for x in data])), dtype="float32")
+    for i, x in enumerate(data):
+      features[i, :len(x)] = x
+    return numpy.array(times), features
+
+  @classmethod
+  def _decode_alignment(cls, buf):
+    """
+    The RLE scheme: signed char n; n > 0: n x u32 (mix); n < 0: one u32 (mix) repeated -n times; n == 0: u32 time.
+    We only loop over the runs in Python; the frames are created via numpy.
+
+    :param bytes buf: record of an alignment entry
+    :return: times (T,) int32, mixes (T,) int32 (allophone state idx, not yet split via get_state)
+    :rtype: (numpy.ndarray, numpy.ndarray)
+    """
+    typ, pos = cls._decode_type_str(buf, 0)
+    assert typ == "flow-alignment"
+    pos += 4  # flag ?
+    typ = buf[pos:pos + 8].decode("ascii")
+    pos += 8
+    if typ not in ["ALIGNRLE", "AALPHRLE"]:
+      raise Exception("No valid alignment header found (found: %r). Wrong cache?" % typ)
+    # In case of AALPHRLE, after the alignment, we include the alphabet of the used labels.
+    # We ignore this at the moment.
+    size, = unpack_from("I", buf, pos)
+    pos += 4
+    if size >= (1 << 31):
+      raise NotImplementedError("No support for weighted alignments yet.")
+    values = []  # type: typing.List[int]
+    counts = []  # type: typing.List[int]
+    time_resets = []  # type: typing.List[typing.Tuple[int,int]]  # (frame idx, time)
+    num_frames = 0
+    while num_frames < size:
+      n, = unpack_from("b", buf, pos)
+      pos += 1
+      if n > 0:
+        values.extend(numpy.frombuffer(buf, dtype="<i4", count=n, offset=pos).tolist())
+        counts.extend([1] * n)
+        pos += 4 * n
+        num_frames += n
+      elif n < 0:
+        values.append(unpack_from("i", buf, pos)[0])
+        counts.append(-n)
+        pos += 4
+        num_frames -= n
       else:
-        raise Exception("No valid alignment header found (found: %r). Wrong cache?" % typ)
+        time_resets.append((num_frames, unpack_from("i", buf, pos)[0]))
+        pos += 4
+    mixes = numpy.repeat(numpy.array(values, dtype="int32"), counts)
+    times = numpy.arange(num_frames, dtype="int32")
+    for frame_idx, time in time_resets:
+      if frame_idx < num_frames:
+        times[frame_idx:] += time - times[frame_idx]
+    return times, mixes
+
+  def read_features(self, filename):
+    """
+    :param str filename: the entry-name in the archive
+    :return: times (T,2) float64 (start-time,end-time), features (T,dim) float32, or None if the entry is empty
+    :rtype: (numpy.ndarray, numpy.ndarray)|None
+    """
+    buf = self._read_entry(filename)
+    if buf is None:
+      return None
+    return self._decode_features(buf)
+
+  def read_alignment(self, filename, raw=False):
+    """
+    :param str filename: the entry-name in the archive
+    :param bool raw: if True, returns the allophone state idx (allophone + state * 2^26) as-is,
+      otherwise split via :func:`get_states` (needs :func:`set_allophones`)
+    :return: if raw, times, mixes; otherwise times, allophones, states; all (T,) int32. or None if empty
+    :rtype: (numpy.ndarray, numpy.ndarray)|(numpy.ndarray, numpy.ndarray, numpy.ndarray)|None
+    """
+    buf = self._read_entry(filename)
+    if buf is None:
+      return None
+    times, mixes = self._decode_alignment(buf)
+    if raw:
+      return times, mixes
+    allophones, states = self.get_states(mixes)
+    return times, allophones, states
 
   def has_entry(self, filename):
     """
@@ -365,46 +448,37 @@ class FileArchive:
   def read(self, filename, typ):
     """
     :param str filename: the entry-name in the archive
-    :param str typ: "str", "feat" or "align"
+    :param str typ: "str", "feat", "align" or "align_raw"
     :return: depending on typ, "str" -> string, "feat" -> (time, data), "align" -> align,
       where string is a str,
       time is list of time-stamp tuples (start-time,end-time) in millisecs,
         data is a list of features, each a numpy vector,
       align is a list of (time, allophone, state), time is an int from 0 to len of align,
-        allophone is some int, state is e.g. in [0,1,2].
+        allophone is some int, state is e.g. in [0,1,2]. for "align_raw", (time, allophone state idx, None).
     :rtype: str|(list[numpy.ndarray],list[numpy.ndarray])|list[(int,int,int)]
+
+    This is the list-based API. See :func:`read_features` and :func:`read_alignment` for the faster variants.
     """
+    buf = self._read_entry(filename)
+    if buf is None:
+      return None
 
-    if filename not in self.ft:
-      if filename in self._short_seg_names:
-        filename = self._short_seg_names[filename]
+    if typ == "str":
+      return buf.decode("ascii")
 
-    fi = self.ft[filename]
-    self.f.seek(fi.pos)
-    size = self.read_U32()
-    comp = self.read_U32()
-    self.read_U32()  # chk
-    if size == 0:
-      return None
+    elif typ == "feat":
+      times, features = self._decode_features(buf)
+      return list(times), list(features)
 
-    if comp > 0:
-      # read compressed bytes into memory as 'bytearray'
-      a = array.array('b')
-      a.fromfile(self.f, comp)
-      # unpack
-      b = zlib.decompress(a.tostring(), 15+32)
-      # substitute self.f by an anonymous memmap file object
-      # restore original file handle after we're done
-      backup_f = self.f
-      self.f = mmap.mmap(-1, len(b))
-      self.f.write(b)
-      self.f.seek(0)
-      try:
-        return self._raw_read(size=fi.size, typ=typ)
-      finally:
-        self.f = backup_f
+    elif typ in ["align", "align_raw"]:
+      times, mixes = self._decode_alignment(buf)
+      if typ == "align_raw":
+        return [(t, mix, None) for (t, mix) in zip(times.tolist(), mixes.tolist())]
+      allophones, states = self.get_states(mixes)
+      return list(zip(times.tolist(), allophones.tolist(), states.tolist()))
 
-    return self._raw_read(size=fi.size, typ=typ)
+    else:
+      raise NotImplementedError("typ: %r" % typ)
 
   def get_state(self, mix):
     """
@@ -424,6 +498,25 @@ class FileArchive:
     assert mix >= 0
     return mix, state
 
+  def get_states(self, mixes):
+    """
+    Like :func:`get_state`, for all frames at once.
+
+    :param numpy.ndarray mixes: (T,) int
+    :return: allophones, states, both (T,) int32
+    :rtype: (numpy.ndarray, numpy.ndarray)
+    """
+    assert self.allophones
+    max_states = 6
+    allophones = numpy.array(mixes, dtype="int64")
+    states = numpy.zeros(allophones.shape, dtype="int32")
+    for state in range(max_states):
+      mask = allophones >= len(self.allophones)
+      allophones[mask] -= (1 << 26)
+      states[mask] = min(state + 1, max_states - 1)
+    assert numpy.all(allophones >= 0)
+    return allophones.astype("int32"), states
+
   def set_allophones(self, f):
     """
     :param str f: allophone filename. line-separated. will ignore lines starting with "#"
@@ -494,6 +587,7 @@ class FileArchive:
 class FileArchiveBundle:
   """
   File archive bundle.
+  Reading entries is thread-safe, like for :class:`FileArchive`.
   """
 
   def __init__(self, filename):
@@ -504,13 +598,15 @@ class FileArchiveBundle:
     self.archives = {}  # type: typing.Dict[str,FileArchive]
     # archive content file -> FileArchive
     self.files = {}  # type: typing.Dict[str,FileArchive]
-    self._short_seg_names = {}
     for line in open(filename).read().splitlines():
       self.archives[line] = a = FileArchive(line, must_exists=True)
       for f in a.ft.keys():
         self.files[f] = a
-      # noinspection PyProtectedMember
-      self._short_seg_names.update(a._short_seg_names)
+    # Short seg name (basename) -> idx in self._short_seg_names_full.
+    # noinspection PyProtectedMember
+    self._short_seg_names = SeqTagIndex.concat([a._short_seg_names for a in self.archives.values()])
+    # noinspection PyProtectedMember
+    self._short_seg_names_full = [n for a in self.archives.values() for n in a._short_seg_names_full]
 
   def file_list(self):
     """
@@ -540,10 +636,35 @@ class FileArchiveBundle:
 
     Uses FileArchive.read().
     """
+    return self._get_archive(filename).read(filename, typ)
+
+  def _get_archive(self, filename):
+    """
+    :param str filename: the entry-name in the archive
+    :rtype: FileArchive
+    """
     if filename not in self.files:
-      if filename in self._short_seg_names:
-        filename = self._short_seg_names[filename]
-    return self.files[filename].read(filename, typ)
+      short_idx = self._short_seg_names.get(filename)
+      if short_idx is not None:
+        filename = self._short_seg_names_full[short_idx]
+    return self.files[filename]
+
+  def read_features(self, filename):
+    """
+    :param str filename: the entry-name in the archive
+    :return: times (T,2) float64, features (T,dim) float32. see :func:`FileArchive.read_features`
+    :rtype: (numpy.ndarray, numpy.ndarray)|None
+    """
+    return self._get_archive(filename).read_features(filename)
+
+  def read_alignment(self, filename, raw=False):
+    """
+    :param str filename: the entry-name in the archive
+    :param bool raw:
+    :return: see :func:`FileArchive.read_alignment`
+    :rtype: (numpy.ndarray, numpy.ndarray)|(numpy.ndarray, numpy.ndarray, numpy.ndarray)|None
+    """
+    return self._get_archive(filename).read_alignment(filename, raw=raw)
 
   def set_allophones(self, filename):
     """
@@ -635,6 +756,7 @@ class AllophoneLabeling(object):
         print("AllophoneLabeling: State tying with %i labels." % self.num_labels, file=verbose_out)
     assert self.num_labels is not None
     assert self.state_tying or self.phoneme_idxs
+    self._label_idx_table = None  # type: typing.Optional[numpy.ndarray]
 
   def _get_num_allo_states(self):
     assert self.state_tying
@@ -659,6 +781,55 @@ class AllophoneLabeling(object):
     assert allo_idx >= 0
     return self.get_label_idx(allo_idx, state_idx)
 
+  def _get_label_idx_table(self):
+    """
+    :return: label idx per (state idx, allo idx), -1 if not defined
+    :rtype: numpy.ndarray
+    """
+    if self._label_idx_table is not None:
+      return self._label_idx_table
+    if self.state_tying_by_allo_state_idx:
+      table = numpy.full((self.num_allo_states, len(self.allophones)), -1, dtype="int32")
+      for allo_state_idx, label_idx in self.state_tying_by_allo_state_idx.items():
+        table[allo_state_idx >> 26, allo_state_idx & ((1 << 26) - 1)] = label_idx
+    else:
+      table = numpy.full((1, len(self.allophones)), -1, dtype="int32")
+      for allo_idx, allo_str in enumerate(self.allophones):
+        if "{" in allo_str:
+          table[0, allo_idx] = self.phoneme_idxs.get(allo_str[:allo_str.index("{")], -1)
+    self._label_idx_table = table
+    return table
+
+  def get_label_idxs(self, allo_idxs, state_idxs):
+    """
+    Like :func:`get_label_idx`, for all frames at once.
+
+    :param numpy.ndarray allo_idxs: (T,) int
+    :param numpy.ndarray state_idxs: (T,) int
+    :rtype: numpy.ndarray
+    """
+    table = self._get_label_idx_table()
+    if not self.state_tying_by_allo_state_idx:
+      state_idxs = numpy.zeros_like(state_idxs)  # label only depends on the phoneme
+    valid = state_idxs < table.shape[0]
+    label_idxs = numpy.full(numpy.shape(allo_idxs), -1, dtype="int32")
+    label_idxs[valid] = table[state_idxs[valid], allo_idxs[valid]]
+    if numpy.any(label_idxs < 0):
+      i = int(numpy.argmax(label_idxs < 0))
+      self.get_label_idx(int(allo_idxs[i]), int(state_idxs[i]))  # will raise some KeyError
+      assert False, "allo idx %i, state idx %i not found" % (allo_idxs[i], state_idxs[i])
+    return label_idxs
+
+  def get_label_idxs_by_allo_state_idxs(self, allo_state_idxs):
+    """
+    Like :func:`get_label_idx_by_allo_state_idx`, for all frames at once.
+
+    :param numpy.ndarray allo_state_idxs: (T,) int
+    :rtype: numpy.ndarray
+    """
+    allo_state_idxs = numpy.asarray(allo_state_idxs)
+    return self.get_label_idxs(allo_state_idxs & ((1 << 26) - 1), allo_state_idxs >> 26)
+
   def get_label_idx(self, allo_idx, state_idx):
     """
     :param int allo_idx:
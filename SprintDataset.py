@@ -1010,12 +1010,11 @@ class SprintCacheDataset(CachedDataset2):
       """
       assert self.type == "feat"
       assert self.content_keys
-      times, feats = self.sprint_cache.read(self.content_keys[0], "feat")
+      times, feats = self.sprint_cache.read_features(self.content_keys[0])
       assert len(times) == len(feats) > 0
-      feat = feats[0]
-      assert isinstance(feat, numpy.ndarray)
-      assert feat.ndim == 1
-      return feat.shape[0]
+      assert isinstance(feats, numpy.ndarray)
+      assert feats.ndim == 2
+      return feats.shape[1]
 
     def read(self, name):
       """
@@ -1023,30 +1022,39 @@ class SprintCacheDataset(CachedDataset2):
       :return: numpy array of shape (time, [num_labels])
       :rtype: numpy.ndarray
       """
-      res = self.sprint_cache.read(name, typ=self.type)
       if self.type == "align":
-        label_seq = numpy.array([self.allophone_labeling.get_label_idx(a, s) for (t, a, s) in res], dtype=self.dtype)
-        assert label_seq.shape == (len(res),)
-        return label_seq
+        times, allophones, states = self.sprint_cache.read_alignment(name)
+        return self.allophone_labeling.get_label_idxs(allophones, states).astype(self.dtype)
       elif self.type == "align_raw":
-        label_seq = numpy.array(
-          [self.allophone_labeling.state_tying_by_allo_state_idx[a] for (t, a, s) in res], dtype=self.dtype)
-        assert label_seq.shape == (len(res),)
-        return label_seq
+        times, allo_state_idxs = self.sprint_cache.read_alignment(name, raw=True)
+        return self.allophone_labeling.get_label_idxs_by_allo_state_idxs(allo_state_idxs).astype(self.dtype)
       elif self.type == "feat":
-        times, feats = res
-        assert len(times) == len(feats) > 0
-        feat_mat = numpy.array(feats, dtype=self.dtype)
+        times, feat_mat = self.sprint_cache.read_features(name)
+        assert len(times) == len(feat_mat) > 0
         assert feat_mat.shape == (len(times), self.num_labels)
         return feat_mat
       else:
         assert False
 
-  def __init__(self, data, **kwargs):
+  def __init__(self, data, num_prefetch_threads=0, prefetch_size=None, **kwargs):
     """
     :param dict[str,dict[str]] data: data-key -> dict which keys such as filename, see SprintCacheReader constructor
+    :param int num_prefetch_threads: if > 0, reads upcoming seqs in a thread pool of this size.
+      the Sprint caches can be read from multiple threads concurrently.
+    :param int|None prefetch_size: how many seqs to read ahead. by default 4 * num_prefetch_threads
     """
     super(SprintCacheDataset, self).__init__(**kwargs)
+    if num_prefetch_threads > 0:
+      try:
+        # noinspection PyUnresolvedReferences,PyCompatibility
+        import concurrent.futures  # Python 3, or the futures backport on Python 2
+      except ImportError:
+        print("%s: concurrent.futures not available, no prefetching." % self, file=log.v3)
+        num_prefetch_threads = 0
+    self._num_prefetch_threads = num_prefetch_threads
+    self._prefetch_size = prefetch_size or 4 * num_prefetch_threads
+    self._prefetch_pool = None  # type: typing.Optional[concurrent.futures.ThreadPoolExecutor]
+    self._prefetch_futures = {}  # type: typing.Dict[int,concurrent.futures.Future]  # seq_idx -> DatasetSeq
     self.data = {key: self.SprintCacheReader(data_key=key, **opts) for (key, opts) in data.items()}
     self.seq_list_original = self.data["data"].content_keys
     self.seq_list_ordered = self.seq_list_original
@@ -1082,6 +1090,7 @@ class SprintCacheDataset(CachedDataset2):
     super(SprintCacheDataset, self).init_seq_order(epoch=epoch, seq_list=seq_list)
     if not need_reinit:
       return False
+    self._cancel_prefetch()
     self._num_seqs = len(self.seq_list_original)
     data0 = self.data["data"]
     assert isinstance(data0, self.SprintCacheReader)
@@ -1113,9 +1122,37 @@ class SprintCacheDataset(CachedDataset2):
     """
     if seq_idx >= self.num_seqs:
       return None
-    seq_tag = self.get_tag(seq_idx)  # type: str
+    if self._num_prefetch_threads > 0:
+      self._prefetch(seq_idx)
+      return self._prefetch_futures.pop(seq_idx).result()
+    seq_tag = self.seq_list_ordered[seq_idx]  # type: str
     return self.get_dataset_seq_for_name(seq_idx=seq_idx, name=seq_tag)
 
+  def _prefetch(self, seq_idx):
+    """
+    Makes sure that seq_idx and the following seqs are being read in the thread pool.
+
+    :param int seq_idx:
+    """
+    # Seqs before seq_idx will not be requested anymore, e.g. because they were skipped.
+    for seq_idx_ in [i for i in self._prefetch_futures if i < seq_idx]:
+      self._prefetch_futures.pop(seq_idx_).cancel()
+    if self._prefetch_pool is None:
+      import concurrent.futures
+      self._prefetch_pool = concurrent.futures.ThreadPoolExecutor(max_workers=self._num_prefetch_threads)
+    for seq_idx_ in range(seq_idx, min(seq_idx + max(self._prefetch_size, 1), self.num_seqs)):
+      if seq_idx_ not in self._prefetch_futures:
+        self._prefetch_futures[seq_idx_] = self._prefetch_pool.submit(
+          self.get_dataset_seq_for_name, seq_idx=seq_idx_, name=self.seq_list_ordered[seq_idx_])
+
+  def _cancel_prefetch(self):
+    """
+    Cancels all pending reads, e.g. because the seq order changed.
+    """
+    for future in self._prefetch_futures.values():
+      future.cancel()
+    self._prefetch_futures.clear()
+
   def get_data_keys(self):
     """
     :rtype: list[str]
@@ -1132,7 +1169,7 @@ class SprintCacheDataset(CachedDataset2):
     """
     :rtype: str
     """
-    return self.seq_list_ordered[sorted_seq_idx]
+    return self.seq_list_ordered[self._get_underlying_seq_idx(sorted_seq_idx)]
 
 
 def demo():
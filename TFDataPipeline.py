@@ -89,7 +89,15 @@ Also, instead of finishing this, probably using the tf.dataset is the better app
 Implementation via new tf.dataset API
 -------------------------------------
 
-This is planned, but not yet started.
+This is implemented in :class:`TFDatasetDataProvider`, enabled via the config option ``tf_data_pipeline``.
+The batches are planned and assembled just as in :class:`FeedDictDataProvider`,
+but they are passed to the network via a ``tf.data.Dataset.from_generator`` with ``prefetch``,
+and a reinitializable iterator (:class:`TFDataIteratorInput`) which replaces the extern data placeholders.
+Thus the conversion of the batch into tensors overlaps with the computation of the previous step.
+Restriction: every ``session.run`` which uses the extern data consumes one batch from the iterator,
+and the data which is still fed (e.g. "seq_idx", "seq_tag") must belong to that batch.
+Thus there must be exactly one such ``session.run`` per step, with the feed dict from the data provider.
+This is checked in the graph, i.e. an additional ``session.run`` raises an error.
 
 
 Some use case
@@ -136,11 +144,11 @@ import sys
 import typing
 try:
   # noinspection PyCompatibility
-  from Queue import Queue
+  from Queue import Queue, Empty, Full
 except ImportError:
   # noinspection PyCompatibility,PyUnresolvedReferences
-  from queue import Queue
-from threading import Thread, Condition
+  from queue import Queue, Empty, Full
+from threading import Thread, Condition, Lock
 
 import numpy
 import tensorflow as tf
@@ -926,6 +934,59 @@ class DataProviderBase(object):
     raise NotImplementedError
 
 
+class BatchBufferPool(object):
+  """
+  Reusable numpy buffers for the batches of :class:`FeedDictDataProvider`, to avoid the allocations for every batch.
+  One buffer set (dict key -> flat numpy array) is used for one batch,
+  and must be given back via :func:`release` when the batch was consumed (i.e. after ``session.run``).
+  The buffers grow to the max shape which was needed so far.
+  """
+
+  DataKey = "_batch_buffers"  # the buffer set is passed along in the batch data dict via this key
+
+  def __init__(self, max_size):
+    """
+    :param int max_size: max number of buffer sets we keep. e.g. queue capacity + 2 (producer and consumer)
+    """
+    self.free = Queue(maxsize=max_size)  # type: Queue  # of dict[str,numpy.ndarray]
+
+  def acquire(self):
+    """
+    :return: buffer set. creates a new one if there is no free one, i.e. this never blocks
+    :rtype: dict[str,numpy.ndarray]
+    """
+    try:
+      return self.free.get_nowait()
+    except Empty:
+      return {}
+
+  def release(self, buffers):
+    """
+    :param dict[str,numpy.ndarray] buffers: from :func:`acquire`
+    """
+    try:
+      self.free.put_nowait(buffers)
+    except Full:
+      pass  # just drop it
+
+  @staticmethod
+  def get_array(buffers, key, shape, dtype):
+    """
+    :param dict[str,numpy.ndarray] buffers: from :func:`acquire`
+    :param str key:
+    :param list[int]|tuple[int] shape:
+    :param str|numpy.dtype dtype:
+    :return: contiguous array of the given shape, which uses the buffer memory. not initialized
+    :rtype: numpy.ndarray
+    """
+    size = int(numpy.prod(shape))
+    buf = buffers.get(key)
+    if buf is None or buf.size < size or buf.dtype != numpy.dtype(dtype):
+      buf = numpy.empty((size,), dtype=dtype)
+      buffers[key] = buf
+    return buf[:size].reshape(shape)
+
+
 class FeedDictDataProvider(DataProviderBase):
   """
   This class will fill all the placeholders used for training or forwarding or evaluation etc.
@@ -934,7 +995,7 @@ class FeedDictDataProvider(DataProviderBase):
   """
 
   def __init__(self, tf_session, dataset, batches, enforce_min_len1=False, capacity=10, tf_queue=None,
-               batch_slice=None, **kwargs):
+               batch_slice=None, num_threads=1, **kwargs):
     """
     :param tf.Session|tf.InteractiveSession tf_session:
     :param Dataset dataset:
@@ -945,6 +1006,10 @@ class FeedDictDataProvider(DataProviderBase):
     :param int capacity:
     :param TFDataQueues|None tf_queue:
     :param slice|None batch_slice: select a subset of the batches
+    :param int num_threads: number of threads which assemble batches in parallel.
+      The batches are still enqueued in the original order.
+      Only used if the dataset allows non-monotonic load_seqs calls,
+      see :func:`Dataset.batch_set_generator_cache_whole_epoch`.
     """
     super(FeedDictDataProvider, self).__init__(**kwargs)
     self.tf_session = tf_session
@@ -952,15 +1017,22 @@ class FeedDictDataProvider(DataProviderBase):
     self.batches = batches
     self.enforce_min_len1 = enforce_min_len1
     self.batch_slice = batch_slice
+    assert num_threads >= 1
+    self.num_threads = num_threads
     self.state_change_cond = Condition()
     self.queue = None  # type: typing.Optional[Queue]
     self.tf_queue = tf_queue
     if not self.tf_queue:
       self.queue = Queue(maxsize=capacity)
+    self.buffer_pool = BatchBufferPool(max_size=capacity + 2)
+    self._consumed_buffers = None  # type: typing.Optional[typing.Dict[str,numpy.ndarray]]  # of the last batch
     self.thread = None  # type: typing.Optional[Thread]
     self.thread_finished = False
     self.cur_batch_idx = 0
     self.reached_end = False
+    self.num_frames = NumbersDict(0)  # real frames per data key, for the padding ratio
+    self.num_padded_frames = NumbersDict(0)  # including padding
+    self._stats_lock = Lock()  # for num_frames, num_padded_frames, when assembling in multiple threads
 
   def start_threads(self):
     """
@@ -981,15 +1053,15 @@ class FeedDictDataProvider(DataProviderBase):
     self._flush_all_data()
     self.thread.join()
 
-  def get_next_batch(self, consider_batch_slice):
+  def _get_next_batch_for_assembly(self, consider_batch_slice):
     """
     This assumes that we have more data, i.e. self.batches.has_more().
+    This does not advance self.batches.
 
     :param bool consider_batch_slice:
-    :returns: batch-data-value-dict or None. if not consider_batch_slice, will never be None
-    :rtype: dict[str,numpy.ndarray]|None
+    :returns: the next batch, or None if it is not selected by the batch slice
+    :rtype: EngineBatch.Batch|None
     """
-    # See EngineUtil.assign_dev_data() for reference.
     cur_batch_idx = self.cur_batch_idx
     batch, = self.batches.peek_next_n(1)
     self.cur_batch_idx += 1
@@ -1004,6 +1076,33 @@ class FeedDictDataProvider(DataProviderBase):
         return None
       if step > 1 and (cur_batch_idx - start) % step != 0:
         return None
+    return batch
+
+  def get_next_batch(self, consider_batch_slice):
+    """
+    This assumes that we have more data, i.e. self.batches.has_more().
+
+    :param bool consider_batch_slice:
+    :returns: batch-data-value-dict or None. if not consider_batch_slice, will never be None
+    :rtype: dict[str,numpy.ndarray]|None
+    """
+    batch = self._get_next_batch_for_assembly(consider_batch_slice=consider_batch_slice)
+    if batch is None:
+      return None
+    return self.assemble_batch(batch)
+
+  def assemble_batch(self, batch):
+    """
+    Loads the seqs of the batch and copies them into the (padded) batch arrays.
+    This can be called from multiple threads at the same time.
+    The dataset lock is only held while loading the seqs and fetching the seq data,
+    the copying and padding happens outside of it.
+
+    :param EngineBatch.Batch batch:
+    :returns: batch-data-value-dict
+    :rtype: dict[str,numpy.ndarray]
+    """
+    # See EngineUtil.assign_dev_data() for reference.
     from Dataset import Batch, shapes_for_batches
     assert isinstance(batch, Batch)
     # In Returnn with Theano, we usually have the shape (time,batch,feature).
@@ -1012,67 +1111,181 @@ class FeedDictDataProvider(DataProviderBase):
     # This must match the Data specification in TFNetwork.ExternData.init_from_config().
     shapes = shapes_for_batches(
       [batch], data_keys=self.data_keys, extern_data=self.extern_data, enforce_min_len1=self.enforce_min_len1)
-    data = {k: numpy.zeros(shape=shapes[k], dtype=self.extern_data.data[k].dtype)
-            for k in self.data_keys if self.extern_data.data[k].dtype != "string"}
-    # Numpy cannot handle "string" dtype. Just make it a list[str], which is what TF can handle.
-    data.update({k: [""] * batch.num_slices
-                 for k in self.data_keys if self.extern_data.data[k].dtype == "string"})
+    # The arrays use reusable buffers. See :func:`get_feed_dict` where they are released again.
+    # Arrays with time axis are not zeroed here, only the padded frames, see below.
+    buffers = self.buffer_pool.acquire()
+    data = {BatchBufferPool.DataKey: buffers}  # type: typing.Dict[str,typing.Any]
+    seq_lens = {}
+    for k in self.data_keys:
+      data_info = self.extern_data.data[k]
+      if data_info.dtype == "string":
+        # Numpy cannot handle "string" dtype. Just make it a list[str], which is what TF can handle.
+        data[k] = [""] * batch.num_slices
+        continue
+      data[k] = self.buffer_pool.get_array(buffers, key=k, shape=shapes[k], dtype=data_info.dtype)
+      if data_info.have_time_axis():
+        seq_lens[k] = self.buffer_pool.get_array(
+          buffers, key="%s_seq_lens" % k, shape=(shapes[k][0],), dtype=data_info.size_dtype)
+        seq_lens[k].fill(0)
+      else:
+        data[k].fill(0)
     data.update({"seq_idx": [-1] * batch.num_slices, "seq_tag": [""] * batch.num_slices})
-    seq_lens = {k: numpy.zeros(shape=(shapes[k][0],), dtype=self.extern_data.data[k].size_dtype)
-                for k in self.data_keys if self.extern_data.data[k].have_time_axis()}
-    self.dataset.load_seqs(batch.start_seq, batch.end_seq)
-    from Util import slice_pad_zeros
+    num_frames = NumbersDict({k: 0 for k in seq_lens})  # real frames, without padding
+    time_keys = []
+    other_keys = []
+    for k in self.data_keys:
+      # Some special cases first, such as "seq_idx" and "seq_tag".
+      # See also :func:`TFNetwork.get_extern_data`.
+      if k in ["seq_idx", "seq_tag"]:
+        continue  # handled below. will always be added
+      if k in self.extern_data.extra_added_keys:
+        continue
+      if self.extern_data.data[k].have_time_axis():
+        time_keys.append(k)
+      else:
+        other_keys.append(k)
+    # Fetch the data of all seqs. The returned arrays stay valid after we release the lock.
+    seqs_data = []  # type: typing.List[typing.Dict[str,numpy.ndarray]]
     with self.dataset.lock:
+      self.dataset.load_seqs(batch.start_seq, batch.end_seq)
       for seq in batch.seqs:
-        o = seq.batch_frame_offset
-        q = seq.batch_slice
-        length = seq.frame_length
         # input-data, input-index will also be set in this loop. That is data-key "data".
-        for k in self.data_keys:
-          # Some special cases first, such as "seq_idx" and "seq_tag".
-          # See also :func:`TFNetwork.get_extern_data`.
-          if k in ["seq_idx", "seq_tag"]:
-            continue  # handled below. will always be added
-          if k in self.extern_data.extra_added_keys:
-            continue
-          if self.extern_data.data[k].have_time_axis():
-            if length.get(k) in [0, None]:
-              continue
-          v = self.dataset.get_data(seq.seq_idx, k)
-          if self.extern_data.data[k].have_time_axis():
-            v = slice_pad_zeros(v, begin=seq.seq_start_frame[k], end=seq.seq_end_frame[k])
-            ls = v.shape[0]
-            if ls != length[k]:
-              raise Exception("got shape[0]: %i, expected: %i, start/end: %r/%r, seq_idx: %i, seq len: %r" % (
-                ls, length[k], seq.seq_start_frame, seq.seq_end_frame, seq.seq_idx,
-                self.dataset.get_seq_length(seq.seq_idx)))
-            data[k][q, o[k]:o[k] + ls] = v
-            seq_lens[k][q] = max(seq_lens[k][q], o[k] + ls)
-          else:  # no time-axis
-            data[k][q] = v
-        data["seq_idx"][q] = seq.seq_idx
-        data["seq_tag"][q] = self.dataset.get_tag(seq.seq_idx)
+        length = seq.frame_length
+        seqs_data.append({
+          k: self.dataset.get_data(seq.seq_idx, k)
+          for k in other_keys + [k for k in time_keys if length.get(k) not in [0, None]]})
+        data["seq_idx"][seq.batch_slice] = seq.seq_idx
+        data["seq_tag"][seq.batch_slice] = self.dataset.get_tag(seq.seq_idx)
+    from Util import slice_pad_zeros
+    for seq, seq_data in zip(batch.seqs, seqs_data):
+      o = seq.batch_frame_offset
+      q = seq.batch_slice
+      length = seq.frame_length
+      for k, v in seq_data.items():
+        if k in seq_lens:
+          begin, end = seq.seq_start_frame[k], seq.seq_end_frame[k]
+          if 0 <= begin <= end <= v.shape[0]:
+            v = v[begin:end]  # no copy needed
+          else:
+            v = slice_pad_zeros(v, begin=begin, end=end)
+          ls = v.shape[0]
+          if ls != length[k]:
+            raise Exception("got shape[0]: %i, expected: %i, start/end: %r/%r, seq_idx: %i, seq len: %r" % (
+              ls, length[k], seq.seq_start_frame, seq.seq_end_frame, seq.seq_idx,
+              self.dataset.get_seq_length(seq.seq_idx)))
+          if o[k] > seq_lens[k][q]:  # gap to the previous part in this slice
+            data[k][q, seq_lens[k][q]:o[k]] = 0
+          data[k][q, o[k]:o[k] + ls] = v
+          seq_lens[k][q] = max(seq_lens[k][q], o[k] + ls)
+          num_frames[k] += ls
+        else:  # no time-axis
+          data[k][q] = v
+    num_padded_frames = NumbersDict(0)
     for k in seq_lens.keys():
+      for q in range(batch.num_slices):
+        data[k][q, seq_lens[k][q]:] = 0  # padding
       data["%s_seq_lens" % k] = seq_lens[k]
+      num_padded_frames += NumbersDict({k: int(shapes[k][0] * shapes[k][1])})
+    with self._stats_lock:
+      self.num_frames += num_frames
+      self.num_padded_frames += num_padded_frames
     return data
 
+  def get_padding_ratio(self):
+    """
+    :return: data key -> real frames / padded frames, over all batches so far. 1.0 means no padding
+    :rtype: dict[str,float]
+    """
+    return {
+      k: float(self.num_frames[k]) / self.num_padded_frames[k]
+      for k in sorted(self.num_padded_frames.keys()) if self.num_padded_frames[k] > 0}
+
+  def _enqueue_batch(self, enqueue_args):
+    """
+    :param dict[str,numpy.ndarray] enqueue_args: from :func:`assemble_batch`
+    """
+    if self.queue:
+      self.queue.put(enqueue_args)
+    else:
+      # The buffers are not given back to the pool. session.run does not necessarily copy the fed arrays,
+      # so the TF queue might still refer to them, and we do not know when the batch is dequeued.
+      enqueue_args.pop(BatchBufferPool.DataKey)
+      self.tf_queue.enqueue(tf_session=self.tf_session, data=enqueue_args)
+    with self.state_change_cond:
+      self.state_change_cond.notifyAll()
+
+  def _get_num_assembler_threads(self):
+    """
+    :return: number of threads to use for assembling the batches
+    :rtype: int
+    """
+    if self.num_threads <= 1:
+      return 1
+    # Assembling in parallel means that load_seqs is not called with monotonic seq idxs anymore.
+    if not self.dataset.batch_set_generator_cache_whole_epoch():
+      print("Dataset %r does not support non-monotonic load_seqs, using a single thread for the batches." % (
+        self.dataset.name,), file=log.v3)
+      return 1
+    try:
+      # noinspection PyUnresolvedReferences,PyCompatibility
+      import concurrent.futures  # Python 3, or the futures backport on Python 2
+    except ImportError:
+      print("concurrent.futures not available, using a single thread for the batches.", file=log.v3)
+      return 1
+    return self.num_threads
+
+  def _thread_main_single(self):
+    while self.batches.has_more() and not self.coord.should_stop():
+      enqueue_args = self.get_next_batch(consider_batch_slice=True)
+      if enqueue_args is not None:
+        self._enqueue_batch(enqueue_args)
+      else:
+        with self.state_change_cond:
+          self.state_change_cond.notifyAll()
+      self.batches.advance(1)
+
+  def _thread_main_multi(self, num_threads):
+    """
+    The BatchSetGenerator is only accessed by this thread.
+    The batches are assembled by the thread pool, and we enqueue them in the original order.
+
+    :param int num_threads:
+    """
+    import concurrent.futures
+    from collections import deque
+    pending = deque()  # type: typing.Deque[concurrent.futures.Future]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=num_threads) as pool:
+      try:
+        while self.batches.has_more() and not self.coord.should_stop():
+          batch = self._get_next_batch_for_assembly(consider_batch_slice=True)
+          if batch is not None:
+            pending.append(pool.submit(self.assemble_batch, batch))
+          self.batches.advance(1)
+          while len(pending) >= num_threads or (pending and pending[0].done()):
+            self._enqueue_batch(pending.popleft().result())
+        while pending and not self.coord.should_stop():
+          self._enqueue_batch(pending.popleft().result())
+      finally:
+        for future in pending:
+          future.cancel()
+
   def _thread_main(self):
     try:
       import better_exchook
       better_exchook.install()
 
-      while self.batches.has_more() and not self.coord.should_stop():
-        enqueue_args = self.get_next_batch(consider_batch_slice=True)
-        if enqueue_args is not None:
-          if self.queue:
-            self.queue.put(enqueue_args)
-          else:
-            self.tf_queue.enqueue(tf_session=self.tf_session, data=enqueue_args)
-        with self.state_change_cond:
-          self.state_change_cond.notifyAll()
-        self.batches.advance(1)
+      num_threads = self._get_num_assembler_threads()
+      if num_threads > 1:
+        self._thread_main_multi(num_threads=num_threads)
+      else:
+        self._thread_main_single()
 
       self.reached_end = not self.batches.has_more()
+      padding_ratio = self.get_padding_ratio()
+      if self.reached_end and padding_ratio:
+        print("Dataset %r padding ratio (real frames / padded frames): %s" % (
+          self.dataset.name, ", ".join(["%s %.3f" % (k, v) for (k, v) in sorted(padding_ratio.items())])),
+          file=log.v4)
 
     except Exception as exc:
       print("Exception in DataProvider thread: %r" % exc, file=log.v1)
@@ -1112,7 +1325,7 @@ class FeedDictDataProvider(DataProviderBase):
     """
     while self.have_more_data(None):
       if self.queue:
-        self.queue.get()
+        self.buffer_pool.release(self.queue.get().pop(BatchBufferPool.DataKey))
       else:
         raise NotImplementedError
 
@@ -1129,6 +1342,10 @@ class FeedDictDataProvider(DataProviderBase):
     """
     if self.tf_queue:
       return {}  # not needed to feed anything, it gets it via the queues
+    # We assume that the previous batch was consumed by now, i.e. session.run was called with it.
+    if self._consumed_buffers is not None:
+      self.buffer_pool.release(self._consumed_buffers)
+      self._consumed_buffers = None
     if single_threaded:
       assert self.batches.has_more()
       assert self.batch_slice is None
@@ -1136,6 +1353,7 @@ class FeedDictDataProvider(DataProviderBase):
     else:
       output = self.queue.get()
     assert isinstance(output, dict)
+    self._consumed_buffers = output.pop(BatchBufferPool.DataKey)
     # The data itself.
     d = {
       self.extern_data.get_data(k).placeholder: output[k]
@@ -1174,6 +1392,260 @@ class FeedDictDataProvider(DataProviderBase):
     return self.batches.completed_frac()
 
 
+class TFDataIteratorInput(object):
+  """
+  A reinitializable ``tf.data`` iterator which provides the extern data for the network,
+  i.e. its outputs replace the extern data placeholders.
+  This must be created before the network is constructed. See :class:`TFDatasetDataProvider`.
+  The outputs of the iterator can still be fed via feed_dict, thus :class:`FeedDictDataProvider` still works.
+  """
+
+  BatchIdxKey = "_batch_idx"  # additional output of the iterator, to check that the fed data belongs to the batch
+
+  def __init__(self, extern_data):
+    """
+    :param ExternData extern_data: the placeholders (and size placeholders) will be replaced
+    """
+    from TFUtil import DimensionTag
+    self.extern_data = extern_data
+    # seq_idx and seq_tag are usually created later, and anyway cheap to feed.
+    self.data_keys = sorted([
+      k for k in extern_data.data.keys()
+      if k not in ["seq_idx", "seq_tag"] and k not in extern_data.extra_added_keys])
+    self.output_types = {}  # type: typing.Dict[str,tf.DType]
+    self.output_shapes = {}  # type: typing.Dict[str,tf.TensorShape]
+    for k in self.data_keys:
+      data = extern_data.data[k]
+      self.output_types[k] = tf.as_dtype(data.dtype)
+      self.output_shapes[k] = tf.TensorShape(data.batch_shape)
+      for axis in data.size_placeholder.keys():
+        if axis != 0:
+          raise Exception(
+            "tf.data pipeline currently does not support variable shape in other dimensions than the first. "
+            "data %r, axis %i" % (data, axis))
+        self.output_types["%s_seq_lens" % k] = tf.as_dtype(data.size_dtype)
+        self.output_shapes["%s_seq_lens" % k] = tf.TensorShape((None,))
+    self.output_types[self.BatchIdxKey] = tf.int64
+    self.output_shapes[self.BatchIdxKey] = tf.TensorShape(())
+    self.cur_provider = None  # type: typing.Optional[TFDatasetDataProvider]
+    with tf.device("/cpu:0"):
+      with tf.name_scope("extern_data/tf_data/"):
+        self.iterator = tf.data.Iterator.from_structure(
+          output_types=self.output_types, output_shapes=self.output_shapes)
+        dataset = tf.data.Dataset.from_generator(
+          self._generator, output_types=self.output_types, output_shapes=self.output_shapes)
+        self._dataset_prefetch = tf.placeholder(name="prefetch", shape=(), dtype=tf.int64)
+        dataset = dataset.prefetch(self._dataset_prefetch)
+        self.init_op = self.iterator.make_initializer(dataset)
+        output = self.iterator.get_next()  # type: typing.Dict[str,tf.Tensor]
+        # The batch idx which belongs to the data which is fed, see TFDatasetDataProvider.get_feed_dict.
+        self.expected_batch_idx = tf.placeholder_with_default(
+          tf.constant(-1, dtype=tf.int64), name="expected_batch_idx", shape=())
+        check = tf.Assert(
+          tf.equal(output[self.BatchIdxKey], self.expected_batch_idx),
+          ["tf_data_pipeline: got batch", output[self.BatchIdxKey],
+           "from the iterator, but the fed data (e.g. seq_idx, seq_tag) is for batch", self.expected_batch_idx,
+           "(-1: not fed). Each session.run which uses the extern data consumes one batch,",
+           "thus there must be exactly one per step, with the feed dict of TFDatasetDataProvider."])
+        with tf.control_dependencies([check]):
+          self.output = {k: tf.identity(v) for (k, v) in output.items()}  # type: typing.Dict[str,tf.Tensor]
+    for k in self.data_keys:
+      data = extern_data.data[k]
+      data.placeholder = self.output[k]
+      for axis, old_size in list(data.size_placeholder.items()):
+        size = self.output["%s_seq_lens" % k]
+        tag = DimensionTag.get_tag_from_size_tensor(old_size)
+        if tag:
+          tag.set_tag_on_size_tensor(size)
+        data.size_placeholder[axis] = size
+    assert extern_data.iterator_input is None
+    extern_data.iterator_input = self
+
+  def _generator(self):
+    """
+    Called by TF when the iterator gets initialized.
+
+    :return: yields the batches of the current provider
+    :rtype: typing.Iterator[dict[str,numpy.ndarray|list]]
+    """
+    provider = self.cur_provider
+    assert provider, "%s: no current data provider" % self
+    for output in provider.iterate_batches():
+      yield output
+
+  def init_iterator(self, session, provider, prefetch):
+    """
+    :param tf.Session session:
+    :param TFDatasetDataProvider provider: will provide the batches until the next call of this
+    :param int prefetch: number of batches to prefetch into TF tensors
+    """
+    self.cur_provider = provider
+    session.run(self.init_op, feed_dict={self._dataset_prefetch: prefetch})
+
+
+class TFDatasetDataProvider(FeedDictDataProvider):
+  """
+  Like :class:`FeedDictDataProvider`, the batches are planned by the :class:`BatchSetGenerator`,
+  assembled (and padded) by the background thread(s) and put into a queue.
+  Then they are not passed via feed_dict but via the ``tf.data`` pipeline of :class:`TFDataIteratorInput`,
+  which prefetches them as tensors, i.e. the conversion overlaps with the computation of the previous step.
+  We do not use ``padded_batch`` because the batch plan has a variable number of seqs per batch,
+  and a batch slice can contain multiple parts (chunks) at different offsets.
+
+  Each ``session.run`` which uses the extern data consumes exactly one batch from the iterator,
+  and the batches stay in order, thus we know which batch is currently processed.
+  Data keys which are not covered by the iterator (e.g. "seq_idx", "seq_tag") are still fed via feed_dict.
+  Together with them, we feed the batch idx, and the graph checks that it matches the batch from the iterator,
+  see :class:`TFDataIteratorInput`.
+  """
+
+  def __init__(self, prefetch=2, **kwargs):
+    """
+    :param int prefetch: number of batches which are prefetched as TF tensors
+    """
+    super(TFDatasetDataProvider, self).__init__(**kwargs)
+    assert not self.tf_queue, "%s: tf_queue not supported" % self
+    self.iterator_input = self.extern_data.iterator_input  # type: TFDataIteratorInput
+    assert isinstance(self.iterator_input, TFDataIteratorInput), "%s: need tf_data_pipeline" % self
+    assert prefetch >= 1
+    self.prefetch = prefetch
+    # The batches in the iterator (prefetched) also keep their buffers.
+    self.buffer_pool = BatchBufferPool(max_size=self.queue.maxsize + prefetch + 3)
+    self._num_enqueued_batches = 0
+    from collections import deque
+    # For every batch which was put into the queue: the data which is not covered by the iterator.
+    self._pending_outputs = deque()  # type: typing.Deque[typing.Dict[str,typing.Any]]
+
+  def start_threads(self):
+    """
+    Initializes the iterator and starts the thread.
+    """
+    self.iterator_input.init_iterator(session=self.tf_session, provider=self, prefetch=self.prefetch)
+    super(TFDatasetDataProvider, self).start_threads()
+
+  def stop_threads(self):
+    """
+    Stop the thread.
+    """
+    if not self.thread:
+      return
+    self.coord.request_stop()
+    while self.thread.is_alive():
+      try:
+        self.queue.get(timeout=0.1)  # the thread could block in the queue put
+      except Empty:
+        pass
+    self.thread.join()
+    # The iterator (via prefetch) could still wait for the next batch. Tell it that there is nothing anymore.
+    self.queue.put(None)
+
+  def iterate_batches(self):
+    """
+    This gets called from the TF iterator (prefetch) thread.
+
+    :return: yields the batches from the queue, as they are given to the tf.data pipeline
+    :rtype: typing.Iterator[dict[str,numpy.ndarray|list]]
+    """
+    while True:
+      output = self.queue.get()
+      if output is None:  # end
+        return
+      yield output
+
+  def _get_iterator_batch(self, output, batch_idx):
+    """
+    :param dict[str] output: from :func:`assemble_batch`, without the buffers
+    :param int batch_idx:
+    :return: all the data of the iterator. data keys which we don't use are just empty
+    :rtype: dict[str,numpy.ndarray|list]
+    """
+    num_slices = len(output["seq_idx"])
+    d = {TFDataIteratorInput.BatchIdxKey: numpy.array(batch_idx, dtype="int64")}
+    for k in self.iterator_input.data_keys:
+      data = self.extern_data.data[k]
+      if k in output:
+        d[k] = output[k]
+        if "%s_seq_lens" % k in self.iterator_input.output_types:
+          d["%s_seq_lens" % k] = output["%s_seq_lens" % k]
+        continue
+      shape = [num_slices] + [(dim or 0) for dim in data.shape]
+      if data.dtype == "string":
+        d[k] = numpy.full(shape, "", dtype=object)
+      else:
+        d[k] = numpy.zeros(shape, dtype=data.dtype)
+      if "%s_seq_lens" % k in self.iterator_input.output_types:
+        d["%s_seq_lens" % k] = numpy.zeros((num_slices,), dtype=data.size_dtype)
+    return d
+
+  def _enqueue_batch(self, enqueue_args):
+    """
+    :param dict[str,numpy.ndarray] enqueue_args: from :func:`assemble_batch`
+    """
+    # The buffers are given back to the pool after the batch was consumed, see get_feed_dict.
+    # The tensors from the iterator might refer to the buffers until then.
+    buffers = enqueue_args.pop(BatchBufferPool.DataKey)
+    batch_idx = self._num_enqueued_batches
+    self._num_enqueued_batches += 1
+    self.queue.put(self._get_iterator_batch(enqueue_args, batch_idx=batch_idx))
+    pending_output = {k: v for (k, v) in enqueue_args.items() if k not in self.iterator_input.output_types}
+    pending_output[BatchBufferPool.DataKey] = buffers
+    pending_output[TFDataIteratorInput.BatchIdxKey] = batch_idx
+    with self.state_change_cond:
+      self._pending_outputs.append(pending_output)
+      self.state_change_cond.notifyAll()
+
+  def _thread_main(self):
+    try:
+      super(TFDatasetDataProvider, self)._thread_main()
+    finally:
+      self.queue.put(None)  # end of data for the iterator
+
+  def have_more_data(self, session):
+    """
+    :param tf.Session|None session:
+    :rtype: bool
+    :return: whether there is another batch which was enqueued but not consumed yet
+    """
+    with self.state_change_cond:
+      while True:
+        if self._pending_outputs:
+          return True
+        if self.thread_finished:
+          return False
+        if not self.thread.is_alive():
+          return False
+        # The thread is alive and working. Wait for a change.
+        self.state_change_cond.wait()
+
+  def get_feed_dict(self, single_threaded=False):
+    """
+    The data itself comes via the iterator, which is consumed by the following ``session.run``.
+    We only feed the data keys which are not covered by the iterator.
+
+    :param bool single_threaded: whether to not use the iterator but feed everything directly
+    :rtype: (dict[tf.Tensor,numpy.ndarray],dict[str])
+    """
+    if single_threaded:
+      # Any tensor can be fed, also the outputs of the iterator.
+      return super(TFDatasetDataProvider, self).get_feed_dict(single_threaded=True)
+    # We assume that the previous batch was consumed by now, i.e. session.run was called with it.
+    if self._consumed_buffers is not None:
+      self.buffer_pool.release(self._consumed_buffers)
+      self._consumed_buffers = None
+    with self.state_change_cond:
+      output = self._pending_outputs.popleft()
+    self._consumed_buffers = output.pop(BatchBufferPool.DataKey)
+    d = {self.iterator_input.expected_batch_idx: output[TFDataIteratorInput.BatchIdxKey]}
+    for k in self.data_keys:
+      if k in self.extern_data.extra_added_keys or k in self.iterator_input.output_types:
+        continue
+      data = self.extern_data.get_data(k)
+      d[data.placeholder] = output[k]
+      for dim, len_placeholder in data.size_placeholder.items():
+        d[len_placeholder] = output["%s_seq_lens" % k]
+    return d, {"seq_idx": output["seq_idx"], "seq_tag": output["seq_tag"]}
+
+
 class QueueDataProvider(DataProviderBase):
   """
   This class is supposed to encapsulate all the logic of this module and to be used by the TF engine.
@@ -1060,6 +1060,10 @@ class Engine(EngineBase):
       train_flag=train_flag,
       eval_flag=eval_flag,
       search_flag=search_flag)
+    if config.is_true("tf_data_pipeline"):
+      # Replaces the extern data placeholders. This must be done before the layers are constructed.
+      from TFDataPipeline import TFDataIteratorInput
+      TFDataIteratorInput(extern_data=network.extern_data)
     network.construct_from_dict(net_dict)
     if train_flag is not False and config.list("search_train_network_layers"):
       network.construct_extra_net(
@@ -1658,13 +1662,18 @@ class Engine(EngineBase):
       # noinspection PyPackageRequirements,PyUnresolvedReferences
       import horovod.tensorflow as hvd
       batch_slice = slice(hvd.rank(), None, hvd.size())
-    from TFDataPipeline import FeedDictDataProvider
-    data_provider = FeedDictDataProvider(
+    from TFDataPipeline import FeedDictDataProvider, TFDatasetDataProvider
+    kwargs = dict(
       tf_session=self.tf_session, extern_data=self.network.extern_data,
       data_keys=self.network.used_data_keys,
       dataset=dataset, batches=batches,
       batch_slice=batch_slice,
-      enforce_min_len1=self.config.is_true("enforce_min_len1", False))
+      enforce_min_len1=self.config.is_true("enforce_min_len1", False),
+      num_threads=self.config.int("feed_dict_num_threads", 1))
+    if self.network.extern_data.iterator_input:  # tf_data_pipeline
+      data_provider = TFDatasetDataProvider(prefetch=self.config.int("tf_data_prefetch", 2), **kwargs)
+    else:
+      data_provider = FeedDictDataProvider(**kwargs)
     return data_provider
 
   def get_specific_feed_dict(self, dataset, seq_idx):
@@ -2147,7 +2156,7 @@ class Engine(EngineBase):
     assert target_voc.num_labels == self.network.extern_data.data["classes"].dim
     if not isinstance(sources, list):
       sources = [sources]
-    source_seq_lists = [source_voc.get_seq(s) for s in sources]
+    source_seq_lists = source_voc.get_seqs(sources)
     results_raw = self.search_single_seq(sources=source_seq_lists, output_layer_name=output_layer_name)
     results = []
     for (score, raw) in results_raw:
@@ -31,6 +31,7 @@ class ExternData(object):
     if data:
       self.register_data_from_dict(data)
     self.extra_added_keys = set()  # set[str]
+    self.iterator_input = None  # type: typing.Optional[TFDataPipeline.TFDataIteratorInput]  # see tf_data_pipeline
 
   def __repr__(self):
     return "<ExternData data=%r>" % self.data
@@ -163,6 +163,7 @@ class SharedMem:
     shm_key_t = ctypes.c_int
     IPC_PRIVATE = 0
     IPC_RMID = 0
+    SHM_RDONLY = 0o10000
 
     # int shmget(key_t key, size_t size, int shmflg);
     shmget = libc.shmget
@@ -201,8 +202,15 @@ class SharedMem:
       cls.shmctl(shmid, cls.IPC_RMID, 0)
       return True
 
-    def __init__(self, size, shmid=None):
+    def __init__(self, size, shmid=None, readonly=False):
+      """
+      :param int size:
+      :param int|None shmid: if given, attaches to this existing segment, otherwise creates a new one
+      :param bool readonly: attach with SHM_RDONLY. only for an existing segment
+      """
+      assert not readonly or shmid is not None
       self.size = size
+      self.readonly = readonly
       self.shmid = None
       self.ptr = None
       if shmid is None:
@@ -216,7 +224,7 @@ class SharedMem:
         self.is_creator = False
         self.shmid = shmid
         assert self.shmid > 0
-      self.ptr = self.shmat(self.shmid, 0, 0)
+      self.ptr = self.shmat(self.shmid, 0, self.SHM_RDONLY if readonly else 0)
       self.check_ccall_error(self.ptr != self.ctypes.c_void_p(-1).value, "shmat")
       self.check_ccall_error(self.ptr > 0, "shmat")
 
@@ -234,7 +242,7 @@ class SharedMem:
       self.remove()
 
     def __getstate__(self):
-      return {"size": self.size, "shmid": self.shmid}
+      return {"size": self.size, "shmid": self.shmid, "readonly": self.readonly}
 
     def __setstate__(self, state):
       self.__init__(**state)
@@ -595,7 +603,8 @@ def getNormalDict(d):
   return r
 
 def make_numpy_ndarray_fromstring(s, dtype, shape):
-  return numpy.fromstring(s, dtype=dtype).reshape(shape)
+  # numpy.fromstring is deprecated for binary data. frombuffer is read-only, thus the copy.
+  return numpy.frombuffer(s, dtype=dtype).reshape(shape).copy()
 
 
 SharedMemNumpyConfig = {
@@ -785,7 +794,7 @@ class Pickler(_BasePickler):
         return
     # For some reason, Numpy fromstring/tostring is faster than Numpy loads/dumps.
     self.save(make_numpy_ndarray_fromstring)
-    self.save((obj.tostring(), str(obj.dtype), obj.shape))
+    self.save((obj.tobytes(), str(obj.dtype), obj.shape))
     self.write(pickle.REDUCE)
   dispatch[numpy.ndarray] = save_ndarray
 
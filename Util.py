@@ -12,6 +12,7 @@ from subprocess import CalledProcessError
 import h5py
 from collections import deque
 import inspect
+import operator
 import os
 import sys
 import shlex
@@ -1031,7 +1032,7 @@ def init_thread_join_hack():
       # them for delayed handling to the main thread which hangs.
       # See CPython signalmodule.c.
       # Currently the best solution I can think of:
-      while thread_obj.isAlive():
+      while thread_obj.is_alive():
         join_orig(thread_obj, timeout=0.1)
     elif thread.get_ident() == main_thread_id and timeout > 0.1:
       # Limit the timeout. This should not matter for the underlying code.
@@ -1528,12 +1529,36 @@ def load_json(filename=None, content=None):
   return json_content
 
 
+class _ClassOnlyMethod(object):
+  """
+  Like ``classmethod``, but when accessed via an instance, it returns ``instance_func`` instead.
+  """
+
+  def __init__(self, func, instance_func):
+    """
+    :param (type,...)->T func:
+    :param ()->None instance_func:
+    """
+    self.func = func
+    self.instance_func = instance_func
+
+  def __get__(self, instance, owner):
+    if instance is not None:
+      return self.instance_func
+    return self.func.__get__(owner, owner)
+
+
 class NumbersDict:
   """
   It's mostly like dict[str,float|int] & some optional broadcast default value.
   It implements the standard math bin ops in a straight-forward way.
+
+  This is used a lot in the batch generation (e.g. :func:`Dataset._generate_batches`),
+  thus we use ``__slots__`` and have some fast paths for the common case of the same keys.
   """
 
+  __slots__ = ("dict", "value")
+
   def __init__(self, auto_convert=None, numbers_dict=None, broadcast_value=None):
     """
     :param dict|NumbersDict|T auto_convert: first argument, so that we can automatically convert/copy
@@ -1557,7 +1582,12 @@ class NumbersDict:
 
     self.dict = numbers_dict
     self.value = broadcast_value
-    self.max = self.__max_error
+
+  def __getstate__(self):
+    return self.dict, self.value
+
+  def __setstate__(self, state):
+    self.dict, self.value = state
 
   def copy(self):
     """
@@ -1704,40 +1734,57 @@ class NumbersDict:
         self = NumbersDict.constant_like(self, numbers_dict=other)
       else:
         self = NumbersDict(self)
-    if not isinstance(other, NumbersDict):
-      other = NumbersDict.constant_like(other, numbers_dict=self)
     if result is None:
       result = NumbersDict()
     assert isinstance(result, NumbersDict)
-    for k in self.keys_set | other.keys_set:
-      result[k] = cls.bin_op_scalar_optional(self.get(k, None), other.get(k, None), zero=zero, op=op)
-    result.value = cls.bin_op_scalar_optional(self.value, other.value, zero=zero, op=op)
+    scalar_op = cls.bin_op_scalar_optional
+    self_dict, self_value = self.dict, self.value
+    result_dict = result.dict
+    # Note that we only ever set existing keys of self.dict while iterating over it (in case result is self).
+    if not isinstance(other, NumbersDict):
+      # Like other = NumbersDict.constant_like(other, numbers_dict=self), but without creating it.
+      for k, a in self_dict.items():
+        result_dict[k] = op(a, other) if (a is not None and other is not None) else scalar_op(a, other, zero, op)
+      result.value = scalar_op(self_value, other if self_value is not None else None, zero, op)
+      return result
+    other_dict, other_value = other.dict, other.value
+    if self_dict.keys() == other_dict.keys():  # fast path, the common case
+      for k, a in self_dict.items():
+        b = other_dict[k]
+        result_dict[k] = op(a, b) if (a is not None and b is not None) else scalar_op(a, b, zero, op)
+    else:
+      for k, a in self_dict.items():
+        result_dict[k] = scalar_op(a, other_dict.get(k, other_value), zero, op)
+      for k, b in other_dict.items():
+        if k not in self_dict:
+          result_dict[k] = scalar_op(self_value, b, zero, op)
+    result.value = scalar_op(self_value, other_value, zero, op)
     return result
 
   def __add__(self, other):
-    return self.bin_op(self, other, op=lambda a, b: a + b, zero=0)
+    return self.bin_op(self, other, op=operator.add, zero=0)
 
   __radd__ = __add__
 
   def __iadd__(self, other):
-    return self.bin_op(self, other, op=lambda a, b: a + b, zero=0, result=self)
+    return self.bin_op(self, other, op=operator.add, zero=0, result=self)
 
   def __sub__(self, other):
-    return self.bin_op(self, other, op=lambda a, b: a - b, zero=0)
+    return self.bin_op(self, other, op=operator.sub, zero=0)
 
   def __rsub__(self, other):
     return self.bin_op(self, other, op=lambda a, b: b - a, zero=0)
 
   def __isub__(self, other):
-    return self.bin_op(self, other, op=lambda a, b: a - b, zero=0, result=self)
+    return self.bin_op(self, other, op=operator.sub, zero=0, result=self)
 
   def __mul__(self, other):
-    return self.bin_op(self, other, op=lambda a, b: a * b, zero=1)
+    return self.bin_op(self, other, op=operator.mul, zero=1)
 
   __rmul__ = __mul__
 
   def __imul__(self, other):
-    return self.bin_op(self, other, op=lambda a, b: a * b, zero=1, result=self)
+    return self.bin_op(self, other, op=operator.mul, zero=1, result=self)
 
   def __div__(self, other):
     return self.bin_op(self, other, op=lambda a, b: a / b, zero=1)
@@ -1751,10 +1798,10 @@ class NumbersDict:
   __itruediv__ = __idiv__
 
   def __floordiv__(self, other):
-    return self.bin_op(self, other, op=lambda a, b: a // b, zero=1)
+    return self.bin_op(self, other, op=operator.floordiv, zero=1)
 
   def __ifloordiv__(self, other):
-    return self.bin_op(self, other, op=lambda a, b: a // b, zero=1, result=self)
+    return self.bin_op(self, other, op=operator.floordiv, zero=1, result=self)
 
   def __neg__(self):
     return self.unary_op(op=lambda a: -a)
@@ -1822,20 +1869,28 @@ class NumbersDict:
     :param ((object,object)->True) cmp:
     :rtype: True
     """
-    for key in self.keys():
-      if key in other.keys():
-        if cmp(self[key], other[key]):
+    other_dict, other_value = other.dict, other.value
+    for key, value in self.dict.items():
+      if key in other_dict:
+        if cmp(value, other_dict[key]):
           return True
-      elif other.value is not None:
-        if cmp(self[key], other.value):
+      elif other_value is not None:
+        if cmp(value, other_value):
           return True
-    if self.value is not None and other.value is not None:
-      if cmp(self.value, other.value):
+    if self.value is not None and other_value is not None:
+      if cmp(self.value, other_value):
         return True
     return False
 
   @staticmethod
   def _max(*args):
+    if len(args) == 2:  # fast path
+      a, b = args
+      if a is None:
+        return b
+      if b is None:
+        return a
+      return max(a, b)
     args = [a for a in args if a is not None]
     if not args:
       return None
@@ -1845,6 +1900,13 @@ class NumbersDict:
 
   @staticmethod
   def _min(*args):
+    if len(args) == 2:  # fast path
+      a, b = args
+      if a is None:
+        return b
+      if b is None:
+        return a
+      return min(a, b)
     args = [a for a in args if a is not None]
     if not args:
       return None
@@ -1852,8 +1914,7 @@ class NumbersDict:
       return args[0]
     return min(*args)
 
-  @classmethod
-  def max(cls, items):
+  def _cls_max(cls, items):
     """
     Element-wise maximum for item in items.
     :param list[NumbersDict|int|float] items:
@@ -1885,6 +1946,9 @@ class NumbersDict:
     # Will replace self.max for each instance. To be sure that we don't confuse it with self.max_value.
     raise Exception("Use max_value instead.")
 
+  max = _ClassOnlyMethod(_cls_max, __max_error.__func__)
+  del _cls_max
+
   def max_value(self):
     """
     Maximum of our values.
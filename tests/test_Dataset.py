@@ -7,7 +7,8 @@ import sys
 sys.path += ["."]  # Python 3 hack
 
 import unittest
-from nose.tools import assert_equal, assert_is_instance, assert_in, assert_not_in, assert_true, assert_false
+from nose.tools import assert_equal, assert_not_equal, assert_raises, assert_is_instance, assert_in, assert_not_in
+from nose.tools import assert_true, assert_false
 from GeneratingDataset import GeneratingDataset, DummyDataset, DummyDatasetMultipleSequenceLength
 from EngineBatch import Batch
 from Dataset import DatasetSeq
@@ -39,6 +40,38 @@ def test_generate_batches_recurrent():
     batch_gen.advance(1)
 
 
+def test_generate_batches_vectorized_zero_length_seqs():
+  from GeneratingDataset import StaticDataset
+
+  class _StaticDataset(StaticDataset):
+    vectorized = True
+
+    def get_all_seq_lengths(self):
+      if not self.vectorized:
+        return None
+      return ["data"], np.array([[self.get_seq_length(i)["data"]] for i in range(self.num_seqs)], dtype="int64")
+
+  def get_batches(lens, vectorized):
+    """
+    :param list[int] lens:
+    :param bool vectorized:
+    :return: seq idxs per batch
+    :rtype: list[list[int]]
+    """
+    dataset = _StaticDataset(
+      [{"data": np.zeros((n, 1), dtype="float32")} for n in lens], output_dim={"data": (1, 2)})
+    dataset.vectorized = vectorized
+    dataset.init_seq_order(epoch=1)
+    return [
+      [part.seq_idx for part in batch.seqs]
+      for batch in dataset._generate_batches(recurrent_net=True, batch_size=5, max_seqs=2)]
+
+  # The generic code skips the last batch if it has no frames.
+  for lens, expected in [([3, 4, 0, 0], [[0], [1]]), ([0, 0], []), ([0, 0, 2], [[0, 1], [2]])]:
+    assert_equal(get_batches(lens, vectorized=False), expected)
+    assert_equal(get_batches(lens, vectorized=True), expected)
+
+
 def test_iterate_seqs_no_chunking_1():
   dataset = DummyDataset(input_dim=2, output_dim=3, num_seqs=2, seq_len=11)
   dataset.init_seq_order(1)
@@ -326,6 +359,294 @@ def test_task12ax_window():
   assert_equal(list(data2a[-1, 2]), [0] * input_dim)  # zero-padded right
 
 
+def test_CachedDataset2_num_workers():
+  from CachedDataset2 import CachedDataset2
+
+  class _RandomDataset(CachedDataset2):
+    collect_workers_supported = True
+
+    def __init__(self, **kwargs):
+      super(_RandomDataset, self).__init__(**kwargs)
+      self.num_inputs = 3
+      self.num_outputs = {"data": (3, 2), "classes": (5, 1)}
+
+    def _collect_single_seq(self, seq_idx):
+      if seq_idx >= 13:  # we do not know the num seqs in advance
+        return None
+      rnd = np.random.RandomState([self.epoch, seq_idx])
+      seq_len = rnd.randint(1, 10)
+      return DatasetSeq(
+        seq_idx=seq_idx, seq_tag="seq-%i-%i" % (self.epoch, seq_idx),
+        features=rnd.uniform(size=(seq_len, 3)).astype("float32"),
+        targets={
+          "classes": rnd.randint(0, 5, size=(seq_len,)).astype("int32"),
+          "raw": np.array("seq %i" % seq_idx, dtype="object")})
+
+  def _read_all(dataset, epoch):
+    dataset.init_seq_order(epoch=epoch)
+    res = []
+    seq_idx = 0
+    while dataset.is_less_than_num_seqs(seq_idx):
+      dataset.load_seqs(seq_idx, seq_idx + 1)
+      res.append((dataset.get_tag(seq_idx), {key: dataset.get_data(seq_idx, key) for key in ["data", "classes", "raw"]}))
+      seq_idx += 1
+    return res
+
+  dataset1 = _RandomDataset()
+  dataset2 = _RandomDataset(num_workers=3)
+  for epoch in [1, 2]:
+    seqs1 = _read_all(dataset1, epoch=epoch)
+    seqs2 = _read_all(dataset2, epoch=epoch)
+    assert_equal(len(seqs1), 13)
+    assert_equal(len(seqs2), 13)
+    for (tag1, features1), (tag2, features2) in zip(seqs1, seqs2):
+      assert_equal(tag1, tag2)
+      for key in ["data", "classes"]:
+        assert_equal(features1[key].dtype, features2[key].dtype)
+        assert_equal(features1[key].tolist(), features2[key].tolist())
+      assert_equal(features2["raw"].dtype, np.dtype("object"))
+      assert_equal(features1["raw"].tolist(), features2["raw"].tolist())
+  dataset2._stop_collect_workers()
+
+
+def test_CachedDataset2_shuffle_buffer():
+  from CachedDataset2 import CachedDataset2
+
+  class _StreamDataset(CachedDataset2):
+    collect_workers_supported = True
+
+    def __init__(self, **kwargs):
+      super(_StreamDataset, self).__init__(**kwargs)
+      self.num_inputs = 1
+      self.num_outputs = {"data": (1, 2)}
+
+    def _collect_single_seq(self, seq_idx):
+      if seq_idx >= 50:  # we do not know the num seqs in advance
+        return None
+      return DatasetSeq(
+        seq_idx=seq_idx, seq_tag="seq-%i" % seq_idx, features=np.full((3, 1), seq_idx, dtype="float32"))
+
+  def _read_all(dataset, epoch):
+    dataset.init_seq_order(epoch=epoch)
+    res = []
+    seq_idx = 0
+    while dataset.is_less_than_num_seqs(seq_idx):
+      dataset.load_seqs(seq_idx, seq_idx + 1)
+      assert_equal(dataset.get_data(seq_idx, "data")[0, 0], int(dataset.get_tag(seq_idx)[len("seq-"):]))
+      res.append(int(dataset.get_tag(seq_idx)[len("seq-"):]))
+      seq_idx += 1
+    return res
+
+  buffer_size = 8
+  dataset = _StreamDataset(shuffle_buffer_size=buffer_size)
+  orders = [_read_all(dataset, epoch=epoch) for epoch in [1, 1, 2]]
+  assert_equal(dataset.num_seqs, 50)
+  for order in orders:
+    assert_equal(sorted(order), list(range(50)))
+    assert_true(order != list(range(50)))
+    for i, seq_idx in enumerate(order):
+      assert_true(seq_idx < i + buffer_size)  # bounded by the buffer
+  assert_equal(orders[0], orders[1])  # deterministic
+  assert_true(orders[0] != orders[2])
+
+  dataset = _StreamDataset(shuffle_buffer_size=buffer_size, num_workers=2)
+  assert_equal(_read_all(dataset, epoch=2), orders[2])
+  dataset._stop_collect_workers()
+
+  # Skipping seqs gives the same as reading all.
+  dataset = _StreamDataset(shuffle_buffer_size=buffer_size)
+  dataset.init_seq_order(epoch=1)
+  dataset.load_seqs(5, 7)
+  assert_equal([dataset.get_tag(5), dataset.get_tag(6)], ["seq-%i" % i for i in orders[0][5:7]])
+  assert_equal([dataset.get_corpus_seq_idx(5), dataset.get_corpus_seq_idx(6)], orders[0][5:7])
+
+
+def test_CachedDataset2_shuffle_buffer_own_seq_order():
+  from CachedDataset2 import CachedDataset2
+  from MetaDataset import MetaDataset
+
+  class _OrderedDataset(CachedDataset2):
+    """
+    Like e.g. SprintCacheDataset, answers get_tag by the seq idx in its own seq order.
+    """
+
+    def __init__(self, **kwargs):
+      super(_OrderedDataset, self).__init__(**kwargs)
+      self.num_inputs = 1
+      self.num_outputs = {"data": (1, 2)}
+      self._seq_order = None
+
+    def init_seq_order(self, epoch=None, seq_list=None):
+      super(_OrderedDataset, self).init_seq_order(epoch=epoch, seq_list=seq_list)
+      self._seq_order = list(reversed(range(30)))
+      self._num_seqs = len(self._seq_order)
+      return True
+
+    def get_tag(self, sorted_seq_idx):
+      return "seq-%i" % self._seq_order[self._get_underlying_seq_idx(sorted_seq_idx)]
+
+    def _collect_single_seq(self, seq_idx):
+      if seq_idx >= self._num_seqs:
+        return None
+      corpus_seq_idx = self._seq_order[seq_idx]
+      return DatasetSeq(
+        seq_idx=seq_idx, seq_tag="seq-%i" % corpus_seq_idx,
+        features=np.full((3, 1), corpus_seq_idx, dtype="float32"))
+
+  dataset = _OrderedDataset(shuffle_buffer_size=5)
+  dataset.init_seq_order(epoch=1)
+  assert_equal(dataset.get_tag(3), "seq-%i" % dataset.get_data(3, "data")[0, 0])  # not loaded before
+  tags = []
+  for seq_idx in range(dataset.num_seqs):
+    dataset.load_seqs(seq_idx, seq_idx + 1)
+    tags.append(dataset.get_tag(seq_idx))
+    assert_equal(tags[-1], "seq-%i" % dataset.get_data(seq_idx, "data")[0, 0])
+  assert_equal(sorted(tags), sorted(["seq-%i" % i for i in range(30)]))
+  assert_true(tags != ["seq-%i" % i for i in reversed(range(30))])
+
+  # MetaDataset loads the sub datasets by the seq idx, that does not work with the shuffle buffer.
+  assert_raises(AssertionError, lambda: MetaDataset(datasets={}, data_map={}, shuffle_buffer_size=5))
+
+
+def test_get_seq_order_for_epoch_bucket():
+  from Dataset import Dataset
+  num_seqs = 100
+  seq_lens = np.random.RandomState(42).randint(1, 1000, size=(num_seqs,)).tolist()
+  dataset = Dataset(seq_ordering="bucket:.10")
+  orders = [dataset.get_seq_order_for_epoch(epoch, num_seqs, lambda s: seq_lens[s]) for epoch in [1, 1, 2]]
+  assert_equal(orders[0], orders[1])  # deterministic
+  assert_true(orders[0] != orders[2])
+  sorted_lens = sorted(seq_lens)
+  bucket_ranges = [(sorted_lens[i * 10], sorted_lens[i * 10 + 9]) for i in range(10)]
+  for order in orders:
+    assert_equal(sorted(order), list(range(num_seqs)))
+    buckets = [[seq_lens[s] for s in order[i * 10:(i + 1) * 10]] for i in range(10)]
+    assert_equal(sorted([(min(bucket), max(bucket)) for bucket in buckets]), bucket_ranges)
+  orders = [Dataset(seq_ordering="bucket:4:2").get_seq_order_for_epoch(epoch, num_seqs, lambda s: seq_lens[s])
+            for epoch in [1, 2, 3]]
+  assert_equal(orders[0], orders[1])
+  assert_true(orders[0] != orders[2])
+  # The bucket idx of each seq in the order, used to align the batches to the buckets.
+  for seq_order_compat in [True, False]:
+    for kwargs in [{}, {"partition_epoch": 3}, {"repeat_epoch": 2}]:
+      dataset = Dataset(seq_ordering="bucket:.10", seq_order_compat=seq_order_compat, **kwargs)
+      order = dataset.get_seq_order_for_epoch(2, num_seqs, lambda s: seq_lens[s])
+      bucket_idxs = dataset._seq_order_bucket_idxs
+      assert_equal(len(bucket_idxs), len(order))
+      for s, i in zip(order, bucket_idxs):
+        assert bucket_ranges[i][0] <= seq_lens[s] <= bucket_ranges[i][1]
+  for seq_ordering in ["bucket:0", "bucket:.0", "bucket:-1", "bucket:4:0"]:
+    for seq_order_compat in [True, False]:
+      dataset = Dataset(seq_ordering=seq_ordering, seq_order_compat=seq_order_compat)
+      assert_raises(AssertionError, dataset.get_seq_order_for_epoch, 1, num_seqs, lambda s: seq_lens[s])
+
+
+def test_get_seq_order_for_epoch_seq_order_compat():
+  from Dataset import Dataset
+  num_seqs = 103
+  seq_lens = np.random.RandomState(42).randint(1, 20, size=(num_seqs,)).tolist()  # many equal lens
+
+  def get_seq_order(seq_ordering, seq_order_compat, epoch=1, **kwargs):
+    """
+    :param str seq_ordering:
+    :param bool seq_order_compat:
+    :param int epoch:
+    :rtype: list[int]
+    """
+    dataset = Dataset(seq_ordering=seq_ordering, seq_order_compat=seq_order_compat, **kwargs)
+    seq_order = dataset.get_seq_order_for_epoch(epoch, num_seqs, lambda s: seq_lens[s])
+    assert_is_instance(seq_order, list)
+    return seq_order
+
+  # These are deterministic, thus both implementations must give the same.
+  for seq_ordering in ["default", "default_every_n:4", "reverse", "sorted", "sorted_reverse"]:
+    for kwargs in [{}, {"partition_epoch": 3}, {"repeat_epoch": 2}]:
+      for epoch in [1, 2, 3]:
+        assert_equal(
+          get_seq_order(seq_ordering, False, epoch=epoch, **kwargs),
+          get_seq_order(seq_ordering, True, epoch=epoch, **kwargs))
+
+  for seq_ordering in ["random", "random:2", "laplace:5", "laplace:.10", "bucket:4", "bucket:.10:2"]:
+    orders = [get_seq_order(seq_ordering, False, epoch=epoch) for epoch in [1, 1, 2, 3]]
+    for order in orders:
+      assert_equal(sorted(order), list(range(num_seqs)))
+    assert_equal(orders[0], orders[1])  # deterministic
+    if seq_ordering.endswith(":2"):
+      assert_equal(orders[1], orders[2])
+    assert_not_equal(orders[1], orders[3])
+    if seq_ordering.startswith("laplace"):
+      bins = 5 if seq_ordering == "laplace:5" else num_seqs // 10
+      for i in range(bins):
+        part = [seq_lens[s] for s in orders[0][i * num_seqs // bins:(i + 1) * num_seqs // bins]]
+        assert_equal(part, sorted(part, reverse=(i % 2 == 1)))
+
+  # With partition_epoch, the sub epochs together cover the full epoch.
+  orders = [get_seq_order("laplace:5", False, epoch=epoch, partition_epoch=3) for epoch in [1, 2, 3]]
+  assert_equal([len(order) for order in orders], [35, 34, 34])
+  assert_equal(sum(orders, []), get_seq_order("laplace:5", False))
+
+
+def test_seq_order_compat_old_numpy():
+  from Dataset import Dataset
+  default_rng = getattr(np.random, "default_rng", None)
+  if default_rng is not None:
+    del np.random.default_rng  # like Numpy < 1.17
+  try:
+    Dataset(seq_ordering="random", seq_order_compat=True)  # does not need it
+    try:
+      Dataset(seq_ordering="random", seq_order_compat=False)
+    except AssertionError as exc:
+      assert "Numpy >= 1.17" in str(exc)
+    else:
+      assert False, "expected AssertionError"
+  finally:
+    if default_rng is not None:
+      np.random.default_rng = default_rng
+
+
+def test_get_seq_order_for_epoch_seq_len_cache():
+  from Dataset import Dataset, SeqLenCache
+  import tempfile
+  cache_dir = tempfile.mkdtemp()
+  num_seqs = 20
+  seq_lens = np.random.RandomState(42).randint(1, 1000, size=(num_seqs,)).tolist()
+  calls = []
+
+  def get_seq_len(s):
+    """
+    :param int s:
+    :rtype: int
+    """
+    calls.append(s)
+    return seq_lens[s]
+
+  orders = []
+  for _ in range(2):  # second time like a new run
+    cache = SeqLenCache(cache_dir=cache_dir, key_info={"class": "Dummy"})
+    dataset = Dataset(seq_ordering="laplace:4", seq_len_cache=cache)
+    for epoch in [1, 2]:
+      orders.append(dataset.get_seq_order_for_epoch(
+        epoch, num_seqs, get_seq_len=get_seq_len, get_seq_tag=lambda s: "seq-%i" % s))
+  assert_equal(sorted(calls), list(range(num_seqs)))  # every seq len was only calculated once
+  ref_dataset = Dataset(seq_ordering="laplace:4")
+  assert_equal(orders, [ref_dataset.get_seq_order_for_epoch(epoch, num_seqs, lambda s: seq_lens[s]) for epoch in [1, 2]] * 2)
+  # Other dataset options -> other cache.
+  assert_true(SeqLenCache.from_dataset_opts(cache_dir, "Dummy", {"a": 1}).filename != cache.filename)
+  assert_equal(
+    SeqLenCache.from_dataset_opts(cache_dir, "Dummy", {"a": 1, "seq_ordering": "sorted"}).filename,
+    SeqLenCache.from_dataset_opts(cache_dir, "Dummy", {"a": 1, "seq_ordering": "laplace:4"}).filename)
+  # Changed data files -> other cache.
+  data_filename = "%s/data.txt" % tempfile.mkdtemp()
+  with open(data_filename, "w") as f:
+    f.write("data")
+  opts = {"datasets": {"sub": {"files": [data_filename]}}}
+  filename = SeqLenCache.from_dataset_opts(cache_dir, "Dummy", opts).filename
+  assert_equal(SeqLenCache.from_dataset_opts(cache_dir, "Dummy", opts).filename, filename)
+  with open(data_filename, "a") as f:
+    f.write("more data")
+  assert_true(SeqLenCache.from_dataset_opts(cache_dir, "Dummy", opts).filename != filename)
+
+
 if __name__ == "__main__":
   better_exchook.install()
   if len(sys.argv) <= 1:
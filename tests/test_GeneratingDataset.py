@@ -3,7 +3,7 @@ import sys
 sys.path += ["."]  # Python 3 hack
 
 import unittest
-from nose.tools import assert_equal, assert_is_instance, assert_in, assert_not_in, assert_true, assert_false
+from nose.tools import assert_equal, assert_is_instance, assert_in, assert_not_in, assert_true, assert_false, assert_raises
 from GeneratingDataset import *
 from Dataset import DatasetSeq
 import numpy as np
@@ -81,6 +81,333 @@ def test_StaticDataset_custom_keys_with_dims():
   assert_equal(list(dataset.get_data(0, "target")), [3, 4, 5, 6, 7])
 
 
+def test_ExtractAudioFeatures_cache():
+  import tempfile
+  import shutil
+  cache_dir = tempfile.mkdtemp(suffix=".feature-cache")
+  try:
+    rnd = np.random.RandomState(42)
+    audios = [rnd.uniform(-1., 1., size=(n,)) for n in [100, 200, 300]]
+    extractor = ExtractAudioFeatures(features="raw", cache=cache_dir)
+    features = [extractor.get_audio_features(audio=audio.copy(), sample_rate=16000) for audio in audios]
+    assert_equal((extractor.cache.num_hits, extractor.cache.num_misses), (0, 3))
+    for audio, feature_data in zip(audios, features):
+      assert_equal(extractor.get_audio_features(audio=audio.copy(), sample_rate=16000).tolist(), feature_data.tolist())
+    assert_equal((extractor.cache.num_hits, extractor.cache.num_misses), (3, 3))
+    # New instance, e.g. in the next epoch.
+    extractor = ExtractAudioFeatures(features="raw", cache={"path": cache_dir})
+    feature_data = extractor.get_audio_features(audio=audios[1].copy(), sample_rate=16000)
+    assert_equal(feature_data.tolist(), features[1].tolist())
+    assert_equal((extractor.cache.num_hits, extractor.cache.num_misses), (1, 0))
+    # Other options, other cache.
+    extractor = ExtractAudioFeatures(features="raw", step_len=0.02, cache=cache_dir)
+    extractor.get_audio_features(audio=audios[1].copy(), sample_rate=16000)
+    assert_equal((extractor.cache.num_hits, extractor.cache.num_misses), (0, 1))
+    # No cache with random permutation.
+    extractor = ExtractAudioFeatures(
+      features="raw", random_permute={"rnd_zoom_switch": 0.}, random_state=np.random.RandomState(1), cache=cache_dir)
+    assert_equal(extractor.cache, None)
+  finally:
+    shutil.rmtree(cache_dir)
+
+
+def _get_test_audios():
+  """
+  :return: list of audio signals, sample rate
+  :rtype: (list[numpy.ndarray], int)
+  """
+  rnd = np.random.RandomState(42)
+  sample_rate = 16000
+  audios = []
+  for audio_len in [16000, 12345, 5001]:
+    t = np.arange(audio_len) / float(sample_rate)
+    audios.append(np.sin(2 * np.pi * 440. * t) * 0.5 + rnd.normal(0., 0.05, size=(audio_len,)))
+  return audios, sample_rate
+
+
+def test_ExtractAudioFeatures_numpy_batch():
+  audios, sample_rate = _get_test_audios()
+  for features in ["mfcc", "log_mel_filterbank", "log_log_mel_filterbank"]:
+    extractor = ExtractAudioFeatures(features=features, with_delta=2, frontend="numpy")
+    batch = extractor.get_audio_features_batch([audio.copy() for audio in audios], sample_rate=sample_rate)
+    for audio, feature_data in zip(audios, batch):
+      assert_equal(feature_data.shape, (len(audio) // 160 + 1, 3 * 40))
+      assert_equal(feature_data.dtype, np.float32)
+      single = extractor.get_audio_features(audio.copy(), sample_rate=sample_rate)
+      np.testing.assert_allclose(single, feature_data, rtol=1e-5, atol=1e-5)
+
+
+def test_ExtractAudioFeatures_numpy_vs_librosa():
+  try:
+    # noinspection PyPackageRequirements
+    import librosa
+  except ImportError:
+    raise unittest.SkipTest("librosa not installed")
+  audios, sample_rate = _get_test_audios()
+  for features in ["mfcc", "log_mel_filterbank", "log_log_mel_filterbank"]:
+    extractor_np = ExtractAudioFeatures(features=features, with_delta=1, frontend="numpy")
+    extractor_librosa = ExtractAudioFeatures(features=features, with_delta=1, frontend="librosa")
+    for audio in audios:
+      np.testing.assert_allclose(
+        extractor_np.get_audio_features(audio.copy(), sample_rate=sample_rate),
+        extractor_librosa.get_audio_features(audio.copy(), sample_rate=sample_rate),
+        rtol=0, atol=1e-3)
+
+
+def test_ExtractAudioFeatures_default_frontend():
+  from GeneratingDataset import _have_librosa
+  # librosa as before, if available.
+  assert_equal(ExtractAudioFeatures().frontend, "librosa" if _have_librosa() else "numpy")
+
+
+def test_get_audio_delta_numpy_too_short():
+  from GeneratingDataset import _get_audio_delta_numpy
+  feature_data = np.random.RandomState(42).normal(size=(9, 3))
+  assert_equal(_get_audio_delta_numpy(feature_data, order=1).shape, (9, 3))
+  # Like librosa.feature.delta.
+  assert_raises(ValueError, lambda: _get_audio_delta_numpy(feature_data[:8], order=1))
+  assert_raises(ValueError, lambda: _get_audio_delta_numpy(feature_data, order=1, width=4))
+
+
+def test_ExtractAudioFeatures_random_permute_cache():
+  import tempfile
+  import shutil
+  cache_dir = tempfile.mkdtemp(suffix=".feature-cache")
+  try:
+    assert_true(ExtractAudioFeatures(cache=cache_dir).cache)
+    # The features are not deterministic with random_permute, so the cache must not be used.
+    for random_permute in [True, {"rnd_zoom_switch": 0.5}]:
+      assert_false(ExtractAudioFeatures(cache=cache_dir, random_permute=random_permute).cache)
+    assert_true(ExtractAudioFeatures(cache=cache_dir, random_permute=False).cache)
+  finally:
+    shutil.rmtree(cache_dir)
+
+
+def test_AudioFeatureCache_evict():
+  import tempfile
+  import shutil
+  cache_dir = tempfile.mkdtemp(suffix=".feature-cache")
+  try:
+    cache = AudioFeatureCache(path=cache_dir, options={}, max_size=2000, shard_size=1000)
+    for i in range(10):
+      cache.add("key-%i" % i, np.full((100, 1), i, dtype="float32"))  # 400 bytes
+    shards = [fn for fn in os.listdir(cache.path) if fn.endswith(".raw")]
+    assert_true(len(shards) <= 3)
+    assert_equal(cache.get("key-0"), None)  # evicted
+    assert_equal(cache.get("key-9").tolist(), [[9.]] * 100)
+  finally:
+    shutil.rmtree(cache_dir)
+
+
+def _create_librispeech_corpus(num_seqs=5):
+  """
+  Creates a tiny fake LibriSpeech corpus (extracted, not zipped).
+
+  :param int num_seqs:
+  :return: path, chars vocab file
+  :rtype: (str,str)
+  """
+  # noinspection PyPackageRequirements
+  import soundfile
+  import tempfile
+  import shutil
+  import atexit
+  path = tempfile.mkdtemp(suffix=".librispeech")
+  atexit.register(lambda: shutil.rmtree(path, ignore_errors=True))
+  chapter_dir = "%s/train-clean-100/1/2" % path
+  os.makedirs(chapter_dir)
+  rnd = np.random.RandomState(42)
+  sample_rate = 16000
+  with open("%s/1-2.trans.txt" % chapter_dir, "w") as f:
+    for i in range(num_seqs):
+      audio_len = rnd.randint(4000, 12000)
+      t = np.arange(audio_len) / float(sample_rate)
+      audio = np.sin(2 * np.pi * 440. * t) * 0.5 + rnd.normal(0., 0.05, size=(audio_len,))
+      soundfile.write("%s/1-2-%04i.flac" % (chapter_dir, i), audio, sample_rate)
+      f.write("1-2-%04i HELLO %i\n" % (i, i))
+  vocab_file = "%s/chars.vocab" % path
+  with open(vocab_file, "w") as f:
+    f.write(repr({c: i for (i, c) in enumerate(sorted(set("@ HELLO0123456789")))}))
+  return path, vocab_file
+
+
+def test_LibriSpeechCorpus_random_permute_audio_num_workers():
+  try:
+    # noinspection PyPackageRequirements
+    import soundfile
+    # noinspection PyPackageRequirements
+    import librosa
+  except ImportError:
+    raise unittest.SkipTest("soundfile or librosa not installed")
+  path, vocab_file = _create_librispeech_corpus()
+
+  def _read_all(num_workers, epoch):
+    """
+    :param int num_workers:
+    :param int epoch:
+    :rtype: list[numpy.ndarray]
+    """
+    dataset = LibriSpeechCorpus(
+      path=path, prefix="train", chars={"vocab_file": vocab_file},
+      audio={"random_permute": {"rnd_zoom_switch": 0.5}, "frontend": "numpy"}, num_workers=num_workers)
+    dataset.init_seq_order(epoch=epoch)
+    res = []
+    seq_idx = 0
+    while dataset.is_less_than_num_seqs(seq_idx):
+      dataset.load_seqs(seq_idx, seq_idx + 1)
+      res.append(dataset.get_data(seq_idx, "data"))
+      seq_idx += 1
+    dataset._stop_collect_workers()
+    return res
+
+  seqs_epoch1 = _read_all(num_workers=0, epoch=1)
+  seqs_epoch2 = _read_all(num_workers=0, epoch=2)
+  assert_true(any([data1.shape != data2.shape or (data1 != data2).any()
+                   for data1, data2 in zip(seqs_epoch1, seqs_epoch2)]))  # random permutation is used
+  # With workers, the random state is seeded per seq, thus it does not depend on the number of workers.
+  # Without workers, the random state of the epoch is used as before, which gives other results.
+  for epoch in [1, 2]:
+    seqs1 = _read_all(num_workers=1, epoch=epoch)
+    seqs2 = _read_all(num_workers=2, epoch=epoch)
+    assert_equal(len(seqs1), 5)
+    assert_equal(len(seqs2), 5)
+    for data1, data2 in zip(seqs1, seqs2):
+      assert_equal(data1.shape, data2.shape)
+      np.testing.assert_array_equal(data1, data2)
+
+
+def _create_bpe_files(num_merges=200, version="0.2"):
+  """
+  Learns some BPE merges on random words (simple variant of subword-nmt learn_bpe).
+
+  :param int num_merges:
+  :param str version:
+  :return: vocab_file, bpe_file, words
+  :rtype: (str, str, list[str])
+  """
+  import tempfile
+  import collections
+  rnd = np.random.RandomState(42)
+  chars = "abcdeefgh"
+  words = ["".join(rnd.choice(list(chars), size=rnd.randint(1, 12))) for _ in range(500)]
+  word_counts = collections.Counter(words)
+  vocab = {tuple(w[:-1]) + (w[-1] + "</w>",): c for (w, c) in word_counts.items()}
+  merges = []
+  for _ in range(num_merges):
+    pair_counts = collections.Counter()
+    for w, c in vocab.items():
+      for pair in zip(w[:-1], w[1:]):
+        pair_counts[pair] += c
+    if not pair_counts:
+      break
+    best = max(sorted(pair_counts), key=lambda pair: pair_counts[pair])
+    merges.append(best)
+    new_vocab = {}
+    for w, c in vocab.items():
+      new_w, i = [], 0
+      while i < len(w):
+        if i < len(w) - 1 and (w[i], w[i + 1]) == best:
+          new_w.append(w[i] + w[i + 1])
+          i += 2
+        else:
+          new_w.append(w[i])
+          i += 1
+      new_vocab[tuple(new_w)] = c
+    vocab = new_vocab
+  labels = {"UNK": 0}
+  for w in vocab:
+    for i, sym in enumerate(w):
+      sym = sym.replace("</w>", "") if i == len(w) - 1 else sym + "@@"
+      labels.setdefault(sym, len(labels))
+  labels.setdefault("$cat", len(labels))
+  with tempfile.NamedTemporaryFile(mode="w", suffix=".bpe", delete=False) as f:
+    f.write("#version: %s\n" % version)
+    for pair in merges:
+      f.write("%s %s\n" % pair)
+    bpe_file = f.name
+  with tempfile.NamedTemporaryFile(mode="w", suffix=".vocab", delete=False) as f:
+    f.write(repr(labels))
+    vocab_file = f.name
+  return vocab_file, bpe_file, words
+
+
+def _reference_bpe_merges(bpe, word):
+  """
+  The original (quadratic) merge loop, as in subword-nmt apply_bpe.
+
+  :param BytePairEncoding bpe:
+  :param tuple[str] word:
+  :rtype: tuple[str]
+  """
+  pairs = bpe._get_pairs(word)
+  while True:
+    bigram = min(pairs, key=lambda pair: bpe._bpe_codes.get(pair, float('inf')))
+    if bigram not in bpe._bpe_codes:
+      break
+    first, second = bigram
+    new_word = []
+    i = 0
+    while i < len(word):
+      try:
+        j = word.index(first, i)
+        new_word.extend(word[i:j])
+        i = j
+      except ValueError:
+        new_word.extend(word[i:])
+        break
+      if word[i] == first and i < len(word) - 1 and word[i + 1] == second:
+        new_word.append(first + second)
+        i += 2
+      else:
+        new_word.append(word[i])
+        i += 1
+    word = tuple(new_word)
+    if len(word) == 1:
+      break
+    pairs = bpe._get_pairs(word)
+  return word
+
+
+def test_BytePairEncoding_merges_vs_reference():
+  vocab_file, bpe_file, words = _create_bpe_files()
+  try:
+    bpe = BytePairEncoding(vocab_file=vocab_file, bpe_file=bpe_file)
+    rnd = np.random.RandomState(13)
+    test_words = words + ["".join(rnd.choice(list("aabbcdefghhi"), size=rnd.randint(2, 30))) for _ in range(500)]
+    test_words += ["aaaaaaa", "abababab", "eeeeeeeeeee"]
+    for w in test_words:
+      word = tuple(w[:-1]) + (w[-1] + "</w>",)
+      if len(word) < 2:
+        continue
+      assert_equal(bpe._apply_merges(word), _reference_bpe_merges(bpe, word), "word %r" % w)
+  finally:
+    os.remove(vocab_file)
+    os.remove(bpe_file)
+
+
+def test_BytePairEncoding_cache_and_get_seqs():
+  vocab_file, bpe_file, words = _create_bpe_files()
+  try:
+    bpe = BytePairEncoding(vocab_file=vocab_file, bpe_file=bpe_file, seq_postfix=[0], cache_size=10)
+    sentences = [" ".join(words[i:i + 7]) for i in range(0, 200, 7)]
+    sentences.append("%s $cat { %s %s } %s" % tuple(words[:4]))
+    seqs = [bpe.get_seq(s) for s in sentences]
+    stats = bpe.get_encode_cache_stats()
+    assert_true(stats["size"] <= 10)
+    assert_equal(stats["hits"] + stats["misses"], sum([len(s.split()) for s in sentences]) - 4)
+    assert_equal(bpe.get_seqs(sentences), seqs)
+    num_first = len(bpe._segment_sentence(words[0]))
+    assert_equal(bpe._segment_sentence(sentences[-1])[num_first:num_first + 4], ["$cat", "{", words[1], words[2]])
+    long_word = max(words, key=len)
+    bpe.get_seq(long_word)
+    hits = bpe.get_encode_cache_stats()["hits"]
+    bpe.get_seq(long_word)
+    assert_equal(bpe.get_encode_cache_stats()["hits"], hits + 1)
+  finally:
+    os.remove(vocab_file)
+    os.remove(bpe_file)
+
+
 if __name__ == "__main__":
   better_exchook.install()
   if len(sys.argv) <= 1:
@@ -10,6 +10,7 @@ from HDFDataset import *
 from nose.tools import assert_equal
 from nose.tools import assert_not_equal
 from nose.tools import assert_raises
+from nose.tools import assert_true
 from nose.tools import raises
 import Util
 import h5py
@@ -259,6 +260,26 @@ def test_SimpleHDFWriter_small():
     print(repr(gzip.compress(open(fn, "rb").read())))
 
 
+def test_SimpleHDFWriter_float16():
+  fn = _get_tmp_file(suffix=".hdf")
+  n_dim = 3
+  writer = SimpleHDFWriter(filename=fn, dim=n_dim, labels=None, float_dtype="float16")
+  seq_lens = [2, 3]
+  inputs = numpy.random.normal(size=(len(seq_lens), max(seq_lens), n_dim)).astype("float32")
+  writer.insert_batch(inputs=inputs, seq_len=seq_lens, seq_tag=["seq-%i" % i for i in range(len(seq_lens))])
+  writer.close()
+  with h5py.File(fn, "r") as f:
+    assert f["inputs"].dtype == numpy.float16
+
+  dataset = HDFDataset(files=[fn])
+  reader = _DatasetReader(dataset=dataset)
+  reader.read_all()
+  assert reader.data_dtype["data"] == "float32"
+  for i, seq_len in enumerate(seq_lens):
+    assert reader.data["data"][i].dtype == numpy.float32
+    numpy.testing.assert_allclose(reader.data["data"][i], inputs[i, :seq_len], rtol=1e-3, atol=1e-3)
+
+
 def test_read_simple_hdf():
   if sys.version_info[0] <= 2:  # gzip.decompress is >=PY3
     raise unittest.SkipTest
@@ -570,6 +591,210 @@ def test_HDFDataset_no_cache_efficiency():
   # TODO... check alloc intervals etc
 
 
+def test_HDFDataset_cache_alloc_intervals_random_access():
+  hdf_fn = generate_hdf_from_dummy()
+  # 17 frames * 13 dims * 4 bytes per seq. Only a few seqs fit into the cache, thus it must delete often.
+  hdf_dataset = HDFDataset(files=[hdf_fn], cache_byte_size=17 * 13 * 4 * 9)
+  hdf_dataset.initialize()
+  hdf_dataset.init_seq_order(epoch=1)
+  ref_dataset = HDFDataset(files=[hdf_fn], cache_byte_size=0)
+  ref_dataset.initialize()
+  ref_dataset.init_seq_order(epoch=1)
+  rnd = numpy.random.RandomState(42)
+  for _ in range(50):
+    start = rnd.randint(0, hdf_dataset.num_seqs)
+    end = min(start + rnd.randint(1, 3), hdf_dataset.num_seqs)
+    hdf_dataset.load_seqs(start, end)
+    intervals = [(s, e) for (s, e, _) in hdf_dataset.alloc_intervals]
+    assert_equal(intervals, sorted(intervals))
+    for (_, e1), (s2, _) in zip(intervals[:-1], intervals[1:]):
+      assert e1 <= s2
+    ref_dataset.load_seqs(start, end)
+    for seq_idx in range(start, end):
+      assert hdf_dataset.alloc_interval_index(seq_idx) >= 0
+      numpy.testing.assert_array_equal(hdf_dataset.get_data(seq_idx, "data"), ref_dataset.get_data(seq_idx, "data"))
+  assert_equal(hdf_dataset.alloc_interval_index(hdf_dataset.num_seqs), -1)
+
+
+def test_HDFDataset_shared_mem_cache():
+  from TaskSystem import SharedMem
+  if not SharedMem.is_shmget_functioning():
+    raise unittest.SkipTest("shmget does not work")
+  hdf_fn = generate_hdf_from_other({"class": "Task12AXDataset", "num_seqs": 23})
+  key = "test_HDFDataset_shared_mem_cache_%i" % os.getpid()
+  # Within one process, the second instance does not get the lock, thus it behaves like another process.
+  provider = HDFDataset(files=[hdf_fn], cache_byte_size=-1, shared_mem_cache=key)
+  provider.initialize()
+  assert provider._shared_mem_lock_file
+  user = HDFDataset(files=[hdf_fn], cache_byte_size=-1, shared_mem_cache=key)
+  user.initialize()
+  assert not user._shared_mem_lock_file
+  assert user._shared_mem.shmid == provider._shared_mem.shmid
+  assert not user.alloc_intervals[1][2].flags.writeable
+  ref_dataset = HDFDataset(files=[hdf_fn], cache_byte_size=0)
+  ref_dataset.initialize()
+  for epoch in [1, 2]:
+    for dataset in [provider, user, ref_dataset]:
+      dataset.init_seq_order(epoch=epoch)
+    ref_dataset.load_seqs(0, ref_dataset.num_seqs)
+    user.load_seqs(0, user.num_seqs)
+    for seq_idx in range(ref_dataset.num_seqs):
+      assert_equal(user.get_tag(seq_idx), ref_dataset.get_tag(seq_idx))
+      for key in ["data", "classes"]:
+        numpy.testing.assert_array_equal(user.get_data(seq_idx, key), ref_dataset.get_data(seq_idx, key))
+  provider._remove_shared_mem_cache(provider._get_shared_mem_cache_filename_prefix() + ".meta")
+
+
+def test_HDFDataset_cache_dtype():
+  hdf_fn = generate_hdf_from_other({"class": "DummyDataset", "input_dim": 3, "output_dim": 5, "num_seqs": 11})
+  ref_dataset = HDFDataset(files=[hdf_fn], cache_byte_size=0)
+  ref_dataset.initialize()
+  ref_dataset.init_seq_order(epoch=1)
+  ref_dataset.load_seqs(0, ref_dataset.num_seqs)
+  for cache_dtype, rtol in [("float16", 1e-3), ("int8", 1e-2)]:
+    dataset = HDFDataset(files=[hdf_fn], cache_byte_size=-1, cache_dtype=cache_dtype)
+    dataset.initialize()
+    assert dataset.alloc_intervals[1][2].dtype == cache_dtype
+    dataset.init_seq_order(epoch=1)
+    dataset.load_seqs(0, dataset.num_seqs)
+    for seq_idx in range(ref_dataset.num_seqs):
+      ref_data = ref_dataset.get_data(seq_idx, "data")
+      data = dataset.get_data(seq_idx, "data")
+      assert_equal(data.dtype, ref_data.dtype)
+      numpy.testing.assert_allclose(data, ref_data, rtol=rtol, atol=rtol * numpy.max(numpy.abs(ref_data)))
+      numpy.testing.assert_array_equal(dataset.get_data(seq_idx, "classes"), ref_dataset.get_data(seq_idx, "classes"))
+
+
+def test_HDFDatasetWriter_float16():
+  from Dataset import init_dataset
+  ref_dataset = init_dataset({"class": "DummyDataset", "input_dim": 3, "output_dim": 5, "num_seqs": 7})
+  hdf_fn = _get_tmp_file(suffix=".hdf")
+  writer = HDFDatasetWriter(hdf_fn, float_dtype="float16")
+  writer.dump_from_dataset(ref_dataset, use_progress_bar=False)
+  writer.close()
+  with h5py.File(hdf_fn, "r") as f:
+    assert f["inputs"].dtype == numpy.float16
+  dataset = HDFDataset(files=[hdf_fn], cache_byte_size=0)
+  dataset.initialize()
+  assert_equal(dataset.get_data_dtype("data"), "float32")
+  dataset.init_seq_order(epoch=1)
+  ref_dataset.init_seq_order(epoch=1)
+  dataset.load_seqs(0, dataset.num_seqs)
+  ref_dataset.load_seqs(0, ref_dataset.num_seqs)
+  for seq_idx in range(dataset.num_seqs):
+    data = dataset.get_data(seq_idx, "data")
+    assert_equal(data.dtype, numpy.float32)
+    numpy.testing.assert_allclose(data, ref_dataset.get_data(seq_idx, "data"), rtol=1e-3)
+    numpy.testing.assert_array_equal(dataset.get_data(seq_idx, "classes"), ref_dataset.get_data(seq_idx, "classes"))
+
+
+def test_HDFDataset_index_cache():
+  import tempfile
+  hdf_fn = generate_hdf_from_other({"class": "Task12AXDataset", "num_seqs": 23})
+  index_cache_dir = tempfile.mkdtemp()
+  ref_dataset = HDFDataset(files=[hdf_fn], cache_byte_size=0)
+  ref_dataset.initialize()
+  ref_dataset.init_seq_order(epoch=1)
+  dataset = HDFDataset(files=[hdf_fn], cache_byte_size=0, index_cache_dir=index_cache_dir)  # creates the index
+  assert dataset.h5_files[0] is not None
+  assert os.path.exists(dataset._get_file_index_filename(hdf_fn))
+  dataset = HDFDataset(files=[hdf_fn], cache_byte_size=0, index_cache_dir=index_cache_dir)  # uses the index
+  assert dataset.h5_files[0] is None and dataset._file_tags[0] is None
+  dataset.initialize()
+  dataset.init_seq_order(epoch=1)
+  assert_equal(dataset.num_outputs, ref_dataset.num_outputs)
+  assert_equal(dataset.labels, ref_dataset.labels)
+  assert_equal(dataset.get_all_tags(), ref_dataset.get_all_tags())
+  numpy.testing.assert_array_equal(dataset._seq_lengths, ref_dataset._seq_lengths)
+  dataset.load_seqs(0, dataset.num_seqs)
+  ref_dataset.load_seqs(0, ref_dataset.num_seqs)
+  for seq_idx in range(dataset.num_seqs):
+    assert_equal(dataset.get_tag(seq_idx), ref_dataset.get_tag(seq_idx))
+    for key in ["data", "classes"]:
+      numpy.testing.assert_array_equal(dataset.get_data(seq_idx, key), ref_dataset.get_data(seq_idx, key))
+  # The index is invalid after the file was modified.
+  st = os.stat(hdf_fn)
+  os.utime(hdf_fn, (st.st_atime, st.st_mtime + 1))
+  assert dataset._load_file_index(hdf_fn) is None
+  dataset = HDFDataset(files=[hdf_fn], cache_byte_size=0, index_cache_dir=index_cache_dir)  # recreates the index
+  assert dataset.h5_files[0] is not None
+  assert dataset._load_file_index(hdf_fn) is not None
+
+
+def test_HDFDataset_load_seqs_coalesced_reads():
+  hdf_fn = generate_hdf_from_other({"class": "Task12AXDataset", "num_seqs": 23})
+  hdf_dataset = HDFDataset(files=[hdf_fn], cache_byte_size=10 ** 9, max_open_files=1)
+  hdf_dataset.initialize()  # will start to preload everything
+  hdf_dataset.load_seqs(0, hdf_dataset.num_seqs)
+  read_stats = hdf_dataset.get_read_stats()
+  print(read_stats)
+  # All seqs are adjacent in the file, thus we expect one single read for "data" and one for "classes".
+  assert_equal(read_stats.num_reads, 2)
+  assert read_stats.num_bytes > 0
+  from Dataset import init_dataset
+  orig_dataset = init_dataset({"class": "Task12AXDataset", "num_seqs": 23})
+  orig_dataset.init_seq_order(epoch=1)
+  for seq_idx in range(hdf_dataset.num_seqs):
+    orig_dataset.load_seqs(seq_idx, seq_idx + 1)
+    for key in ["data", "classes"]:
+      numpy.testing.assert_array_equal(hdf_dataset.get_data(seq_idx, key), orig_dataset.get_data(seq_idx, key))
+
+
+def test_HDFDataset_close():
+  hdf_fn = generate_hdf_from_other({"class": "Task12AXDataset", "num_seqs": 23})
+  hdf_dataset = HDFDataset(files=[hdf_fn], cache_byte_size=1000)  # small cache, such that we load on demand
+  hdf_dataset.initialize()
+  hdf_dataset.init_seq_order(epoch=1)
+  hdf_dataset.load_seqs(0, 2)
+  assert_equal(len(hdf_dataset._file_pool._files), 1)
+  hdf_dataset.close()
+  assert_equal(len(hdf_dataset._file_pool._files), 0)
+  # Reopened on demand.
+  hdf_dataset.load_seqs(20, 22)
+  assert_equal(len(hdf_dataset._file_pool._files), 1)
+  from Dataset import init_dataset
+  orig_dataset = init_dataset({"class": "Task12AXDataset", "num_seqs": 23})
+  orig_dataset.init_seq_order(epoch=1)
+  orig_dataset.load_seqs(0, 22)  # the data is generated in order
+  numpy.testing.assert_array_equal(hdf_dataset.get_data(21, "data"), orig_dataset.get_data(21, "data"))
+  hdf_dataset.close()
+
+
+def test_HDFDataset_no_cache_mmap():
+  hdf_fn = generate_hdf_from_other({"class": "Task12AXDataset", "num_seqs": 23})
+  hdf_dataset = HDFDataset(files=[hdf_fn], cache_byte_size=0)
+  hdf_dataset.initialize()
+  hdf_dataset.init_seq_order(epoch=1)
+  mmap_dataset = HDFDataset(files=[hdf_fn], cache_byte_size=0, use_mmap=True)
+  mmap_dataset.initialize()
+  mmap_dataset.init_seq_order(epoch=1)
+  assert_equal(sorted(mmap_dataset._mmap_data[0].keys()), ["classes", "data"])
+  assert_equal(mmap_dataset.num_seqs, hdf_dataset.num_seqs)
+  for seq_idx in range(mmap_dataset.num_seqs):
+    hdf_dataset.load_seqs(seq_idx, seq_idx + 1)
+    mmap_dataset.load_seqs(seq_idx, seq_idx + 1)
+    for key in ["data", "classes"]:
+      data = mmap_dataset.get_data(seq_idx, key)
+      assert not data.flags.writeable
+      assert_equal(data.dtype, hdf_dataset.get_data(seq_idx, key).dtype)
+      numpy.testing.assert_array_equal(data, hdf_dataset.get_data(seq_idx, key))
+
+
+def test_HDFDataset_no_cache_mmap_chunked_fallback():
+  # SimpleHDFWriter creates resizable (chunked) datasets, which cannot be memory-mapped.
+  fn = _get_tmp_file(suffix=".hdf")
+  writer = SimpleHDFWriter(filename=fn, dim=3, labels=None)
+  inputs = numpy.random.normal(size=(2, 5, 3)).astype("float32")
+  writer.insert_batch(inputs=inputs, seq_len=[5, 4], seq_tag=["seq-0", "seq-1"])
+  writer.close()
+  dataset = HDFDataset(files=[fn], cache_byte_size=0, use_mmap=True)
+  dataset.initialize()
+  dataset.init_seq_order(epoch=1)
+  assert_equal(dataset._mmap_data, [{}])
+  dataset.load_seqs(0, 2)
+  numpy.testing.assert_array_equal(dataset.get_data(1, "data"), inputs[1, :4])
+
+
 def test_siamese_triplet_sampling():
   datasets_path = generate_dummy_hdf(3)
   dataset = SiameseHDFDataset(input_stream_name="features", seq_label_stream="classes", files=datasets_path)
@@ -619,6 +844,144 @@ def test_siamese_collect_single_seq():
   print("Done.")
 
 
+def _generate_batches_as_list(hdf_fn, vectorized, epoch=1, hdf_opts=None, **kwargs):
+  """
+  :param str hdf_fn:
+  :param bool vectorized: whether to use the vectorized batch planner or the generic code
+  :param int epoch:
+  :param dict[str]|None hdf_opts: for HDFDataset
+  :param kwargs: passed to Dataset._generate_batches
+  :return: batches (as comparable tuples), next random number of rnd_seq_drop
+  :rtype: (list[tuple], float)
+  """
+  dataset = HDFDataset(files=[hdf_fn], **(hdf_opts or {}))
+  dataset.initialize()
+  dataset.init_seq_order(epoch=epoch)
+  if vectorized:
+    assert dataset.get_all_seq_lengths() is not None
+
+    def get_seq_length(seq_idx):
+      """
+      :param int seq_idx:
+      """
+      raise Exception("get_seq_length(%i) called, but we expected the vectorized batch planner" % seq_idx)
+
+    dataset.get_seq_length = get_seq_length
+  else:
+    dataset.get_all_seq_lengths = lambda: None
+
+  def to_tuple(d):
+    """
+    :param Util.NumbersDict d:
+    :rtype: tuple
+    """
+    return tuple(sorted(d.dict.items())), d.value
+
+  batches = []
+  for batch in dataset._generate_batches(**kwargs):
+    batches.append((
+      batch.num_slices, to_tuple(batch.max_num_frames_per_slice),
+      [(part.seq_idx, to_tuple(part.seq_start_frame), to_tuple(part.seq_end_frame),
+        part.batch_slice, to_tuple(part.batch_frame_offset))
+       for part in batch.seqs]))
+  return batches, dataset.rnd_seq_drop.random()
+
+
+def test_HDFDataset_generate_batches_vectorized():
+  hdf_fn = generate_hdf_from_other({"class": "Task12AXDataset", "num_seqs": 37})
+  for kwargs in [
+        dict(recurrent_net=True, batch_size=50, max_seqs=3),
+        dict(recurrent_net=True, batch_size=0, max_seqs=4, max_seq_length=15, min_seq_length=3),
+        dict(recurrent_net=True, batch_size=40, seq_drop=0.3, max_total_num_seqs=11),
+        dict(recurrent_net=True, batch_size={"data": 30, "classes": 100}, max_seq_length=-12),
+        dict(recurrent_net=False, batch_size=17, max_seqs=3),
+        dict(recurrent_net=False, batch_size=23, max_total_num_seqs=5),
+        dict(recurrent_net=False, batch_size=1000)]:
+    for epoch in [1, 2]:
+      batches, rnd_value = _generate_batches_as_list(
+        hdf_fn, vectorized=True, epoch=epoch, hdf_opts={"seq_ordering": "random"}, **kwargs)
+      assert len(batches) > 0
+      assert_equal(
+        (batches, rnd_value),
+        _generate_batches_as_list(
+          hdf_fn, vectorized=False, epoch=epoch, hdf_opts={"seq_ordering": "random"}, **kwargs),
+        "not equal for %r" % kwargs)
+
+
+def test_HDFDataset_generate_batches_vectorized_chunking():
+  hdf_fn = generate_hdf_from_other({"class": "Task12AXDataset", "num_seqs": 23})
+  for hdf_opts, kwargs in [
+        (dict(chunking="7:3"), dict(batch_size=40, max_seqs=5)),
+        (dict(chunking="10:5", min_chunk_size=3), dict(batch_size=100, seq_drop=0.5)),
+        (dict(chunking="5"), dict(batch_size=20, max_total_num_seqs=4, used_data_keys={"data"})),
+        (dict(chunking="6:2"), dict(batch_size=30, used_data_keys={"classes"})),
+        # All chunks are dropped by min_seq_length.
+        (dict(chunking="1"), dict(batch_size=13, max_seqs=1, max_total_num_seqs=40, min_seq_length=3))]:
+    batches, rnd_value = _generate_batches_as_list(
+      hdf_fn, vectorized=True, recurrent_net=True, hdf_opts=hdf_opts, **kwargs)
+    if "min_seq_length" in kwargs:
+      assert_equal(batches, [])
+    else:
+      assert len(batches) > 0
+    assert_equal(
+      (batches, rnd_value),
+      _generate_batches_as_list(hdf_fn, vectorized=False, recurrent_net=True, hdf_opts=hdf_opts, **kwargs),
+      "not equal for %r, %r" % (hdf_opts, kwargs))
+
+
+def test_HDFDataset_generate_batches_bucket():
+  hdf_fn = generate_hdf_from_other({"class": "Task12AXDataset", "num_seqs": 41})
+  for hdf_opts in [{"seq_ordering": "bucket:.6"}, {"seq_ordering": "bucket:3", "seq_order_compat": False}]:
+    for kwargs in [
+          dict(recurrent_net=True, batch_size=200, max_seqs=10),
+          dict(recurrent_net=True, batch_size=40, seq_drop=0.3)]:
+      batches, rnd_value = _generate_batches_as_list(hdf_fn, vectorized=True, hdf_opts=hdf_opts, **kwargs)
+      assert_equal(
+        (batches, rnd_value),
+        _generate_batches_as_list(hdf_fn, vectorized=False, hdf_opts=hdf_opts, **kwargs),
+        "not equal for %r, %r" % (hdf_opts, kwargs))
+
+    dataset = HDFDataset(files=[hdf_fn], **hdf_opts)
+    dataset.initialize()
+    dataset.init_seq_order(epoch=1)
+    bucket_idxs = dataset._seq_order_bucket_idxs
+    for recurrent_net in [False, True]:
+      for batch in dataset._generate_batches(recurrent_net=recurrent_net, batch_size=200, max_seqs=10):
+        assert_equal(len(set(bucket_idxs[part.seq_idx] for part in batch.seqs)), 1)  # within one bucket
+    batches = list(dataset._generate_batches(recurrent_net=True, batch_size=200, max_seqs=10))
+    # generate_batches shuffles the batches.
+    batch_gen = dataset.generate_batches(recurrent_net=True, batch_size=200, max_seqs=10)
+    shuffled_batches = batch_gen.peek_next_n(len(batches) + 1)
+    assert_equal(len(shuffled_batches), len(batches))
+
+    def key(batch):
+      """
+      :param EngineBatch.Batch batch:
+      :rtype: list[int]
+      """
+      return [part.seq_idx for part in batch.seqs]
+
+    assert_equal(sorted(map(key, shuffled_batches)), sorted(map(key, batches)))
+    assert_true(list(map(key, shuffled_batches)) != list(map(key, batches)))
+
+
+def test_HDFDataset_generate_batches_vectorized_different_lens():
+  hdf_fn = generate_hdf_from_other({
+    "class": "DummyDatasetMultipleSequenceLength", "input_dim": 3, "output_dim": 5, "num_seqs": 13,
+    "seq_len": {"data": 7, "classes": 4}})
+  kwargs = dict(recurrent_net=True, batch_size={"data": 30, "classes": 10}, max_seqs=4)
+  batches, rnd_value = _generate_batches_as_list(hdf_fn, vectorized=True, **kwargs)
+  assert_equal([len(batch[2]) for batch in batches], [2] * 6 + [1])
+  assert_equal((batches, rnd_value), _generate_batches_as_list(hdf_fn, vectorized=False, **kwargs))
+  # Not supported by the vectorized planner, but the generic code is used then.
+  dataset = HDFDataset(files=[hdf_fn])
+  dataset.initialize()
+  dataset.init_seq_order(epoch=1)
+  assert_equal(
+    [len(batch.seqs) for batch in dataset._generate_batches(recurrent_net=False, batch_size=20, max_seqs=10)],
+    [3, 4, 4, 4, 2])
+
+
 if __name__ == "__main__":
   better_exchook.install()
   if len(sys.argv) <= 1:
@@ -0,0 +1,200 @@
+
+from __future__ import print_function
+
+import sys
+import os
+my_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, "%s/.." % my_dir)
+
+import unittest
+import tempfile
+import shutil
+import gzip
+import numpy
+from nose.tools import assert_equal, assert_true
+from LmDataset import LmDataset, TranslationDataset, LineIndexedCorpus, TokenIdCache, read_corpus
+import better_exchook
+better_exchook.replace_traceback_format_tb()
+
+from Log import log
+log.initialize(verbosity=[5])
+
+
+def _get_tmp_dir():
+  """
+  :return: dirname
+  :rtype: str
+  """
+  path = tempfile.mkdtemp(suffix=".lm-dataset")
+  import atexit
+  atexit.register(lambda: shutil.rmtree(path, ignore_errors=True))
+  return path
+
+
+def _create_corpus(path, num_lines=100, gzipped=False, seed=42):
+  """
+  :param str path: dir
+  :param int num_lines:
+  :param bool gzipped:
+  :param int seed:
+  :return: corpus filename, orth symbols map filename
+  :rtype: (str, str)
+  """
+  rnd = numpy.random.RandomState(seed)
+  words = ["a", "b", "c", "dd", "e"]
+  lines = []
+  for i in range(num_lines):
+    lines.append(" ".join(rnd.choice(words, size=rnd.randint(0, 20))))
+    if i % 10 == 3:
+      lines.append("   ")  # will be skipped
+  content = ("\n".join(lines) + "\n").encode("utf8")
+  corpus_file = "%s/corpus.txt%s" % (path, ".gz" if gzipped else "")
+  with (gzip.open(corpus_file, "wb") if gzipped else open(corpus_file, "wb")) as f:
+    f.write(content)
+  symbols_file = "%s/orth_symbols_map.txt" % path
+  with open(symbols_file, "w") as f:
+    f.write("".join(["%s %i\n" % (w, i) for (i, w) in enumerate(["[END]"] + words)]))
+  return corpus_file, symbols_file
+
+
+def _read_all(dataset, epoch=1):
+  """
+  :param LmDataset dataset:
+  :param int epoch:
+  :return: list of (tag, data)
+  :rtype: list[(str,list[int])]
+  """
+  dataset.init_seq_order(epoch=epoch)
+  res = []
+  seq_idx = 0
+  while dataset.is_less_than_num_seqs(seq_idx):
+    dataset.load_seqs(seq_idx, seq_idx + 1)
+    res.append((dataset.get_tag(seq_idx), dataset.get_data(seq_idx, "data").tolist()))
+    seq_idx += 1
+  return res
+
+
+def test_LineIndexedCorpus():
+  for gzipped in [False, True]:
+    path = _get_tmp_dir()
+    corpus_file, _ = _create_corpus(path, num_lines=1000, gzipped=gzipped)
+    orths = read_corpus(corpus_file)
+    corpus = LineIndexedCorpus(corpus_file, block_size=512)
+    assert_equal(len(corpus), len(orths))
+    for i in numpy.random.RandomState(1).permutation(len(orths)):
+      assert_equal(corpus.get_line(i), orths[i])
+      assert_equal(corpus.get_line_len(i), len(orths[i]))
+    assert_true(os.path.exists(corpus_file + ".line-index.npy"))
+    # Now loaded from the index.
+    corpus = LineIndexedCorpus(corpus_file, block_size=512)
+    assert_equal(corpus.get_line(len(orths) - 1), orths[-1])
+
+
+def test_LineIndexedCorpus_rebuild_on_change():
+  path = _get_tmp_dir()
+  corpus_file, _ = _create_corpus(path, num_lines=10)
+  assert_equal(len(LineIndexedCorpus(corpus_file)), 10)
+  st = os.stat(corpus_file)
+  with open(corpus_file, "a") as f:
+    f.write("new line\n")
+  os.utime(corpus_file, (st.st_atime, st.st_mtime + 10))
+  corpus = LineIndexedCorpus(corpus_file)
+  assert_equal(len(corpus), 11)
+  assert_equal(corpus.get_line(10), "new line")
+
+
+def test_LmDataset_streaming():
+  for gzipped in [False, True]:
+    path = _get_tmp_dir()
+    corpus_file, symbols_file = _create_corpus(path, gzipped=gzipped)
+    opts = dict(
+      corpus_file=[corpus_file, corpus_file], orth_symbols_map_file=symbols_file, word_based=True,
+      seq_ordering="laplace:5", partition_epoch=3)
+    dataset = LmDataset(**opts)
+    dataset.initialize()
+    dataset_streaming = LmDataset(streaming=True, line_index_dir="%s/index" % path, **opts)
+    dataset_streaming.initialize()
+    assert_true(os.listdir("%s/index" % path))
+    assert_equal(dataset_streaming.estimated_num_seqs, dataset.estimated_num_seqs)
+    for epoch in [1, 2, 3, 4]:
+      seqs = _read_all(dataset, epoch=epoch)
+      assert_true(len(seqs) > 0)
+      assert_equal(_read_all(dataset_streaming, epoch=epoch), seqs)
+
+
+def test_LmDataset_token_cache():
+  path = _get_tmp_dir()
+  corpus_file, symbols_file = _create_corpus(path)
+  with open(corpus_file, "a") as f:
+    f.write("a b unknown_word c\n</s>\n")
+  opts = dict(
+    corpus_file=corpus_file, orth_symbols_map_file=symbols_file, word_based=True,
+    seq_ordering="sorted", error_on_invalid_seq=False)
+  dataset = LmDataset(**opts)
+  dataset.initialize()
+  seqs = _read_all(dataset)
+  for _ in range(2):  # first builds the cache, then uses it
+    dataset_cached = LmDataset(token_cache_dir="%s/cache" % path, **opts)
+    dataset_cached.initialize()
+    assert_true(isinstance(dataset_cached._token_cache, TokenIdCache))
+    assert_equal(dataset_cached.orths, None)
+    assert_equal(_read_all(dataset_cached), seqs)
+    assert_equal(dataset_cached.num_skipped, 1)
+  assert_equal(len(os.listdir("%s/cache" % path)), 1)
+
+
+def test_TranslationDataset_token_cache():
+  import pickle
+  path = _get_tmp_dir()
+  vocab = {"a": 0, "b": 1, "c": 2, "</S>": 3, "<UNK>": 4}
+  for prefix in ["source", "target"]:
+    with open("%s/%s.vocab.pkl" % (path, prefix), "wb") as f:
+      pickle.dump(vocab, f)
+  with open("%s/source.train" % path, "w") as f:
+    f.write("a b c\nc c\nb x a\n")
+  with open("%s/target.train" % path, "w") as f:
+    f.write("c b a\na\nb b b b\n")
+  opts = dict(path=path, file_postfix="train", target_postfix=" </S>", unknown_label="<UNK>")
+  dataset = TranslationDataset(**opts)
+  dataset.initialize()
+  dataset.init_seq_order(epoch=1)
+  dataset.load_seqs(0, 3)
+  seqs = [(dataset.get_data(i, "data").tolist(), dataset.get_data(i, "classes").tolist()) for i in range(3)]
+  assert_equal(seqs[2], ([1, 4, 0], [1, 1, 1, 1, 3]))
+  for i in range(2):  # first builds the cache, then uses it
+    dataset_cached = TranslationDataset(token_cache_dir="%s/cache" % path, **opts)
+    dataset_cached.initialize()
+    if i == 1:
+      assert_equal(dataset_cached._thread, None)
+    dataset_cached.init_seq_order(epoch=1)
+    dataset_cached.load_seqs(0, 3)
+    assert_equal(
+      [(dataset_cached.get_data(i, "data").tolist(), dataset_cached.get_data(i, "classes").tolist())
+       for i in range(3)],
+      seqs)
+    if dataset_cached._thread:
+      dataset_cached._thread.join()
+    assert_true(isinstance(dataset_cached._data["classes"], TokenIdCache))
+
+
+if __name__ == "__main__":
+  better_exchook.install()
+  if len(sys.argv) <= 1:
+    for k, v in sorted(globals().items()):
+      if k.startswith("test_"):
+        print("-" * 40)
+        print("Executing: %s" % k)
+        try:
+          v()
+        except unittest.SkipTest as exc:
+          print("SkipTest:", exc)
+        print("-" * 40)
+    print("Finished all tests.")
+  else:
+    assert len(sys.argv) >= 2
+    for arg in sys.argv[1:]:
+      print("Executing: %s" % arg)
+      if arg in globals():
+        globals()[arg]()  # assume function and execute
+      else:
+        eval(arg)  # assume Python code and execute
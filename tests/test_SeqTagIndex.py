@@ -0,0 +1,129 @@
+from __future__ import print_function
+
+import sys
+import os
+my_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, "%s/.." % my_dir)
+
+import unittest
+import tempfile
+import numpy
+from nose.tools import assert_equal, assert_true, assert_raises
+from SeqTagIndex import SeqTagIndex
+import better_exchook
+better_exchook.replace_traceback_format_tb()
+
+
+def _get_tmp_file():
+  """
+  :return: filename
+  :rtype: str
+  """
+  fd, fn = tempfile.mkstemp(suffix=".tags")
+  os.close(fd)
+  import atexit
+  atexit.register(lambda: os.remove(fn))
+  return fn
+
+
+def test_SeqTagIndex_lookup():
+  tags = ["corpus/seq-%i/1" % i for i in range(1000)] + [u"corpus/äöü", ""]
+  index = SeqTagIndex.from_tags(tags)
+  assert_equal(len(index), len(tags))
+  assert_equal(index.tolist(), tags)
+  assert_equal(index, tags)
+  assert_equal(index[3], tags[3])
+  assert_equal(index[-1], "")
+  assert_equal(index[2:5].tolist(), tags[2:5])
+  for i, tag in enumerate(tags):
+    assert_equal(index.get_index(tag), i)
+  assert_true("corpus/seq-1000/1" not in index)
+  assert_equal(index.get("corpus/seq-1000/1"), None)
+  assert_raises(KeyError, lambda: index.get_index("corpus/seq-1000/1"))
+  assert_true(not index.has_duplicates())
+
+
+def test_SeqTagIndex_duplicates():
+  tags = ["a", "b", "a", "c", "a", "b"]
+  index = SeqTagIndex.from_tags(tags)
+  assert_true(index.has_duplicates())
+  # Like a dict built from the tags, i.e. the last idx.
+  tag_idx = {tag: i for (i, tag) in enumerate(tags)}
+  for tag in tags:
+    assert_equal(index.get_index(tag), tag_idx[tag])
+  assert_equal(index.get_index("a"), 4)
+  assert_equal(index.get_index("c"), 3)
+  # Many duplicates, which collide with other tags in the hash table.
+  tags = ["seq-%i" % (i % 7) for i in range(100)]
+  index = SeqTagIndex.from_tags(tags)
+  tag_idx = {tag: i for (i, tag) in enumerate(tags)}
+  for tag in tag_idx:
+    assert_equal(index.get_index(tag), tag_idx[tag])
+  # The same after save and load.
+  fn = _get_tmp_file()
+  index.save(fn)
+  for tag in tag_idx:
+    assert_equal(SeqTagIndex.load(fn).get_index(tag), tag_idx[tag])
+
+
+def test_SeqTagIndex_str():
+  index = SeqTagIndex.from_tags([b"seq-0", u"seq-\xe4"])
+  assert_true(all(isinstance(tag, str) for tag in index))
+  assert_true(isinstance(index[0], str))
+  assert_equal(index[0], "seq-0")
+  assert_equal(index.get_index(u"seq-\xe4"), 1)
+
+
+def test_SeqTagIndex_bytes_array():
+  # Like seqTags in HDF files.
+  tags = numpy.array([b"seq-0", b"seq-12\x00garbage", b""], dtype="S16")
+  index = SeqTagIndex.from_tags(tags)
+  assert_equal(index.tolist(), ["seq-0", "seq-12", ""])
+  assert_equal(index.get_index(b"seq-12"), 1)
+
+
+def test_SeqTagIndex_take_concat():
+  index = SeqTagIndex.from_tags(["seq-%i" % i for i in range(10)])
+  assert_equal(index.take([7, 1, 1, 3]).tolist(), ["seq-7", "seq-1", "seq-1", "seq-3"])
+  assert_equal(len(index.take([])), 0)
+  other = SeqTagIndex.from_tags(["other-0", "other-1"])
+  concat = SeqTagIndex.concat([index, other])
+  assert_equal(concat.tolist(), index.tolist() + other.tolist())
+  assert_equal(concat.get_index("other-1"), 11)
+
+
+def test_SeqTagIndex_save_load():
+  fn = _get_tmp_file()
+  tags = ["seq-%i" % i for i in range(100)]
+  SeqTagIndex.from_tags(tags).save(fn)
+  for mmap in [True, False]:
+    index = SeqTagIndex.load(fn, mmap=mmap)
+    assert_equal(index.tolist(), tags)
+    assert_equal(index.get_index("seq-42"), 42)
+  SeqTagIndex.from_tags([]).save(fn)
+  index = SeqTagIndex.load(fn)
+  assert_equal(len(index), 0)
+  assert_equal(index.get("seq-42"), None)
+
+
+if __name__ == "__main__":
+  better_exchook.install()
+  if len(sys.argv) <= 1:
+    for k, v in sorted(globals().items()):
+      if k.startswith("test_"):
+        print("-" * 40)
+        print("Executing: %s" % k)
+        try:
+          v()
+        except unittest.SkipTest as exc:
+          print("SkipTest:", exc)
+        print("-" * 40)
+    print("Finished all tests.")
+  else:
+    assert len(sys.argv) >= 2
+    for arg in sys.argv[1:]:
+      print("Executing: %s" % arg)
+      if arg in globals():
+        globals()[arg]()  # assume function and execute
+      else:
+        eval(arg)  # assume Python code and execute
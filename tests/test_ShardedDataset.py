@@ -0,0 +1,174 @@
+
+from __future__ import print_function
+
+import sys
+import os
+my_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, "%s/.." % my_dir)
+
+import unittest
+import tempfile
+import shutil
+import numpy
+from nose.tools import assert_equal, assert_true, assert_raises
+from ShardedDataset import ShardedDataset, ShardedDatasetWriter
+from Dataset import init_dataset
+from GeneratingDataset import StaticDataset
+import better_exchook
+better_exchook.replace_traceback_format_tb()
+
+from Log import log
+log.initialize(verbosity=[5])
+
+
+def _get_tmp_dir():
+  """
+  :return: dirname
+  :rtype: str
+  """
+  path = tempfile.mkdtemp(suffix=".sharded")
+  import atexit
+  atexit.register(lambda: shutil.rmtree(path, ignore_errors=True))
+  return path
+
+
+def _dump(dataset, seqs_per_shard):
+  """
+  :param Dataset.Dataset dataset:
+  :param int seqs_per_shard:
+  :return: path
+  :rtype: str
+  """
+  path = _get_tmp_dir()
+  writer = ShardedDatasetWriter(path=path, seqs_per_shard=seqs_per_shard)
+  writer.dump_from_dataset(dataset, use_progress_bar=False)
+  writer.close()
+  return path
+
+
+def _read_all(dataset, epoch=1):
+  """
+  :param Dataset.Dataset dataset:
+  :param int epoch:
+  :return: list of (tag, dict key -> data)
+  :rtype: list[(str,dict[str,numpy.ndarray])]
+  """
+  dataset.init_seq_order(epoch=epoch)
+  res = []
+  seq_idx = 0
+  while dataset.is_less_than_num_seqs(seq_idx):
+    dataset.load_seqs(seq_idx, seq_idx + 1)
+    res.append((dataset.get_tag(seq_idx), {key: dataset.get_data(seq_idx, key) for key in dataset.get_data_keys()}))
+    seq_idx += 1
+  return res
+
+
+def test_ShardedDataset_from_Task12AXDataset():
+  orig_dataset = init_dataset({"class": "Task12AXDataset", "num_seqs": 23})
+  path = _dump(orig_dataset, seqs_per_shard=5)
+  dataset = ShardedDataset(path=path)
+  dataset.initialize()
+  assert_equal(dataset.get_total_num_seqs(), 23)
+  assert_equal(dataset.get_data_keys(), ["classes", "data"])
+  assert_equal(dataset.num_outputs, orig_dataset.num_outputs)
+  assert_equal(dataset.get_data_dim("data"), orig_dataset.get_data_dim("data"))
+  assert_true(dataset.is_data_sparse("classes"))
+  assert_equal(dataset.get_data_shape("data"), orig_dataset.get_data_shape("data"))
+  orig_seqs = _read_all(orig_dataset)
+  seqs = _read_all(dataset)
+  assert_equal(len(seqs), len(orig_seqs))
+  for (orig_tag, orig_features), (tag, features) in zip(orig_seqs, seqs):
+    assert_equal(tag, orig_tag)
+    for key in ["data", "classes"]:
+      assert_equal(features[key].dtype, numpy.dtype(orig_dataset.get_data_dtype(key)))
+      numpy.testing.assert_array_almost_equal(features[key], orig_features[key])
+
+
+def test_ShardedDataset_custom_keys_seq_list():
+  orig_dataset = StaticDataset([
+    {"source": numpy.array([1, 2, 3], dtype="int32"), "target": numpy.array([3, 4, 5, 6, 7], dtype="int32")},
+    {"source": numpy.array([4], dtype="int32"), "target": numpy.array([], dtype="int32")},
+    {"source": numpy.array([5, 6], dtype="int32"), "target": numpy.array([8], dtype="int32")}])
+  path = _dump(orig_dataset, seqs_per_shard=2)
+  dataset = ShardedDataset(path=path)
+  dataset.initialize()
+  assert_equal(dataset.get_all_tags(), ["seq-0", "seq-1", "seq-2"])
+  dataset.init_seq_order(epoch=1, seq_list=["seq-2", "seq-1"])
+  dataset.load_seqs(0, 2)
+  assert_equal(dataset.get_tag(0), "seq-2")
+  assert_equal(dataset.get_data(0, "source").tolist(), [5, 6])
+  assert_equal(dataset.get_data(1, "target").tolist(), [])
+  assert_equal(dataset.get_corpus_seq_idx(0), 2)
+
+
+def test_ShardedDataset_sorted():
+  orig_dataset = init_dataset({"class": "Task12AXDataset", "num_seqs": 17})
+  path = _dump(orig_dataset, seqs_per_shard=4)
+  dataset = ShardedDataset(path=path, seq_ordering="sorted")
+  dataset.initialize()
+  seqs = _read_all(dataset)
+  seq_lens = [features["data"].shape[0] for (_, features) in seqs]
+  assert_equal(seq_lens, sorted(seq_lens))
+  assert_equal(len(seqs), 17)
+
+
+def test_ShardedDataset_shuffle_buffer():
+  orig_dataset = init_dataset({"class": "Task12AXDataset", "num_seqs": 23})
+  orig_seqs = _read_all(orig_dataset)
+  path = _dump(orig_dataset, seqs_per_shard=5)
+  dataset = ShardedDataset(path=path, seq_ordering="reverse", shuffle_buffer_size=4)
+  dataset.initialize()
+  seqs = _read_all(dataset)
+  tags = [tag for (tag, _) in seqs]
+  orig_tags = [tag for (tag, _) in orig_seqs]
+  assert_equal(sorted(tags), sorted(orig_tags))
+  assert_true(tags != list(reversed(orig_tags)))
+  for seq_idx, (tag, features) in enumerate(seqs):
+    corpus_seq_idx = dataset.get_corpus_seq_idx(seq_idx)
+    assert_equal(tag, orig_tags[corpus_seq_idx])
+    assert_equal(features["classes"].tolist(), orig_seqs[corpus_seq_idx][1]["classes"].tolist())
+
+
+def test_ShardedDatasetWriter_add_seq_sparse_dim():
+  path = _get_tmp_dir()
+  writer = ShardedDatasetWriter(path=path)
+  writer.set_data_keys(["classes", "data"])
+  # The number of classes cannot be inferred from sparse data.
+  assert_raises(AssertionError, lambda: writer.add_seq(
+    features={"data": numpy.zeros((3, 2), dtype="float32"), "classes": numpy.array([1, 2, 1], dtype="int32")},
+    seq_tag="seq-0"))
+
+  path = _get_tmp_dir()
+  writer = ShardedDatasetWriter(path=path)
+  writer.set_data_keys(["classes", "data"], num_outputs={"classes": (5, 1)})
+  writer.add_seq(
+    features={"data": numpy.zeros((3, 2), dtype="float32"), "classes": numpy.array([1, 4, 1], dtype="int32")},
+    seq_tag="seq-0")
+  writer.close()
+  dataset = ShardedDataset(path=path)
+  dataset.initialize()
+  assert_equal(dataset.num_outputs, {"classes": (5, 1), "data": (2, 2)})
+  assert_true(dataset.is_data_sparse("classes"))
+  assert_true(not dataset.is_data_sparse("data"))
+
+if __name__ == "__main__":
+  better_exchook.install()
+  if len(sys.argv) <= 1:
+    for k, v in sorted(globals().items()):
+      if k.startswith("test_"):
+        print("-" * 40)
+        print("Executing: %s" % k)
+        try:
+          v()
+        except unittest.SkipTest as exc:
+          print("SkipTest:", exc)
+        print("-" * 40)
+    print("Finished all tests.")
+  else:
+    assert len(sys.argv) >= 2
+    for arg in sys.argv[1:]:
+      print("Executing: %s" % arg)
+      if arg in globals():
+        globals()[arg]()  # assume function and execute
+      else:
+        eval(arg)  # assume Python code and execute
@@ -0,0 +1,222 @@
+
+from __future__ import print_function
+
+import sys
+import os
+my_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, "%s/.." % my_dir)
+
+import unittest
+import tempfile
+import shutil
+import zlib
+from struct import pack
+import numpy
+from nose.tools import assert_equal, assert_true
+from SprintCache import FileArchive, FileArchiveBundle, AllophoneLabeling, open_file_archive
+import better_exchook
+better_exchook.replace_traceback_format_tb()
+
+
+def _get_tmp_dir():
+  """
+  :return: dirname
+  :rtype: str
+  """
+  path = tempfile.mkdtemp(suffix=".sprint-cache")
+  import atexit
+  atexit.register(lambda: shutil.rmtree(path, ignore_errors=True))
+  return path
+
+
+def _add_raw_entry(archive, name, data, compress=False):
+  """
+  :param FileArchive archive:
+  :param str name:
+  :param bytes data: the record
+  :param bool compress:
+  """
+  archive.write_U32(archive.start_recovery_tag)
+  archive.write_u32(len(name))
+  archive.write_str(name)
+  pos = archive.f.tell()
+  size = len(data)
+  archive.write_u32(size)
+  if compress:
+    data = zlib.compress(data)
+    archive.write_u32(len(data))
+  else:
+    archive.write_u32(0)
+  archive.write_u32(0)  # chk
+  archive.f.write(data)
+  archive.write_U32(archive.end_recovery_tag)
+  from SprintCache import FileInfo
+  archive.ft[name] = FileInfo(name, pos, size, compress, len(archive.ft))
+
+
+def _make_alignment_record(runs):
+  """
+  :param list[(int,list[int])] runs: RLE runs (n, mixes). n > 0: n literal mixes, n < 0: one mix, 0: time reset
+  :rtype: bytes
+  """
+  size = sum([n if n > 0 else -n for (n, _) in runs])
+  data = pack("I", 14) + b"flow-alignment" + pack("i", 0) + b"ALIGNRLE" + pack("I", size)
+  for n, mixes in runs:
+    data += pack("b", n)
+    data += b"".join([pack("i", mix) for mix in mixes])
+  return data
+
+
+def _make_feature_record(features, times):
+  """
+  :param numpy.ndarray features: (T,dim)
+  :param numpy.ndarray times: (T,2)
+  :rtype: bytes
+  """
+  data = pack("I", 10) + b"vector-f32" + pack("I", len(features))
+  for feat, time in zip(features, times):
+    data += pack("I", len(feat)) + numpy.asarray(feat, dtype="<f4").tobytes() + numpy.asarray(time, "<f8").tobytes()
+  return data
+
+
+def test_FileArchive_read_features():
+  path = _get_tmp_dir()
+  rnd = numpy.random.RandomState(42)
+  features = rnd.normal(size=(17, 5)).astype("float32")
+  times = numpy.array([(i * 0.01, (i + 1) * 0.01) for i in range(17)])
+  archive = FileArchive("%s/feat.cache" % path, must_exists=False)
+  archive.add_feature_cache("seg1", features, times)
+  _add_raw_entry(archive, "seg2", _make_feature_record(features[:3], times[:3]), compress=True)
+  _add_raw_entry(archive, "seg3", _make_feature_record([features[0, :2], features[1]], times[:2]))
+  archive.finalize()
+  del archive
+  archive = open_file_archive("%s/feat.cache" % path)
+  times1, features1 = archive.read_features("seg1")
+  assert_equal(features1.dtype, numpy.float32)
+  assert_equal(features1.shape, (17, 5))
+  numpy.testing.assert_array_equal(features1, features)
+  numpy.testing.assert_array_equal(times1, times)
+  times2, features2 = archive.read_features("seg2")
+  numpy.testing.assert_array_equal(features2, features[:3])
+  _, features3 = archive.read_features("seg3")  # different dims
+  assert_equal(features3.shape, (2, 5))
+  numpy.testing.assert_array_equal(features3[0], [features[0, 0], features[0, 1], 0, 0, 0])
+  # Compatibility API.
+  times_list, features_list = archive.read("seg1", "feat")
+  assert_equal(len(features_list), 17)
+  numpy.testing.assert_array_equal(features_list[3], features[3])
+  numpy.testing.assert_array_equal(times_list[3], times[3])
+  assert_true(archive.read("seg1.attribs", "str").startswith("<flow-attributes>"))
+
+
+def test_FileArchive_read_alignment():
+  path = _get_tmp_dir()
+  with open("%s/allophones" % path, "w") as f:
+    f.write("# comment\n")
+    f.write("".join(["%s{#+#}@i@f\n" % p for p in ["si", "a", "b"]]))
+  with open("%s/phonemes" % path, "w") as f:
+    f.write("si\na\nb\n")
+  s = 1 << 26
+  runs = [(-3, [0]), (2, [1 + s, 2 + 2 * s]), (0, [10]), (-2, [2 + s]), (1, [1])]
+  expected = [
+    (0, 0, 0), (1, 0, 0), (2, 0, 0), (3, 1, 1), (4, 2, 2), (10, 2, 1), (11, 2, 1), (12, 1, 0)]
+  archive = FileArchive("%s/align.cache" % path, must_exists=False)
+  _add_raw_entry(archive, "seg1", _make_alignment_record(runs))
+  _add_raw_entry(archive, "seg2", _make_alignment_record(runs), compress=True)
+  archive.finalize()
+  del archive
+  archive = FileArchive("%s/align.cache" % path)
+  archive.set_allophones("%s/allophones" % path)
+  for name in ["seg1", "seg2"]:
+    times, allophones, states = archive.read_alignment(name)
+    assert_equal(list(zip(times.tolist(), allophones.tolist(), states.tolist())), expected)
+    assert_equal(archive.read(name, "align"), expected)
+    times, mixes = archive.read_alignment(name, raw=True)
+    assert_equal(mixes.tolist(), [0, 0, 0, 1 + s, 2 + 2 * s, 2 + s, 2 + s, 1])
+    assert_equal([archive.get_state(mix) for mix in mixes.tolist()], [(a, st) for (_, a, st) in expected])
+  labeling = AllophoneLabeling(
+    silence_phone="si", allophone_file="%s/allophones" % path, phoneme_file="%s/phonemes" % path)
+  _, allophones, states = archive.read_alignment("seg1")
+  assert_equal(
+    labeling.get_label_idxs(allophones, states).tolist(),
+    [labeling.get_label_idx(a, st) for (_, a, st) in expected])
+  _, mixes = archive.read_alignment("seg1", raw=True)
+  assert_equal(
+    labeling.get_label_idxs_by_allo_state_idxs(mixes).tolist(),
+    [labeling.get_label_idx_by_allo_state_idx(mix) for mix in mixes.tolist()])
+
+
+def test_FileArchiveBundle_read_features():
+  path = _get_tmp_dir()
+  features = numpy.arange(12, dtype="float32").reshape((4, 3))
+  times = numpy.zeros((4, 2))
+  for i in range(2):
+    archive = FileArchive("%s/feat.cache.%i" % (path, i), must_exists=False)
+    archive.add_feature_cache("corpus/seg%i" % i, features + i, times)
+    archive.finalize()
+    del archive
+  with open("%s/feat.bundle" % path, "w") as f:
+    f.write("".join(["%s/feat.cache.%i\n" % (path, i) for i in range(2)]))
+  bundle = open_file_archive("%s/feat.bundle" % path)
+  assert isinstance(bundle, FileArchiveBundle)
+  numpy.testing.assert_array_equal(bundle.read_features("corpus/seg1")[1], features + 1)
+  numpy.testing.assert_array_equal(bundle.read_features("seg0")[1], features)  # short name
+
+
+def test_FileArchive_read_threads():
+  import threading
+  path = _get_tmp_dir()
+  rnd = numpy.random.RandomState(42)
+  archive = FileArchive("%s/feat.cache" % path, must_exists=False)
+  features = {}
+  for i in range(20):
+    features["seg%i" % i] = rnd.normal(size=(rnd.randint(1, 100), 7)).astype("float32")
+    _add_raw_entry(
+      archive, "seg%i" % i, _make_feature_record(features["seg%i" % i], numpy.zeros((len(features["seg%i" % i]), 2))),
+      compress=i % 2 == 0)
+  archive.finalize()
+  del archive
+  archive = FileArchive("%s/feat.cache" % path)
+  errors = []
+
+  def reader(thread_idx):
+    """
+    :param int thread_idx:
+    """
+    try:
+      for j in range(50):
+        name = "seg%i" % ((thread_idx * 7 + j) % 20)
+        numpy.testing.assert_array_equal(archive.read_features(name)[1], features[name])
+    except Exception as exc:
+      errors.append(exc)
+      raise
+
+  threads = [threading.Thread(target=reader, args=(i,)) for i in range(8)]
+  for t in threads:
+    t.start()
+  for t in threads:
+    t.join()
+  assert_equal(errors, [])
+
+
+if __name__ == "__main__":
+  better_exchook.install()
+  if len(sys.argv) <= 1:
+    for k, v in sorted(globals().items()):
+      if k.startswith("test_"):
+        print("-" * 40)
+        print("Executing: %s" % k)
+        try:
+          v()
+        except unittest.SkipTest as exc:
+          print("SkipTest:", exc)
+        print("-" * 40)
+    print("Finished all tests.")
+  else:
+    assert len(sys.argv) >= 2
+    for arg in sys.argv[1:]:
+      print("Executing: %s" % arg)
+      if arg in globals():
+        globals()[arg]()  # assume function and execute
+      else:
+        eval(arg)  # assume Python code and execute
@@ -185,6 +185,56 @@ def test_py2_client():
   assert seq_idx == num_seqs
 
 
+def test_SprintCacheDataset_prefetch():
+  import tempfile
+  import shutil
+  from SprintCache import FileArchive
+  from SprintDataset import SprintCacheDataset
+  tmp_dir = tempfile.mkdtemp(suffix=".sprint-cache")
+  try:
+    rnd = np.random.RandomState(42)
+    archive = FileArchive("%s/feat.cache" % tmp_dir, must_exists=False)
+    for i in range(23):
+      num_frames = rnd.randint(1, 20)
+      archive.add_feature_cache(
+        "corpus/seg%i" % i, rnd.normal(size=(num_frames, 3)).astype("float32"), np.zeros((num_frames, 2)))
+    archive.finalize()
+    del archive
+
+    def read_all(dataset):
+      """
+      :param SprintCacheDataset dataset:
+      :rtype: list[(str,np.ndarray)]
+      """
+      dataset.init_seq_order(epoch=1)
+      res = []
+      seq_idx = 0
+      while dataset.is_less_than_num_seqs(seq_idx):
+        dataset.load_seqs(seq_idx, seq_idx + 1)
+        res.append((dataset.get_tag(seq_idx), dataset.get_data(seq_idx, "data")))
+        seq_idx += 1
+      return res
+
+    opts = {"data": {"data": {"filename": "%s/feat.cache" % tmp_dir}}, "seq_ordering": "random"}
+    seqs = read_all(SprintCacheDataset(**opts))
+    assert_equal(len(seqs), 23)
+    seqs_prefetched = read_all(SprintCacheDataset(num_prefetch_threads=3, **opts))
+    assert_equal([tag for (tag, _) in seqs_prefetched], [tag for (tag, _) in seqs])
+    for (_, data1), (_, data2) in zip(seqs, seqs_prefetched):
+      np.testing.assert_array_equal(data1, data2)
+    # Skipped seqs are not kept in the prefetch.
+    dataset = SprintCacheDataset(num_prefetch_threads=3, **opts)
+    dataset.init_seq_order(epoch=1)
+    dataset.load_seqs(0, 1)
+    assert_true(1 in dataset._prefetch_futures)
+    dataset.load_seqs(10, 11)
+    assert_equal(dataset.get_tag(10), seqs[10][0])
+    np.testing.assert_array_equal(dataset.get_data(10, "data"), seqs[10][1])
+    assert_true(all(seq_idx > 10 for seq_idx in dataset._prefetch_futures))
+  finally:
+    shutil.rmtree(tmp_dir)
+
+
 if __name__ == "__main__":
   better_exchook.install()
   if len(sys.argv) <= 1:
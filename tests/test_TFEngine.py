@@ -17,7 +17,7 @@ from TFEngine import *
 import TFUtil
 from TFNetwork import ExternData
 from Config import Config
-from nose.tools import assert_equal, assert_is_instance
+from nose.tools import assert_equal, assert_is_instance, assert_raises
 import unittest
 import numpy
 import numpy.testing
@@ -200,6 +200,82 @@ def test_engine_train_uneven_batches():
   engine.finalize()
 
 
+def test_engine_train_tf_data_pipeline():
+  from GeneratingDataset import DummyDataset
+  from TFDataPipeline import TFDatasetDataProvider
+  n_data_dim = 2
+  n_classes_dim = 3
+  train_data = DummyDataset(input_dim=n_data_dim, output_dim=n_classes_dim, num_seqs=11, seq_len=7)
+  train_data.init_seq_order(epoch=1)
+  cv_data = DummyDataset(input_dim=n_data_dim, output_dim=n_classes_dim, num_seqs=3, seq_len=5)
+  cv_data.init_seq_order(epoch=1)
+
+  config = Config()
+  config.update({
+    "model": "/tmp/model",
+    "num_outputs": n_classes_dim,
+    "num_inputs": n_data_dim,
+    "network": {
+      "rnn": {"class": "rec", "unit": "lstm", "n_out": 3},
+      "output": {"class": "softmax", "loss": "ce", "from": "rnn"}},
+    "start_epoch": 1,
+    "num_epochs": 2,
+    "batch_size": 20,
+    "tf_data_pipeline": True,
+    "tf_data_prefetch": 3
+  })
+  engine = Engine(config=config)
+  engine.init_train_from_config(config=config, train_data=train_data, dev_data=cv_data, eval_data=None)
+  assert engine.network.extern_data.iterator_input
+  assert isinstance(
+    engine._get_new_data_provider(dataset=train_data, batches=train_data.generate_batches(
+      recurrent_net=True, batch_size=20, max_seqs=10)),
+    TFDatasetDataProvider)
+  engine.train()
+  # feed_dict still works
+  engine.get_specific_feed_dict(dataset=cv_data, seq_idx=0)
+
+  engine.finalize()
+
+
+def test_engine_tf_data_pipeline_check_batch():
+  from GeneratingDataset import DummyDataset
+  n_data_dim = 2
+  n_classes_dim = 3
+  train_data = DummyDataset(input_dim=n_data_dim, output_dim=n_classes_dim, num_seqs=11, seq_len=7)
+  train_data.init_seq_order(epoch=1)
+
+  config = Config()
+  config.update({
+    "model": "/tmp/model",
+    "num_outputs": n_classes_dim,
+    "num_inputs": n_data_dim,
+    "network": {"output": {"class": "softmax", "loss": "ce"}},
+    "start_epoch": 1,
+    "num_epochs": 1,
+    "batch_size": 20,
+    "tf_data_pipeline": True
+  })
+  engine = Engine(config=config)
+  engine.init_train_from_config(config=config, train_data=train_data, dev_data=None, eval_data=None)
+  provider = engine._get_new_data_provider(dataset=train_data, batches=train_data.generate_batches(
+    recurrent_net=True, batch_size=20, max_seqs=2))
+  provider.start_threads()
+  output = engine.network.get_default_output_layer().output.placeholder
+  for _ in range(2):
+    feed_dict, _ = provider.get_feed_dict()
+    engine.tf_session.run(output, feed_dict=feed_dict)
+  # The buffers of the consumed batch were given back.
+  assert provider.buffer_pool.free.qsize() >= 1
+  # An additional session.run without the feed dict consumes a batch from the iterator.
+  assert_raises(tf.errors.InvalidArgumentError, lambda: engine.tf_session.run(output))
+  # Now the iterator is one batch ahead of the fed data.
+  feed_dict, _ = provider.get_feed_dict()
+  assert_raises(tf.errors.InvalidArgumentError, lambda: engine.tf_session.run(output, feed_dict=feed_dict))
+  provider.stop_threads()
+  engine.finalize()
+
+
 def test_engine_train_subnet_loss():
   from GeneratingDataset import DummyDataset
   seq_len = 5
@@ -125,6 +125,118 @@ def test_NumbersDict_int_floordiv():
   assert_equal(b.dict["classes"], 1)
 
 
+def _NumbersDict_bin_op_generic(a, b, op, zero):
+  """
+  The generic :func:`NumbersDict.bin_op`, without the fast paths, as a reference.
+
+  :param NumbersDict a:
+  :param NumbersDict|int|None b:
+  :param (T,T)->T op:
+  :param T zero:
+  :rtype: NumbersDict
+  """
+  if not isinstance(b, NumbersDict):
+    b = NumbersDict.constant_like(b, numbers_dict=a)
+  result = NumbersDict()
+  for k in a.keys_set | b.keys_set:
+    result[k] = NumbersDict.bin_op_scalar_optional(a.get(k, None), b.get(k, None), zero=zero, op=op)
+  result.value = NumbersDict.bin_op_scalar_optional(a.value, b.value, zero=zero, op=op)
+  return result
+
+
+def _NumbersDict_cases():
+  """
+  :rtype: list[NumbersDict]
+  """
+  return [
+    NumbersDict({"data": 3, "classes": 4}),
+    NumbersDict({"data": 5, "classes": 2}),  # same keys
+    NumbersDict(numbers_dict={"data": 7, "classes": 1}, broadcast_value=2),  # same keys, broadcast value
+    NumbersDict({"data": 6}),  # missing key
+    NumbersDict(numbers_dict={"classes": 3}, broadcast_value=5),  # missing key, broadcast value
+    NumbersDict({"data": 2, "other": 8}),
+    NumbersDict({"data": None, "classes": 4}),
+    NumbersDict(4),  # only broadcast value
+    NumbersDict()]
+
+
+def test_NumbersDict_bin_op_fast_paths():
+  import operator
+  ops = [
+    (operator.add, 0, lambda a, b: a + b, lambda a, b: a.__iadd__(b)),
+    (operator.sub, 0, lambda a, b: a - b, lambda a, b: a.__isub__(b)),
+    (operator.mul, 1, lambda a, b: a * b, lambda a, b: a.__imul__(b)),
+    (operator.floordiv, 1, lambda a, b: a // b, lambda a, b: a.__ifloordiv__(b)),
+    (NumbersDict._max, None, lambda a, b: NumbersDict.max([a, b]), None),
+    (NumbersDict._min, None, lambda a, b: NumbersDict.min([a, b]), None)]
+  for op, zero, func, func_inplace in ops:
+    for a in _NumbersDict_cases():
+      for b in _NumbersDict_cases() + [3, None]:
+        if b is None and op not in (NumbersDict._max, NumbersDict._min):
+          continue
+        if op is operator.floordiv and (b == 0 or (isinstance(b, NumbersDict) and 0 in b.values())):
+          continue
+        expected = _NumbersDict_bin_op_generic(a, b, op=op, zero=zero)
+        res = func(a.copy(), b)
+        assert_equal((res.dict, res.value), (expected.dict, expected.value), "%r %r %r" % (op, a, b))
+        if func_inplace:
+          a_ = a.copy()
+          res = func_inplace(a_, b)
+          assert_is(res, a_)
+          assert_equal((res.dict, res.value), (expected.dict, expected.value), "in-place %r %r %r" % (op, a, b))
+
+
+def test_NumbersDict_bin_op_inplace_self():
+  a = NumbersDict(numbers_dict={"data": 3, "classes": 4}, broadcast_value=1)
+  a_ = a
+  a += a
+  assert_is(a, a_)
+  assert_equal((a.dict, a.value), ({"data": 6, "classes": 8}, 2))
+
+
+def test_NumbersDict_scalar_reverse_ops():
+  a = NumbersDict(numbers_dict={"data": 3, "classes": 4}, broadcast_value=1)
+  for res, expected in [(2 + a, {"data": 5, "classes": 6}), (10 - a, {"data": 7, "classes": 6})]:
+    assert_equal(res.dict, expected)
+  assert_equal((10 - a).value, 9)
+  assert_equal((10 - NumbersDict({"data": 3})).value, None)
+
+
+def test_NumbersDict_any_compare():
+  def any_compare_generic(a, b, cmp):
+    for key in a.keys():
+      if key in b.keys():
+        if cmp(a[key], b[key]):
+          return True
+      elif b.value is not None:
+        if cmp(a[key], b.value):
+          return True
+    if a.value is not None and b.value is not None:
+      if cmp(a.value, b.value):
+        return True
+    return False
+
+  for a in _NumbersDict_cases():
+    for b in _NumbersDict_cases():
+      if None in a.values() or None in b.values():
+        continue
+      for cmp in [lambda x, y: x > y, lambda x, y: x < y]:
+        assert_equal(a.any_compare(b, cmp), any_compare_generic(a, b, cmp), "%r %r" % (a, b))
+
+
+def test_NumbersDict_max_instance():
+  a = NumbersDict({"data": 3})
+  assert_raises(Exception, lambda: a.max([a]))
+  assert_equal(NumbersDict.max([a, 5]).dict, {"data": 5})
+
+
+def test_NumbersDict_pickle():
+  import pickle
+  a = NumbersDict(numbers_dict={"data": 3, "classes": 4}, broadcast_value=1)
+  b = pickle.loads(pickle.dumps(a))
+  assert_equal((b.dict, b.value), (a.dict, a.value))
+
+
 def test_collect_class_init_kwargs():
   class A(object):
     def __init__(self, a):
@@ -80,6 +80,26 @@ def test_hdf_create_unicode_labels():
   os.remove(hdf_filename)
 
 
+def test_sharded_create_and_load():
+  path = tempfile.mkdtemp(suffix=".sharded", prefix="nose-dataset-sharded")
+  os.rmdir(path)
+  sharded_dataset = sharded_dataset_init(path, seqs_per_shard=3)
+
+  dataset = DummyDataset(input_dim=2, output_dim=3, num_seqs=4)
+  dataset.init_seq_order(epoch=1)
+
+  hdf_dump_from_dataset(dataset, sharded_dataset, DictAsObj(options))
+  hdf_close(sharded_dataset)
+
+  from ShardedDataset import ShardedDataset
+  loaded_dataset = ShardedDataset(path=path)
+  loaded_dataset.initialize()
+  assert loaded_dataset.get_total_num_seqs() == 4
+
+  import shutil
+  shutil.rmtree(path)
+
+
 if __name__ == "__main__":
   better_exchook.install()
   if len(sys.argv) <= 1:
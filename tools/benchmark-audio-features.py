@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+
+"""
+Benchmarks the feature extraction of :class:`GeneratingDataset.ExtractAudioFeatures`,
+i.e. the NumPy frontend vs the librosa frontend.
+Reports the startup time (first call, which includes e.g. the import of librosa)
+and the throughput in utterances per second, and the max abs difference between the frontends.
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import time
+
+my_dir = os.path.dirname(os.path.abspath(__file__))
+returnn_dir = os.path.dirname(my_dir)
+sys.path.insert(0, returnn_dir)
+
+import argparse
+import numpy
+from GeneratingDataset import ExtractAudioFeatures
+
+
+def get_audios(audio_files, num_utts, utt_len, sample_rate):
+  """
+  :param list[str] audio_files: if given, will read these (via soundfile). otherwise random audio
+  :param int num_utts:
+  :param float utt_len: in seconds, for random audio
+  :param int sample_rate: for random audio
+  :return: audios, sample_rate
+  :rtype: (list[numpy.ndarray], int)
+  """
+  if audio_files:
+    # noinspection PyPackageRequirements
+    import soundfile
+    audios = []
+    for fn in audio_files:
+      audio, sample_rate = soundfile.read(fn)
+      audios.append(audio)
+    return audios, sample_rate
+  rnd = numpy.random.RandomState(42)
+  audios = [
+    rnd.uniform(-1., 1., size=(int(utt_len * sample_rate * rnd.uniform(0.5, 1.5)),))
+    for _ in range(num_utts)]
+  return audios, sample_rate
+
+
+def benchmark(frontend, audios, sample_rate, batch_size, opts):
+  """
+  :param str frontend: "numpy" or "librosa"
+  :param list[numpy.ndarray] audios:
+  :param int sample_rate:
+  :param int batch_size:
+  :param dict[str] opts: for ExtractAudioFeatures
+  :return: features
+  :rtype: list[numpy.ndarray]
+  """
+  extractor = ExtractAudioFeatures(frontend=frontend, **opts)
+  start_time = time.time()
+  res = extractor.get_audio_features_batch([audios[0].copy()], sample_rate=sample_rate)
+  startup_time = time.time() - start_time
+  start_time = time.time()
+  for i in range(1, len(audios), batch_size):
+    res += extractor.get_audio_features_batch([a.copy() for a in audios[i:i + batch_size]], sample_rate=sample_rate)
+  elapsed = time.time() - start_time
+  print("%s: startup time %.3f sec, %.1f utts/sec (%i utts, %.3f sec)" % (
+    frontend, startup_time, (len(audios) - 1) / max(elapsed, 1e-10), len(audios) - 1, elapsed))
+  return res
+
+
+def main():
+  """
+  Main entry.
+  """
+  arg_parser = argparse.ArgumentParser(description=__doc__)
+  arg_parser.add_argument("--features", default="mfcc", help="mfcc, log_mel_filterbank, log_log_mel_filterbank")
+  arg_parser.add_argument("--num_feature_filters", type=int, default=40)
+  arg_parser.add_argument("--with_delta", type=int, default=0)
+  arg_parser.add_argument("--frontends", default="numpy,librosa", help="comma-separated")
+  arg_parser.add_argument("--batch_size", type=int, default=16, help="utts per get_audio_features_batch call")
+  arg_parser.add_argument("--num_utts", type=int, default=200, help="for random audio")
+  arg_parser.add_argument("--utt_len", type=float, default=10., help="avg len in seconds, for random audio")
+  arg_parser.add_argument("--sample_rate", type=int, default=16000, help="for random audio")
+  arg_parser.add_argument("audio_files", nargs="*", help="audio files to use instead of random audio")
+  args = arg_parser.parse_args()
+  audios, sample_rate = get_audios(
+    audio_files=args.audio_files, num_utts=args.num_utts, utt_len=args.utt_len, sample_rate=args.sample_rate)
+  opts = {"features": args.features, "num_feature_filters": args.num_feature_filters, "with_delta": args.with_delta}
+  results = {}
+  for frontend in args.frontends.split(","):
+    results[frontend] = benchmark(
+      frontend=frontend, audios=audios, sample_rate=sample_rate, batch_size=args.batch_size, opts=opts)
+  if len(results) == 2:
+    res1, res2 = results.values()
+    print("max abs diff:", max([numpy.max(numpy.abs(a - b)) for (a, b) in zip(res1, res2)]))
+
+
+if __name__ == "__main__":
+  import better_exchook
+  better_exchook.install()
+  main()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+
+"""
+Benchmarks the alloc interval bookkeeping of :class:`CachedDataset.CachedDataset`.
+Creates an HDF file with random data, and replays the load pattern of one epoch,
+i.e. :func:`Dataset.load_seqs` for every batch, like the training does.
+Reports the total time of the epoch and the time spent in the alloc interval bookkeeping.
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import time
+
+my_dir = os.path.dirname(os.path.abspath(__file__))
+returnn_dir = os.path.dirname(my_dir)
+sys.path.insert(0, returnn_dir)
+
+import argparse
+import tempfile
+from Log import log
+from Dataset import init_dataset
+from CachedDataset import CachedDataset
+from HDFDataset import HDFDataset, HDFDatasetWriter
+
+
+def create_hdf(num_seqs, seq_len, input_dim):
+  """
+  :param int num_seqs:
+  :param int seq_len:
+  :param int input_dim:
+  :return: filename
+  :rtype: str
+  """
+  fn = "%s/data.hdf" % tempfile.mkdtemp()
+  dataset = init_dataset({
+    "class": "DummyDataset", "input_dim": input_dim, "output_dim": 5, "num_seqs": num_seqs, "seq_len": seq_len})
+  writer = HDFDatasetWriter(fn)
+  writer.dump_from_dataset(dataset)
+  writer.close()
+  return fn
+
+
+class BookkeepingTimer(object):
+  """
+  Measures the time in :func:`CachedDataset._modify_alloc_intervals`.
+  """
+
+  def __init__(self):
+    self.elapsed = 0.0
+    self.num_calls = 0
+    self._orig_func = CachedDataset._modify_alloc_intervals
+
+  def install(self):
+    """
+    Wraps the function in the class.
+    """
+    timer = self
+
+    def _modify_alloc_intervals(dataset, start, end, invert):
+      start_time = time.time()
+      try:
+        return timer._orig_func(dataset, start, end, invert)
+      finally:
+        timer.elapsed += time.time() - start_time
+        timer.num_calls += 1
+
+    CachedDataset._modify_alloc_intervals = _modify_alloc_intervals
+
+
+def main():
+  """
+  Main entry.
+  """
+  arg_parser = argparse.ArgumentParser(description=__doc__)
+  arg_parser.add_argument("--hdf", help="existing HDF file. otherwise random data is created")
+  arg_parser.add_argument("--num_seqs", type=int, default=20000, help="for random data")
+  arg_parser.add_argument("--seq_len", type=int, default=10, help="for random data")
+  arg_parser.add_argument("--input_dim", type=int, default=4, help="for random data")
+  arg_parser.add_argument("--cache_byte_size", type=int, default=10 ** 6)
+  arg_parser.add_argument("--seq_ordering", default="random")
+  arg_parser.add_argument("--batch_size", type=int, default=50)
+  arg_parser.add_argument("--max_seqs", type=int, default=5)
+  arg_parser.add_argument("--shuffle_batches", type=int, default=1, help="shuffled access, as with cache whole epoch")
+  arg_parser.add_argument("--verbosity", type=int, default=2)
+  args = arg_parser.parse_args()
+  log.initialize(verbosity=[args.verbosity])
+  fn = args.hdf or create_hdf(num_seqs=args.num_seqs, seq_len=args.seq_len, input_dim=args.input_dim)
+  timer = BookkeepingTimer()
+  timer.install()
+  dataset = HDFDataset(files=[fn], cache_byte_size=args.cache_byte_size, seq_ordering=args.seq_ordering)
+  dataset.initialize()
+  dataset.init_seq_order(epoch=1)
+  batches = dataset.generate_batches(
+    recurrent_net=True, batch_size=args.batch_size, max_seqs=args.max_seqs, shuffle_batches=bool(args.shuffle_batches))
+  start_time = time.time()
+  num_batches = 0
+  while batches.has_more():
+    batch, = batches.peek_next_n(1)
+    dataset.load_seqs(batch.start_seq, batch.end_seq)
+    batches.advance(1)
+    num_batches += 1
+  elapsed = time.time() - start_time
+  print("%i seqs, %i batches, epoch: %.3f sec, alloc interval bookkeeping: %.3f sec (%i calls)" % (
+    dataset.num_seqs, num_batches, elapsed, timer.elapsed, timer.num_calls))
+  print("final num alloc intervals: %i" % len(dataset.alloc_intervals or []))
+
+
+if __name__ == "__main__":
+  import better_exchook
+  better_exchook.install()
+  main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+
+"""
+Benchmarks the :class:`Util.NumbersDict` arithmetic,
+and the generic batch generation (:func:`Dataset.Dataset._generate_batches`, without the vectorized planner),
+which is dominated by the NumbersDict arithmetic.
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import time
+
+my_dir = os.path.dirname(os.path.abspath(__file__))
+returnn_dir = os.path.dirname(my_dir)
+sys.path.insert(0, returnn_dir)
+
+import argparse
+import numpy
+from Log import log
+from Dataset import Dataset
+from Util import NumbersDict
+
+
+class SeqLensDataset(Dataset):
+  """
+  Only provides the seq lengths, which is all what the batch generation needs.
+  """
+
+  def __init__(self, seq_lens, **kwargs):
+    """
+    :param list[int] seq_lens:
+    """
+    super(SeqLensDataset, self).__init__(**kwargs)
+    self._seq_lens = seq_lens
+
+  @property
+  def num_seqs(self):
+    """
+    :rtype: int
+    """
+    return len(self._seq_lens)
+
+  def get_seq_length(self, seq_idx):
+    """
+    :param int seq_idx:
+    :rtype: NumbersDict
+    """
+    return NumbersDict({"data": self._seq_lens[seq_idx], "classes": self._seq_lens[seq_idx]})
+
+
+def benchmark_ops(num_iterations):
+  """
+  :param int num_iterations:
+  """
+  a = NumbersDict({"data": 3, "classes": 4})
+  b = NumbersDict({"data": 5, "classes": 2})
+  start_time = time.time()
+  for _ in range(num_iterations):
+    c = a + b
+    c += b
+    NumbersDict.max([c, a]).any_compare(b, lambda x, y: x > y)
+  print("NumbersDict ops: %.3f usec per iteration" % ((time.time() - start_time) * 1e6 / num_iterations))
+
+
+def benchmark_generate_batches(num_seqs, batch_size, max_seqs):
+  """
+  :param int num_seqs:
+  :param int batch_size:
+  :param int max_seqs:
+  """
+  dataset = SeqLensDataset(seq_lens=numpy.random.RandomState(42).randint(1, 500, size=(num_seqs,)).tolist())
+  dataset.init_seq_order(epoch=1)
+  for recurrent_net in [True, False]:
+    start_time = time.time()
+    num_batches = 0
+    for _ in dataset._generate_batches(recurrent_net=recurrent_net, batch_size=batch_size, max_seqs=max_seqs):
+      num_batches += 1
+    print("generate batches, recurrent_net %r: %i batches, %.3f sec" % (
+      recurrent_net, num_batches, time.time() - start_time))
+
+
+def main():
+  """
+  Main entry.
+  """
+  arg_parser = argparse.ArgumentParser(description=__doc__)
+  arg_parser.add_argument("--num_iterations", type=int, default=100000, help="for the ops")
+  arg_parser.add_argument("--num_seqs", type=int, default=10000)
+  arg_parser.add_argument("--batch_size", type=int, default=5000)
+  arg_parser.add_argument("--max_seqs", type=int, default=50)
+  arg_parser.add_argument("--verbosity", type=int, default=2)
+  args = arg_parser.parse_args()
+  log.initialize(verbosity=[args.verbosity])
+  benchmark_ops(num_iterations=args.num_iterations)
+  benchmark_generate_batches(num_seqs=args.num_seqs, batch_size=args.batch_size, max_seqs=args.max_seqs)
+
+
+if __name__ == "__main__":
+  import better_exchook
+  better_exchook.install()
+  main()
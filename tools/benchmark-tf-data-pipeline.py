@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+
+"""
+Benchmarks the TF data pipelines,
+i.e. :class:`TFDataPipeline.FeedDictDataProvider` (feed_dict)
+vs :class:`TFDataPipeline.TFDatasetDataProvider` (config option ``tf_data_pipeline``).
+Trains one epoch on random data (:class:`GeneratingDataset.DummyDataset`) with each of them
+and reports the steps per second.
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+
+my_dir = os.path.dirname(os.path.abspath(__file__))
+returnn_dir = os.path.dirname(my_dir)
+sys.path.insert(0, returnn_dir)
+
+import argparse
+import tempfile
+from Log import log
+from Config import Config
+from GeneratingDataset import DummyDataset
+
+
+def benchmark(pipeline, args):
+  """
+  :param str pipeline: "feed_dict" or "tf_data"
+  :param args: from argparse
+  :return: steps per second
+  :rtype: float
+  """
+  from TFEngine import Engine, Runner
+  dataset = DummyDataset(
+    input_dim=args.input_dim, output_dim=args.output_dim, num_seqs=args.num_seqs, seq_len=args.seq_len)
+  dataset.init_seq_order(epoch=1)
+  network = {"output": {"class": "softmax", "loss": "ce", "from": "hidden"}}
+  if args.lstm:
+    network["hidden"] = {"class": "rec", "unit": "nativelstm2", "n_out": args.hidden_dim}
+  else:
+    network["hidden"] = {"class": "linear", "activation": "relu", "n_out": args.hidden_dim}
+  config = Config()
+  config.update({
+    "model": "%s/model" % tempfile.mkdtemp(),
+    "num_inputs": args.input_dim,
+    "num_outputs": args.output_dim,
+    "network": network,
+    "batch_size": args.batch_size,
+    "max_seqs": args.max_seqs,
+    "adam": True,
+    "tf_data_pipeline": pipeline == "tf_data",
+    "tf_data_prefetch": args.prefetch,
+    "feed_dict_num_threads": args.num_threads,
+    "device": args.device,
+  })
+  engine = Engine(config=config)
+  engine.init_train_from_config(config=config, train_data=dataset)
+  batches = dataset.generate_batches(
+    recurrent_net=engine.network.recurrent, batch_size=args.batch_size, max_seqs=args.max_seqs)
+  runner = Runner(engine=engine, dataset=dataset, batches=batches, train=True)
+  runner.run(report_prefix="benchmark %s" % pipeline)
+  assert not runner.run_exception and runner.num_steps
+  engine.finalize()
+  steps_per_sec = runner.num_steps / max(runner.elapsed, 1e-10)
+  print("%s: %i steps, %.3f sec, %.1f steps/sec" % (pipeline, runner.num_steps, runner.elapsed, steps_per_sec))
+  return steps_per_sec
+
+
+def main():
+  """
+  Main entry.
+  """
+  arg_parser = argparse.ArgumentParser(description=__doc__)
+  arg_parser.add_argument("--pipelines", default="feed_dict,tf_data", help="comma-separated")
+  arg_parser.add_argument("--num_seqs", type=int, default=1000)
+  arg_parser.add_argument("--seq_len", type=int, default=200)
+  arg_parser.add_argument("--input_dim", type=int, default=40)
+  arg_parser.add_argument("--output_dim", type=int, default=100)
+  arg_parser.add_argument("--hidden_dim", type=int, default=256)
+  arg_parser.add_argument("--lstm", action="store_true", help="use an LSTM instead of a feed-forward layer")
+  arg_parser.add_argument("--batch_size", type=int, default=5000)
+  arg_parser.add_argument("--max_seqs", type=int, default=40)
+  arg_parser.add_argument("--prefetch", type=int, default=2, help="tf_data_prefetch")
+  arg_parser.add_argument("--num_threads", type=int, default=1, help="feed_dict_num_threads")
+  arg_parser.add_argument("--device", default="cpu")
+  arg_parser.add_argument("--verbosity", type=int, default=3)
+  args = arg_parser.parse_args()
+  log.initialize(verbosity=[args.verbosity])
+  results = {}
+  for pipeline in args.pipelines.split(","):
+    results[pipeline] = benchmark(pipeline=pipeline, args=args)
+  if "feed_dict" in results and "tf_data" in results:
+    print("tf_data / feed_dict speedup: %.2f" % (results["tf_data"] / results["feed_dict"]))
+
+
+if __name__ == "__main__":
+  import better_exchook
+  better_exchook.install()
+  main()
@@ -13,6 +13,7 @@ from Log import log
 import rnn
 import argparse
 import HDFDataset
+import ShardedDataset
 from Dataset import Dataset, init_dataset
 from Config import Config
 
@@ -25,10 +26,19 @@ def hdf_dataset_init(file_name):
   return HDFDataset.HDFDatasetWriter(filename=file_name)
 
 
+def sharded_dataset_init(path, seqs_per_shard=10000):
+  """
+  :param str path: directory of the sharded dataset, which will be created
+  :param int seqs_per_shard:
+  :rtype: ShardedDataset.ShardedDatasetWriter
+  """
+  return ShardedDataset.ShardedDatasetWriter(path=path, seqs_per_shard=seqs_per_shard)
+
+
 def hdf_dump_from_dataset(dataset, hdf_dataset, parser_args):
   """
   :param Dataset dataset: could be any dataset implemented as child of Dataset
-  :type hdf_dataset: HDFDataset.HDFDatasetWriter
+  :type hdf_dataset: HDFDataset.HDFDatasetWriter|ShardedDataset.ShardedDatasetWriter
   :param parser_args: argparse object from main()
   """
   hdf_dataset.dump_from_dataset(
@@ -39,7 +49,7 @@ def hdf_dump_from_dataset(dataset, hdf_dataset, parser_args):
 
 def hdf_close(hdf_dataset):
   """
-  :param HDFDataset.HDFDatasetWriter hdf_dataset: to close
+  :param HDFDataset.HDFDatasetWriter|ShardedDataset.ShardedDatasetWriter hdf_dataset: to close
   """
   hdf_dataset.close()
 
@@ -89,10 +99,16 @@ def main(argv):
   parser = argparse.ArgumentParser(description="Dump dataset or subset of dataset in external HDF dataset")
   parser.add_argument('config_file_or_dataset', type=str,
                       help="Config file for CRNN, or directly the dataset init string")
-  parser.add_argument('hdf_filename', type=str, help="File name of the HDF dataset, which will be created")
+  parser.add_argument(
+    'hdf_filename', type=str,
+    help="File name of the HDF dataset (or directory of the sharded dataset), which will be created")
   parser.add_argument('--start_seq', type=int, default=0, help="Start sequence index of the dataset to dump")
   parser.add_argument('--end_seq', type=int, default=float("inf"), help="End sequence index of the dataset to dump")
   parser.add_argument('--epoch', type=int, default=1, help="Optional start epoch for initialization")
+  parser.add_argument(
+    '--format', choices=["hdf", "sharded"], default="hdf",
+    help="Output format. 'sharded' is for ShardedDataset")
+  parser.add_argument('--seqs_per_shard', type=int, default=10000, help="Only for the sharded format")
 
   args = parser.parse_args(argv[1:])
   crnn_config = None
@@ -102,7 +118,10 @@ def main(argv):
   else:
     dataset_config_str = args.config_file_or_dataset
   dataset = init(config_filename=crnn_config, cmd_line_opts=[], dataset_config_str=dataset_config_str)
-  hdf_dataset = hdf_dataset_init(args.hdf_filename)
+  if args.format == "sharded":
+    hdf_dataset = sharded_dataset_init(args.hdf_filename, seqs_per_shard=args.seqs_per_shard)
+  else:
+    hdf_dataset = hdf_dataset_init(args.hdf_filename)
   hdf_dump_from_dataset(dataset, hdf_dataset, args)
   hdf_close(hdf_dataset)
 